@@ -0,0 +1,110 @@
+"""Micro-batching de requisições concorrentes.
+
+Cada requisição entra numa fila e recebe um ``Future``. Uma thread de trabalho
+pega a primeira requisição disponível e espera até ``max_wait_ms`` por outras,
+até ``max_batch_size``; o lote inteiro é processado numa única chamada (embedding
+e geração em lote). Com uma requisição só, o custo extra é a espera máxima.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class MicroBatchScheduler(Generic[T, R]):
+    """Agrupa itens enviados por várias threads e os processa em lotes.
+
+    ``process_batch`` recebe a lista de itens e devolve um resultado por item,
+    na mesma ordem. Uma exceção é repassada a todos os itens do lote.
+    """
+
+    def __init__(self, process_batch: Callable[[List[T]], List[R]], max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0, name: str = 'micro-batch'):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size deve ser pelo menos 1')
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[Optional[Tuple[T, Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> 'Future[R]':
+        future: 'Future[R]' = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Scheduler encerrado')
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: T, timeout: Optional[float] = None) -> R:
+        """Envia o item e bloqueia até o resultado do seu lote."""
+        return self.submit(item).result(timeout)
+
+    def _next_batch(self) -> Optional[List[Tuple[T, Future]]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Processa o que já chegou; o encerramento vem na próxima volta
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f'process_batch devolveu {len(results)} resultados para {len(items)} itens')
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+    def close(self, timeout: Optional[float] = None):
+        """Processa os itens pendentes e encerra a thread de trabalho."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'max_batch_size_seen': self.max_batch_seen,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queued': self._queue.qsize(),
+        }
@@ -0,0 +1,112 @@
+"""API HTTP do chatbot (Flask).
+
+Cada requisição vira um ``ChatItem`` enviado ao ``MicroBatchScheduler``; as
+threads do Flask só esperam o resultado do seu lote. Índice e modelos são
+carregados uma única vez pelo ``ChatService``. ``/chat/stream`` devolve a
+resposta em Server-Sent Events, pedaço a pedaço, sem passar pelo scheduler.
+"""
+import json
+import time
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+from api.scheduler import MicroBatchScheduler
+from api.service import ChatItem, ChatService
+from llm.model import DECODING_PRESETS, STREAM_DECODERS
+from rag.request import Turn
+
+# Tempo máximo que uma requisição espera pelo seu lote
+REQUEST_TIMEOUT_SECONDS = 120
+
+
+def create_app(service: ChatService, max_batch_size: int = 8, max_wait_ms: float = 5.0) -> Flask:
+    app = Flask(__name__)
+    scheduler = MicroBatchScheduler(service.answer_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    app.extensions['chat_scheduler'] = scheduler
+
+    def parse_chat():
+        data = request.get_json(silent=True) or {}
+        question = data.get('question')
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError('Campo "question" obrigatório')
+        try:
+            history = [Turn(str(t['user']), str(t['bot'])) for t in data.get('history') or []]
+        except (KeyError, TypeError):
+            raise ValueError('Campo "history" deve ser uma lista de {"user", "bot"}')
+        session_id = data.get('session_id')
+        if session_id is not None and not isinstance(session_id, str):
+            raise ValueError('Campo "session_id" deve ser texto')
+        budget_ms = data.get('budget_ms')
+        if budget_ms is not None and (isinstance(budget_ms, bool) or not isinstance(budget_ms, (int, float))
+                                      or budget_ms <= 0):
+            raise ValueError('Campo "budget_ms" deve ser um número positivo')
+        return question, history, data, budget_ms
+
+    @app.post('/chat')
+    def chat():
+        try:
+            question, history, data, budget_ms = parse_chat()
+            decoding = data.get('decoding')
+            # Validado aqui: um decodificador inválido derrubaria o lote inteiro
+            if decoding is not None and decoding not in DECODING_PRESETS:
+                raise ValueError(f'Campo "decoding" deve ser um de {list(DECODING_PRESETS)}')
+            if decoding is not None and data.get('session_id') is not None and decoding not in STREAM_DECODERS:
+                raise ValueError(f'Com "session_id", "decoding" deve ser um de {list(STREAM_DECODERS)}')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        start = time.perf_counter()
+        # O prazo começa a contar na chegada, antes da fila do scheduler
+        item = ChatItem(question, history, data.get('session_id'), service.deadline(budget_ms), decoding)
+        try:
+            result = scheduler(item, timeout=REQUEST_TIMEOUT_SECONDS)
+        except TimeoutError:
+            return jsonify({'error': f'Sem resposta em {REQUEST_TIMEOUT_SECONDS}s'}), 504
+        except Exception as e:
+            # Falha no lote (busca ou geração): o erro vale para todos os itens dele
+            print(f"Erro ao responder: {e}")
+            return jsonify({'error': 'Erro interno ao gerar a resposta'}), 500
+        return jsonify({
+            'answer': result.answer,
+            'in_scope': result.in_scope,
+            'chunk_ids': list(result.chunk_ids),
+            'timed_out': result.timed_out,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+        })
+
+    @app.post('/chat/stream')
+    def chat_stream():
+        try:
+            question, history, data, budget_ms = parse_chat()
+            chat_request, in_scope, stream = service.stream(question, history,
+                                                            decoding=data.get('decoding'),
+                                                            session_id=data.get('session_id'), budget_ms=budget_ms)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def events():
+            for piece in stream:
+                yield f"data: {json.dumps({'text': piece}, ensure_ascii=False)}\n\n"
+            done = dict(stream.stats(), in_scope=in_scope, chunk_ids=list(chat_request.chunk_ids))
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+        return Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.get('/health')
+    def health():
+        return jsonify({'status': 'ok'})
+
+    @app.get('/stats')
+    def stats():
+        llm = service.llm
+        return jsonify({
+            'scheduler': scheduler.stats(),
+            'answer_cache': llm.answer_cache.stats() if llm.answer_cache else None,
+            'semantic_cache': llm.semantic_cache.stats() if llm.semantic_cache else None,
+            'session_cache': llm.session_cache.stats() if llm.session_cache else None,
+            # Sem forçar o carregamento do modelo só para as estatísticas
+            'prefix_cache': llm.prefix_cache.stats() if llm.loaded and llm.prefix_cache else None,
+        })
+
+    return app
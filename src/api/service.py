@@ -0,0 +1,152 @@
+"""Pipeline de uma rodada de chat: escopo, recuperação e geração.
+
+Compartilhado pela CLI (``main.py``) e pela API HTTP (``server.py``). Trabalha
+em lotes: as perguntas de um lote são embedadas, buscadas e geradas juntas.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from llm.answer_cache import AnswerCache
+from llm.model import DEFAULT_DECODING, HuggingFaceLLM
+from llm.semantic_cache import SemanticAnswerCache
+from llm.session_cache import SessionKVCache
+from llm.streaming import TokenStream
+from rag.request import RAGRequest, Turn
+from rag.retriever import Retriever
+from utils.deadline import Deadline
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'dsm_material.txt')
+
+
+@dataclass
+class ChatItem:
+    question: str
+    history: List[Turn] = field(default_factory=list)
+    # Com sessão o histórico inteiro vai para o LLM, que reaproveita o KV cache
+    session_id: Optional[str] = None
+    # Prazo criado na chegada do pedido: a espera na fila também conta
+    deadline: Optional[Deadline] = None
+    # Uma das DECODING_PRESETS do LLM; None usa a padrão
+    decoding: Optional[str] = None
+
+
+@dataclass
+class ChatResult:
+    answer: str
+    in_scope: bool
+    chunk_ids: Tuple[int, ...] = ()
+    # O prazo do pedido acabou antes da resposta ficar pronta
+    timed_out: bool = False
+
+
+class ChatService:
+    def __init__(self, retriever: Retriever, llm: HuggingFaceLLM, top_k: int = 3, max_history: int = 3,
+                 budget_ms: Optional[float] = None):
+        self.retriever = retriever
+        self.llm = llm
+        self.top_k = top_k
+        self.max_history = max_history
+        # Orçamento de latência de ponta a ponta dos pedidos que não informam outro
+        self.budget_ms = budget_ms
+
+    @classmethod
+    def create(cls, data_path: str = DATA_PATH, model_name: str = "microsoft/DialoGPT-small",
+               precision: str = "float32", budget_ms: Optional[float] = None,
+               decoding: str = DEFAULT_DECODING, **retriever_kwargs) -> 'ChatService':
+        """Carrega índice e modelos uma única vez, com os caches de respostas."""
+        start = time.perf_counter()
+        # O modelo de linguagem carrega em segundo plano enquanto o índice é aberto
+        llm = HuggingFaceLLM(model_name=model_name, precision=precision, decoding=decoding)
+        llm.preload()
+
+        retriever = Retriever(**retriever_kwargs)
+        retriever.build_index_if_needed(data_path)
+        retriever.preload()
+        # Respostas repetidas saem do cache; entradas de índices anteriores são descartadas
+        llm.answer_cache = AnswerCache(os.path.join(retriever.cache_dir, 'answers.sqlite'),
+                                       fingerprint=retriever.fingerprint)
+        llm.semantic_cache = SemanticAnswerCache()
+        llm.session_cache = SessionKVCache()
+        print(f"Pronto em {time.perf_counter() - start:.1f}s")
+        return cls(retriever, llm, budget_ms=budget_ms)
+
+    def deadline(self, budget_ms: Optional[float] = None) -> Deadline:
+        """Prazo de um pedido que chega agora; sem ``budget_ms`` usa ``self.budget_ms``."""
+        return Deadline.from_ms(self.budget_ms if budget_ms is None else budget_ms)
+
+    def answer(self, question: str, history: Optional[List[Turn]] = None, session_id: Optional[str] = None,
+               budget_ms: Optional[float] = None, decoding: Optional[str] = None) -> ChatResult:
+        item = ChatItem(question, list(history or []), session_id, self.deadline(budget_ms), decoding)
+        return self.answer_batch([item])[0]
+
+    def answer_batch(self, items: List[ChatItem]) -> List[ChatResult]:
+        """Responde um lote de perguntas independentes."""
+        if not items:
+            return []
+        requests, in_scope, embeddings = self.prepare_batch(items)
+        # Um lote por decodificador; perguntas de sessões dependem do KV cache
+        # da sessão e são geradas uma a uma
+        groups: Dict[Optional[str], List[int]] = {}
+        for i, item in enumerate(items):
+            if item.session_id is None:
+                groups.setdefault(item.decoding, []).append(i)
+        answers = [''] * len(items)
+        for decoding, rows in groups.items():
+            batch = self.llm.generate_batch([requests[i] for i in rows], in_scope=[in_scope[i] for i in rows],
+                                            embeddings=embeddings[rows], decoding=decoding)
+            for i, answer in zip(rows, batch):
+                answers[i] = answer
+        for i, item in enumerate(items):
+            if item.session_id is not None:
+                answers[i] = self.llm.generate(requests[i], in_scope=in_scope[i], embedding=embeddings[i],
+                                               session_id=item.session_id, decoding=item.decoding)
+        return [ChatResult(answer, ok, request.chunk_ids, request.timed_out)
+                for answer, ok, request in zip(answers, in_scope, requests)]
+
+    def stream(self, question: str, history: Optional[List[Turn]] = None, decoding: Optional[str] = None,
+               session_id: Optional[str] = None,
+               budget_ms: Optional[float] = None) -> Tuple[RAGRequest, bool, TokenStream]:
+        """Prepara a pergunta e devolve a resposta em streaming (``TokenStream``)."""
+        item = ChatItem(question, list(history or []), session_id, self.deadline(budget_ms))
+        requests, in_scope, embeddings = self.prepare_batch([item])
+        stream = self.llm.generate_stream(requests[0], in_scope=in_scope[0], embedding=embeddings[0],
+                                          decoding=decoding, session_id=session_id)
+        return requests[0], in_scope[0], stream
+
+    def prepare_batch(self, items: List[ChatItem]) -> Tuple[List[RAGRequest], List[bool], np.ndarray]:
+        """Embeddings, escopo e chunks de um lote de perguntas.
+
+        Escopo antes da recuperação: palavras-chave ou similaridade com os
+        tópicos do corpus, usando o mesmo embedding que vai para a busca.
+        Perguntas fora do escopo não consultam o índice. O prazo de cada item
+        segue no ``RAGRequest`` até a geração.
+        """
+        embeddings = self.retriever.embed_queries([item.question for item in items])
+        in_scope = [bool(self.llm.is_dsm_question(item.question) or self.retriever.in_scope(emb)[0])
+                    for item, emb in zip(items, embeddings)]
+
+        rows = [i for i, ok in enumerate(in_scope) if ok]
+        chunks: List[list] = [[] for _ in items]
+        if rows:
+            found = self.retriever.retrieve_chunks_batch([items[i].question for i in rows], top_k=self.top_k,
+                                                         embeddings=embeddings[rows])
+            for i, retrieved in zip(rows, found):
+                chunks[i] = retrieved
+
+        requests = [
+            RAGRequest(question=item.question, chunks=retrieved, history=self._history(item),
+                       deadline=item.deadline or self.deadline())
+            for item, retrieved in zip(items, chunks)
+        ]
+        return requests, in_scope, embeddings
+
+    def _history(self, item: ChatItem) -> List[Turn]:
+        # Sessões levam o histórico completo: o LLM decide quando descartar
+        # turnos antigos sem invalidar o KV cache a cada mensagem
+        if item.session_id is not None:
+            return list(item.history)
+        return item.history[-self.max_history:] if self.max_history else []
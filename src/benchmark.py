@@ -0,0 +1,456 @@
+"""Benchmarks de desempenho do chatbot.
+
+Uso:
+    python src/benchmark.py index [--k 10] [--synthetic 100000]
+    python src/benchmark.py retrieval [--k 3] [--repeat 5]
+    python src/benchmark.py precision [--k 3] [--index-type flat]
+    python src/benchmark.py backend [--k 3] [--synthetic 100000]
+    python src/benchmark.py startup
+    python src/benchmark.py inference [--new-tokens 32] [--repeat 3]
+    python src/benchmark.py batch [--batch-size 8] [--new-tokens 50]
+    python src/benchmark.py prefill [--prefix "Sobre mobile:"] [--repeat 20]
+    python src/benchmark.py decoding [--new-tokens 100] [--repeat 3]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'dsm_material.txt')
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Dependências pesadas que os módulos do projeto só devem importar sob demanda
+HEAVY_MODULES = ('torch', 'transformers', 'sentence_transformers', 'faiss')
+
+EVAL_QUESTIONS = [
+    "Qual a diferença entre React Native e Flutter?",
+    "Como otimizar performance em React Native?",
+    "Como fazer testes em aplicações mobile?",
+    "Como implementar Clean Architecture no Flutter?",
+    "Qual a diferença entre MVC e MVVM?",
+    "Como configurar CI/CD com Fastlane?",
+    "Como usar Detox para testes E2E?",
+    "Quando usar Ionic ao invés de frameworks nativos?",
+    "Como publicar um app na App Store?",
+    "O que é CodePush?",
+]
+
+
+def percentile_ms(samples, q: float) -> float:
+    return float(np.percentile(np.asarray(samples) * 1000.0, q))
+
+
+def time_single_queries(search, queries: np.ndarray, k: int):
+    """Executa uma busca por consulta, retornando latências (s) e ids."""
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = search(q[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    return latencies, np.stack(results)
+
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray) -> float:
+    hits = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(approx, exact))
+    return hits / float(exact.size)
+
+
+def load_corpus_vectors(args):
+    """Embeddings do material DSM (ou sintéticos) e as consultas de avaliação."""
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        base = rng.standard_normal((args.synthetic, args.dim)).astype('float32')
+        base /= np.linalg.norm(base, axis=1, keepdims=True)
+        queries = base[rng.choice(len(base), args.queries, replace=False)]
+        queries = queries + 0.01 * rng.standard_normal(queries.shape).astype('float32')
+        return base, np.ascontiguousarray(queries, dtype='float32')
+
+    from rag.retriever import Retriever
+    retriever = Retriever(query_cache_bytes=0)
+    retriever.build_index_if_needed(args.data)
+    live = retriever.chunks.live_rows()
+    return np.ascontiguousarray(retriever.embeddings[live], dtype='float32'), retriever.embed_queries(EVAL_QUESTIONS)
+
+
+def bench_index(args):
+    from rag.index_factory import INDEX_TYPES, build_index, index_nbytes
+
+    base, queries = load_corpus_vectors(args)
+    ids = np.arange(len(base), dtype='int64')
+    k = min(args.k, len(base))
+    print(f'Corpus: {len(base)} vetores de dimensão {base.shape[1]}, {len(queries)} consultas, k={k}\n')
+
+    exact_results = None
+    print(f"{'índice':<10} {'build (s)':>10} {'recall@k':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'memória':>10}")
+    for index_type in ['flat'] + [t for t in INDEX_TYPES if t != 'flat']:
+        params = {
+            'flat': {},
+            'ivf_flat': {'nlist': args.nlist, 'nprobe': args.nprobe},
+            'hnsw': {'M': args.M, 'ef_search': args.ef_search},
+            'ivf_pq': {'nlist': args.nlist, 'nprobe': args.nprobe, 'pq_m': args.pq_m},
+        }[index_type]
+        start = time.perf_counter()
+        index = build_index(base, ids, index_type, params)
+        build_s = time.perf_counter() - start
+
+        latencies, results = time_single_queries(index.search, queries, k)
+        if exact_results is None:
+            exact_results = results
+        print(f'{index_type:<10} {build_s:>10.2f} {recall_at_k(results, exact_results):>9.3f} '
+              f'{percentile_ms(latencies, 50):>9.3f} {percentile_ms(latencies, 99):>9.3f} '
+              f'{index_nbytes(index) / 1024 / 1024:>8.2f}MB')
+
+
+def bench_precision(args):
+    from rag.index_factory import PRECISIONS, build_index, index_nbytes, storage_dtype
+
+    base, queries = load_corpus_vectors(args)
+    ids = np.arange(len(base), dtype='int64')
+    k = min(args.k, len(base))
+    print(f'Corpus: {len(base)} vetores de dimensão {base.shape[1]}, {len(queries)} consultas, '
+          f'k={k}, índice {args.index_type}\n')
+
+    reference = None
+    reference_bytes = None
+    print(f"{'precisão':<9} {'embeddings':>11} {'índice':>10} {'economia':>9} {'concordância top-k':>19}")
+    for precision in PRECISIONS:
+        stored = base.astype(storage_dtype(precision))
+        index = build_index(stored.astype('float32'), ids, args.index_type, None, precision)
+        _, results = index.search(queries, k)
+        if reference is None:
+            reference = results
+            reference_bytes = stored.nbytes + index_nbytes(index)
+        total = stored.nbytes + index_nbytes(index)
+        print(f'{precision:<9} {stored.nbytes / 1024 / 1024:>9.2f}MB {index_nbytes(index) / 1024 / 1024:>8.2f}MB '
+              f'{100.0 * (1 - total / reference_bytes):>8.1f}% {recall_at_k(results, reference):>19.3f}')
+
+
+def bench_backend(args):
+    from rag.vector_store import VECTOR_BACKENDS, build_vector_store
+
+    base, queries = load_corpus_vectors(args)
+    ids = np.arange(len(base), dtype='int64')
+    k = min(args.k, len(base))
+    print(f'Corpus: {len(base)} vetores de dimensão {base.shape[1]}, {len(queries)} consultas, k={k}\n')
+
+    reference = None
+    print(f"{'backend':<8} {'build (s)':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'lote (ms/consulta)':>19} "
+          f"{'concordância':>13}")
+    for backend in VECTOR_BACKENDS:
+        start = time.perf_counter()
+        store = build_vector_store(backend, base, ids)
+        build_s = time.perf_counter() - start
+
+        latencies, results = time_single_queries(store.search, queries, k)
+        start = time.perf_counter()
+        store.search(queries, k)
+        batch_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+        if reference is None:
+            reference = results
+        print(f'{backend:<8} {build_s:>10.2f} {percentile_ms(latencies, 50):>9.3f} '
+              f'{percentile_ms(latencies, 99):>9.3f} {batch_ms:>19.3f} {recall_at_k(results, reference):>13.3f}')
+
+
+def import_seconds(module: str) -> tuple:
+    """Importa ``module`` num interpretador novo; retorna (segundos, módulos pesados carregados)."""
+    code = (
+        'import sys, time; sys.path.insert(0, sys.argv[1]); start = time.perf_counter(); '
+        f'import {module}; elapsed = time.perf_counter() - start; '
+        f'print(elapsed, *[m for m in {HEAVY_MODULES!r} if m in sys.modules])'
+    )
+    out = subprocess.run([sys.executable, '-c', code, SRC_DIR], capture_output=True, text=True, check=True)
+    fields = out.stdout.split()
+    return float(fields[0]), fields[1:]
+
+
+def bench_startup(args):
+    print(f"{'import':<24} {'tempo (s)':>10}  módulos pesados carregados")
+    for module in ('rag.retriever', 'llm.model') + HEAVY_MODULES:
+        seconds, heavy = import_seconds(module)
+        print(f"{module:<24} {seconds:>10.3f}  {', '.join(heavy) or '-'}")
+
+    from rag.retriever import Retriever
+    from llm.model import HuggingFaceLLM
+
+    print(f"\n{'etapa':<34} {'tempo (s)':>10}")
+    start = time.perf_counter()
+    retriever = Retriever(query_cache_bytes=0)
+    llm = HuggingFaceLLM()
+    print(f"{'construir Retriever + LLM':<34} {time.perf_counter() - start:>10.3f}")
+    start = time.perf_counter()
+    retriever.build_index_if_needed(args.data)
+    print(f"{'abrir/construir índice':<34} {time.perf_counter() - start:>10.3f}")
+    start = time.perf_counter()
+    retriever.retrieve(EVAL_QUESTIONS[0], mode='lexical')
+    print(f"{'primeira consulta léxica':<34} {time.perf_counter() - start:>10.3f}")
+    start = time.perf_counter()
+    retriever.retrieve(EVAL_QUESTIONS[0], mode='dense')
+    print(f"{'primeira consulta densa (embedder)':<34} {time.perf_counter() - start:>10.3f}")
+    start = time.perf_counter()
+    llm.preload(background=False)
+    print(f"{'carregar modelo de linguagem':<34} {time.perf_counter() - start:>10.3f}")
+
+
+def bench_inference(args):
+    import torch
+    from llm.model import HuggingFaceLLM
+    from rag.retriever import Retriever
+    from utils.inference import INFERENCE_PRECISIONS, bf16_supported
+
+    precisions = [p for p in INFERENCE_PRECISIONS if p != 'bfloat16' or bf16_supported()]
+    retriever = Retriever(embed_model_name=args.embed_model, query_cache_bytes=0)
+    retriever.build_index_if_needed(args.data)
+    prompts = [f'Usuário: {q}\nBot:' for q in EVAL_QUESTIONS]
+
+    print(f'Modelo de linguagem: {args.model}, {len(prompts)} prompts, {args.new_tokens} tokens gulosos cada\n')
+    print(f"{'precisão':<9} {'carga (s)':>10} {'tokens/s':>9} {'respostas iguais':>17} {'tokens iguais':>14}")
+    reference = None
+    for precision in precisions:
+        llm = HuggingFaceLLM(model_name=args.model, precision=precision)
+        start = time.perf_counter()
+        llm.preload(background=False)
+        load_s = time.perf_counter() - start
+        outputs, elapsed = [], 0.0
+        for prompt in prompts:
+            inputs = llm.tokenizer(prompt, return_tensors='pt')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                with torch.no_grad():
+                    out = llm.model.generate(**inputs, do_sample=False, max_new_tokens=args.new_tokens,
+                                             min_new_tokens=args.new_tokens,
+                                             pad_token_id=llm.tokenizer.eos_token_id)
+                elapsed += time.perf_counter() - start
+            outputs.append(out[0, inputs['input_ids'].shape[1]:].tolist())
+        if reference is None:
+            reference = outputs
+        same = np.mean([o == ref for o, ref in zip(outputs, reference)])
+        same_tokens = np.mean([np.mean([a == b for a, b in zip(o, ref)]) for o, ref in zip(outputs, reference)])
+        tokens_s = len(prompts) * args.repeat * args.new_tokens / elapsed
+        print(f'{precision:<9} {load_s:>10.2f} {tokens_s:>9.1f} {same:>17.2f} {same_tokens:>14.2f}')
+
+    k = min(3, retriever.index.ntotal)  # type: ignore
+    texts = [retriever.chunks.text(int(i)) for i in retriever.chunks.live_rows()[:256]]  # type: ignore
+    print(f'\nEmbedder: {retriever.embed_model_name}, {len(texts)} chunks, concordância top-{k} das perguntas\n')
+    print(f"{'precisão':<9} {'carga (s)':>10} {'chunks/s':>9} {'cosseno médio':>14} {'concordância':>13}")
+    reference = None
+    for precision in precisions:
+        embedder = Retriever(embed_model_name=retriever.embed_model_name, cache_dir=retriever.cache_dir,
+                             query_cache_bytes=0, inference_precision=precision)
+        start = time.perf_counter()
+        embedder.preload(background=False)
+        load_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            embs = embedder.embed_queries(texts)
+        chunks_s = len(texts) * args.repeat / (time.perf_counter() - start)
+        _, found = retriever.index.search(embedder.embed_queries(EVAL_QUESTIONS), k)  # type: ignore
+        if reference is None:
+            reference = (embs, found)
+        cosine = np.mean(np.sum(embs * reference[0], axis=1) /
+                         (np.linalg.norm(embs, axis=1) * np.linalg.norm(reference[0], axis=1)))
+        print(f'{precision:<9} {load_s:>10.2f} {chunks_s:>9.1f} {cosine:>14.4f} '
+              f'{recall_at_k(found, reference[1]):>13.3f}')
+
+
+def bench_batch(args):
+    from llm.model import HuggingFaceLLM
+    from rag.request import RAGRequest
+    from rag.retriever import Retriever
+
+    retriever = Retriever()
+    retriever.build_index_if_needed(args.data)
+    llm = HuggingFaceLLM(model_name=args.model)
+    llm.preload(background=False)
+    questions = (EVAL_QUESTIONS * args.batch_size)[:args.batch_size]
+    requests = [RAGRequest(q, chunks) for q, chunks in zip(questions, retriever.retrieve_chunks_batch(questions))]
+    llm.generate_batch(requests[:1], max_length=args.new_tokens)  # aquecimento
+
+    print(f'{len(requests)} perguntas, até {args.new_tokens} tokens novos cada\n')
+    print(f"{'modo':<12} {'total (s)':>10} {'perguntas/s':>12}")
+    start = time.perf_counter()
+    for request in requests:
+        llm.generate(request, max_length=args.new_tokens, in_scope=True)
+    sequential = time.perf_counter() - start
+    print(f"{'sequencial':<12} {sequential:>10.2f} {len(requests) / sequential:>12.2f}")
+    start = time.perf_counter()
+    llm.generate_batch(requests, max_length=args.new_tokens, in_scope=[True] * len(requests))
+    batched = time.perf_counter() - start
+    print(f"{'lote':<12} {batched:>10.2f} {len(requests) / batched:>12.2f}")
+
+
+def bench_prefill(args):
+    import torch
+    from llm.model import HuggingFaceLLM
+    from llm.prefix_cache import STATIC_PREFIXES
+    from rag.request import RAGRequest
+    from rag.retriever import Retriever
+
+    retriever = Retriever()
+    retriever.build_index_if_needed(args.data)
+    llm = HuggingFaceLLM(model_name=args.model, static_prefixes=args.prefix or STATIC_PREFIXES)
+    llm.preload(background=False)
+    chunks = retriever.retrieve_chunks_batch(EVAL_QUESTIONS)
+    requests = [RAGRequest(q, c) for q, c in zip(EVAL_QUESTIONS, chunks)]
+    prompts = [llm.tokenizer(llm._conversation(r), truncation=True, max_length=400)['input_ids'] for r in requests]
+    device = torch.device(llm.device)
+
+    def prefill(ids, seeded: bool) -> float:
+        start = time.perf_counter()
+        past, length = llm.prefix_cache.seed(ids) if seeded else (None, 0)
+        with torch.no_grad():
+            llm.model(input_ids=torch.tensor([ids[length:]], device=device), past_key_values=past, use_cache=True)
+        return time.perf_counter() - start
+
+    for ids in prompts:  # aquecimento
+        prefill(ids, False)
+        prefill(ids, True)
+
+    prefixes = [llm.tokenizer.decode(ids) for ids in llm.prefix_cache.prefixes]
+    print(f'Modelo: {args.model}, prefixos {prefixes}, {len(prompts)} prompts x {args.repeat} repetições\n')
+    print(f"{'tokens':>7} {'prefixo':>8} {'completo (ms)':>14} {'com prefixo (ms)':>17} {'economia':>9}")
+    total_full = total_seeded = 0.0
+    for ids in sorted(prompts, key=len):
+        full = [prefill(ids, False) for _ in range(args.repeat)]
+        seeded = [prefill(ids, True) for _ in range(args.repeat)]
+        full_ms, seeded_ms = percentile_ms(full, 50), percentile_ms(seeded, 50)
+        total_full += full_ms
+        total_seeded += seeded_ms
+        print(f'{len(ids):>7} {llm.prefix_cache.match(ids):>8} {full_ms:>14.2f} {seeded_ms:>17.2f} '
+              f'{1 - seeded_ms / full_ms:>9.1%}')
+    print(f"{'média':>7} {'':>8} {total_full / len(prompts):>14.2f} {total_seeded / len(prompts):>17.2f} "
+          f'{1 - total_seeded / total_full:>9.1%}')
+
+
+def bench_decoding(args):
+    from llm.model import DECODING_PRESETS, HuggingFaceLLM
+    from rag.request import RAGRequest
+    from rag.retriever import Retriever
+
+    retriever = Retriever()
+    retriever.build_index_if_needed(args.data)
+    llm = HuggingFaceLLM(model_name=args.model, seed=0)
+    llm.preload(background=False)
+    chunks = retriever.retrieve_chunks_batch(EVAL_QUESTIONS)
+    requests = [RAGRequest(q, c) for q, c in zip(EVAL_QUESTIONS, chunks)]
+
+    print(f'Modelo: {args.model}, {len(requests)} perguntas x {args.repeat} repetições, '
+          f'até {args.new_tokens} tokens novos\n')
+    print(f"{'decodificação':<13} {'p50 (ms)':>9} {'p99 (ms)':>9} {'válidas':>8}")
+    for name, params in DECODING_PRESETS.items():
+        llm._try_dialogpt_generation(requests[:1], args.new_tokens, params)  # aquecimento
+        latencies, responses = [], []
+        for _ in range(args.repeat):
+            for request in requests:
+                start = time.perf_counter()
+                responses.append(llm._try_dialogpt_generation([request], args.new_tokens, params)[0])
+                latencies.append(time.perf_counter() - start)
+        valid = np.mean([bool(r) and llm._is_valid_response(r) for r in responses])
+        print(f'{name:<13} {percentile_ms(latencies, 50):>9.1f} {percentile_ms(latencies, 99):>9.1f} {valid:>8.2f}')
+
+
+def bench_retrieval(args):
+    from rag.retriever import RETRIEVAL_MODES, Retriever
+
+    # Sem cache de consultas: cada chamada paga o custo real do embedder
+    retriever = Retriever(query_cache_bytes=0)
+    retriever.build_index_if_needed(args.data)
+    retriever.retrieve_batch(EVAL_QUESTIONS, top_k=args.k, mode='hybrid')  # aquecimento
+
+    print(f'{len(EVAL_QUESTIONS)} perguntas x {args.repeat} repetições, k={args.k}\n')
+    print(f"{'modo':<10} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for mode in RETRIEVAL_MODES:
+        latencies = []
+        for _ in range(args.repeat):
+            for question in EVAL_QUESTIONS:
+                start = time.perf_counter()
+                retriever.retrieve(question, top_k=args.k, mode=mode)
+                latencies.append(time.perf_counter() - start)
+        print(f'{mode:<10} {percentile_ms(latencies, 50):>9.3f} {percentile_ms(latencies, 99):>9.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks do DSM Chatbot')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_index = sub.add_parser('index', help='recall@k, latência e memória por tipo de índice')
+    p_index.add_argument('--data', default=DATA_PATH)
+    p_index.add_argument('--k', type=int, default=10)
+    p_index.add_argument('--synthetic', type=int, default=0,
+                         help='usar N vetores aleatórios em vez do material DSM')
+    p_index.add_argument('--dim', type=int, default=384)
+    p_index.add_argument('--queries', type=int, default=200)
+    p_index.add_argument('--nlist', type=int, default=None)
+    p_index.add_argument('--nprobe', type=int, default=8)
+    p_index.add_argument('--M', type=int, default=32)
+    p_index.add_argument('--ef-search', type=int, default=64)
+    p_index.add_argument('--pq-m', type=int, default=16)
+    p_index.set_defaults(func=bench_index)
+
+    p_retrieval = sub.add_parser('retrieval', help='latência por modo de recuperação (dense, lexical, hybrid)')
+    p_retrieval.add_argument('--data', default=DATA_PATH)
+    p_retrieval.add_argument('--k', type=int, default=3)
+    p_retrieval.add_argument('--repeat', type=int, default=5)
+    p_retrieval.set_defaults(func=bench_retrieval)
+
+    p_precision = sub.add_parser('precision', help='memória e concordância top-k de float16/int8 vs float32')
+    p_precision.add_argument('--data', default=DATA_PATH)
+    p_precision.add_argument('--k', type=int, default=3)
+    p_precision.add_argument('--index-type', default='flat')
+    p_precision.add_argument('--synthetic', type=int, default=0,
+                             help='usar N vetores aleatórios em vez do material DSM')
+    p_precision.add_argument('--dim', type=int, default=384)
+    p_precision.add_argument('--queries', type=int, default=200)
+    p_precision.set_defaults(func=bench_precision)
+
+    p_backend = sub.add_parser('backend', help='latência e concordância dos backends faiss e numpy (flat)')
+    p_backend.add_argument('--data', default=DATA_PATH)
+    p_backend.add_argument('--k', type=int, default=3)
+    p_backend.add_argument('--synthetic', type=int, default=0,
+                           help='usar N vetores aleatórios em vez do material DSM')
+    p_backend.add_argument('--dim', type=int, default=384)
+    p_backend.add_argument('--queries', type=int, default=200)
+    p_backend.set_defaults(func=bench_backend)
+
+    p_startup = sub.add_parser('startup', help='tempo de import dos módulos e de cada etapa da inicialização')
+    p_startup.add_argument('--data', default=DATA_PATH)
+    p_startup.set_defaults(func=bench_startup)
+
+    p_inference = sub.add_parser('inference', help='tokens/s e concordância de int8/bfloat16 vs float32 nos modelos')
+    p_inference.add_argument('--data', default=DATA_PATH)
+    p_inference.add_argument('--model', default='microsoft/DialoGPT-small')
+    p_inference.add_argument('--embed-model', default='sentence-transformers/all-MiniLM-L6-v2')
+    p_inference.add_argument('--new-tokens', type=int, default=32)
+    p_inference.add_argument('--repeat', type=int, default=3)
+    p_inference.set_defaults(func=bench_inference)
+
+    p_batch = sub.add_parser('batch', help='perguntas/s de generate_batch vs chamadas sequenciais de generate')
+    p_batch.add_argument('--data', default=DATA_PATH)
+    p_batch.add_argument('--model', default='microsoft/DialoGPT-small')
+    p_batch.add_argument('--batch-size', type=int, default=8)
+    p_batch.add_argument('--new-tokens', type=int, default=50)
+    p_batch.set_defaults(func=bench_batch)
+
+    p_prefill = sub.add_parser('prefill', help='tempo de prefill com e sem o KV cache dos prefixos fixos')
+    p_prefill.add_argument('--data', default=DATA_PATH)
+    p_prefill.add_argument('--model', default='microsoft/DialoGPT-small')
+    p_prefill.add_argument('--prefix', action='append', help='prefixo fixo (repetível); padrão: STATIC_PREFIXES')
+    p_prefill.add_argument('--repeat', type=int, default=20)
+    p_prefill.set_defaults(func=bench_prefill)
+
+    p_decoding = sub.add_parser('decoding', help='latência p50/p99 e respostas válidas por estratégia de decodificação')
+    p_decoding.add_argument('--data', default=DATA_PATH)
+    p_decoding.add_argument('--model', default='microsoft/DialoGPT-small')
+    p_decoding.add_argument('--new-tokens', type=int, default=100)
+    p_decoding.add_argument('--repeat', type=int, default=3)
+    p_decoding.set_defaults(func=bench_decoding)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
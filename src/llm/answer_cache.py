@@ -0,0 +1,173 @@
+"""Cache de respostas do LLM em dois níveis: LRU em memória e SQLite em disco.
+
+A chave combina a pergunta normalizada, os ids dos chunks recuperados, o
+modelo e os parâmetros de geração. Cada entrada guarda a impressão digital do
+índice (manifesto); quando o índice é reconstruído as entradas antigas são
+descartadas, pois os ids de chunk passam a apontar para outros textos.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from rag.embedding_cache import normalize_query
+from rag.request import RAGRequest
+
+
+def _digest(data) -> str:
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def generation_key(model_name: str, params: dict) -> str:
+    """Identifica o modelo e os parâmetros de geração."""
+    return _digest([model_name, params])
+
+
+def answer_key(request: RAGRequest, model_name: str, params: dict) -> str:
+    """Chave da resposta; chunks sem id (vindos de prompt em texto) entram pelo texto."""
+    chunks = [c.id if c.id >= 0 else c.text for c in request.chunks]
+    return _digest([normalize_query(request.question), chunks, model_name, params])
+
+
+class AnswerCache:
+    """Respostas geradas, com TTL e limite de entradas em cada nível.
+
+    ``db_path`` None mantém só o nível em memória. As entradas em disco
+    sobrevivem a reinícios enquanto ``fingerprint`` for o mesmo.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, fingerprint: str = '',
+                 max_entries: int = 1024, max_disk_entries: int = 100_000,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # Linhas na tabela, mantido a cada escrita para não contar a tabela toda
+        self._disk_entries = 0
+        if db_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS answers ('
+                'key TEXT PRIMARY KEY, answer TEXT NOT NULL, fingerprint TEXT NOT NULL, '
+                'created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)')
+            self._db.commit()
+        self.fingerprint = ''
+        self.set_fingerprint(fingerprint)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set_fingerprint(self, fingerprint: str):
+        """Troca o índice de referência, descartando respostas de outros índices."""
+        with self._lock:
+            self.fingerprint = fingerprint
+            self._items.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM answers WHERE fingerprint != ?', (fingerprint,))
+                self._db.commit()
+                self._disk_entries = self._db.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and not self._expired(item[1], now):
+                self._items.move_to_end(key)
+                self.memory_hits += 1
+                return item[0]
+            self._items.pop(key, None)
+
+            row = None
+            if self._db is not None:
+                row = self._db.execute('SELECT answer, created FROM answers WHERE key = ? AND fingerprint = ?',
+                                       (key, self.fingerprint)).fetchone()
+                if row is not None and self._expired(row[1], now):
+                    self._db.execute('DELETE FROM answers WHERE key = ?', (key,))
+                    self._db.commit()
+                    self._disk_entries -= 1
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE answers SET accessed = ? WHERE key = ?', (now, key))  # type: ignore
+            self._db.commit()  # type: ignore
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, key: str, answer: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, answer, now)
+            if self._db is None:
+                return
+            exists = self._db.execute('SELECT 1 FROM answers WHERE key = ?', (key,)).fetchone() is not None
+            self._db.execute('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)',
+                             (key, answer, self.fingerprint, now, now))
+            if not exists:
+                self._disk_entries += 1
+            excess = self._disk_entries - self.max_disk_entries
+            if excess > 0:
+                # Remove as respostas acessadas há mais tempo
+                deleted = self._db.execute('DELETE FROM answers WHERE key IN '
+                                           '(SELECT key FROM answers ORDER BY accessed LIMIT ?)', (excess,)).rowcount
+                self._disk_entries -= deleted
+                self.evictions += deleted
+            self._db.commit()
+
+    def _remember(self, key: str, answer: str, created: float):
+        self._items.pop(key, None)
+        self._items[key] = (answer, created)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM answers')
+                self._db.commit()
+                self._disk_entries = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'entries': len(self._items),
+            'max_entries': self.max_entries,
+            'disk_entries': self._disk_entries,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
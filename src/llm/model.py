@@ -1,74 +1,483 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import os
 import re
-from typing import List, Optional
+import threading
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+from llm.answer_cache import AnswerCache, answer_key, generation_key
+from llm.prefix_cache import STATIC_PREFIXES, StaticPrefixCache
+from llm.semantic_cache import SemanticAnswerCache
+from llm.session_cache import SessionEntry, SessionKVCache, common_prefix_len, crop_cache
+from llm.streaming import STREAM_TIMEOUT_SECONDS, TokenStream, event_stopping_criteria
+from rag.request import RAGRequest, Turn
+from utils.deadline import deadline_stopping_criteria
+from utils.inference import check_inference_precision, load_with_precision
+from utils.lazy import LazyLoader
+from utils.matcher import KeywordMatcher, load_matcher
+from utils.preprocessing import CONTEXT_MIN_CHARS, RAG_RESPONSE_MIN_CHARS
+
+# Palavras-chave por categoria (dsm, nonsense, tech) usadas na validação
+KEYWORDS_PATH = os.path.join(os.path.dirname(__file__), 'keywords.json')
+
+# Parâmetros fixos de model.generate; também entram na chave do cache de respostas
+GENERATION_PARAMS = {
+    'num_beams': 2,
+    'no_repeat_ngram_size': 2,
+    'do_sample': True,
+    'temperature': 0.8,
+    'top_p': 0.9,
+    'repetition_penalty': 1.1,
+}
+
+# Estratégias de decodificação selecionáveis por pedido; o custo de cada uma
+# é medido com ``python src/benchmark.py decoding``
+DECODING_PRESETS = {
+    'beam_sample': GENERATION_PARAMS,
+    'sample': dict(GENERATION_PARAMS, num_beams=1),
+    'greedy': {'num_beams': 1, 'do_sample': False, 'no_repeat_ngram_size': 2, 'repetition_penalty': 1.1},
+    'beam': {'num_beams': 2, 'do_sample': False, 'no_repeat_ngram_size': 2, 'repetition_penalty': 1.1},
+}
+DEFAULT_DECODING = 'beam_sample'
+# Decodificadores do streaming: o TextIteratorStreamer não suporta beam search
+STREAM_DECODERS = {name: DECODING_PRESETS[name] for name in ('sample', 'greedy')}
+# Caracteres retidos antes de validar o texto em streaming; acima de 50 o
+# critério de tamanho de _is_valid_response já pode ser decidido
+STREAM_VALIDATION_CHARS = 60
+# Tokens do prompt de uma sessão; acima disso os turnos mais antigos saem de
+# uma vez, até metade do limite, para o prefixo ficar estável por vários turnos
+SESSION_MAX_PROMPT_TOKENS = 400
 
 class HuggingFaceLLM:
-    def __init__(self, model_name="microsoft/DialoGPT-small"):
+    def __init__(self, model_name="microsoft/DialoGPT-small", precision="float32",
+                 cache_dir: Optional[str] = None, keywords_path: str = KEYWORDS_PATH,
+                 answer_cache: Optional[AnswerCache] = None, seed: Optional[int] = None,
+                 semantic_cache: Optional[SemanticAnswerCache] = None,
+                 session_cache: Optional[SessionKVCache] = None,
+                 static_prefixes: Sequence[str] = STATIC_PREFIXES, decoding: str = DEFAULT_DECODING):
         self.model_name = model_name
-        self.tokenizer = None
-        self.model = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"Carregando modelo {model_name} em {self.device}...")
+        # Compilado uma vez por arquivo e compartilhado entre instâncias
+        self.matcher: KeywordMatcher = load_matcher(keywords_path)
+        # float32, int8 (quantização dinâmica, modelo quantizado fica em cache_dir) ou bfloat16
+        check_inference_precision(precision)
+        self.precision = precision
+        self.cache_dir = cache_dir
+        # torch/transformers e o modelo só são carregados na primeira geração
+        # (ou por preload); perguntas fora do escopo nunca pagam esse custo
+        self._loader = LazyLoader(self._load_model, name=model_name)
+        # Respostas já geradas para a mesma pergunta e os mesmos chunks
+        self.answer_cache = answer_cache
+        # Respostas de perguntas parecidas (pelo embedding) com os mesmos chunks
+        self.semantic_cache = semantic_cache
+        # KV cache por sessão: o histórico já processado não passa de novo pelo modelo
+        self.session_cache = session_cache
+        # Início fixo dos prompts: o KV cache é calculado ao carregar o modelo
+        self.static_prefixes = tuple(static_prefixes)
+        # Com seed a amostragem é determinística: resposta em cache e gerada coincidem
+        self.seed = seed
+        # Um model.generate por vez: lotes do scheduler e streams dividem o modelo
+        # e o gerador aleatório global, que a seed reinicia a cada chamada
+        self._generate_lock = threading.Lock()
+        # Estratégia de generate/generate_batch quando o pedido não escolhe outra
+        self.decoding = decoding
+        self._decoding_params(decoding)
+
+    def _load_model(self):
+        import torch
+        from transformers import AutoConfig, AutoTokenizer, AutoModelForCausalLM
+
+        # Modelos int8 só rodam em CPU
+        device = "cuda" if torch.cuda.is_available() and self.precision != "int8" else "cpu"
+        print(f"Carregando modelo {self.model_name} ({self.precision}) em {device}...")
         
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(model_name)
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = load_with_precision(
+                lambda: AutoModelForCausalLM.from_pretrained(self.model_name),
+                self.precision, self.model_name, self.cache_dir,
+                build_empty=lambda: AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(self.model_name)))
+            model.eval()
             
             # Configurar pad_token se não existir
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            # Preenchimento à esquerda: em lotes a geração continua do fim de cada prompt
+            tokenizer.padding_side = 'left'
+            prefix_cache = StaticPrefixCache.build(model, tokenizer, self.static_prefixes, device)
                 
             # Modelo carregado com sucesso
             print("Modelo carregado com sucesso!")
         except Exception as e:
             print(f"Erro ao carregar modelo: {e}")
-            self.model = None
-            self.tokenizer = None
+            model = None
+            tokenizer = None
+            prefix_cache = None
+        return tokenizer, model, device, prefix_cache
+
+    @property
+    def tokenizer(self):
+        return self._loader.get()[0]
+
+    @property
+    def model(self):
+        return self._loader.get()[1]
 
-    def generate(self, prompt, max_length=200):
+    @property
+    def device(self) -> str:
+        return self._loader.get()[2]
+
+    @property
+    def prefix_cache(self) -> Optional[StaticPrefixCache]:
+        return self._loader.get()[3]
+
+    @property
+    def loaded(self) -> bool:
+        return self._loader.loaded
+
+    def preload(self, background: bool = True) -> Optional[threading.Thread]:
+        """Antecipa o carregamento do modelo (em segundo plano por padrão)."""
+        return self._loader.preload(background)
+
+    def generate(self, request: Union[RAGRequest, str], max_length=200, in_scope: Optional[bool] = None,
+                 embedding=None, session_id: Optional[str] = None, decoding: Optional[str] = None):
         """
         Geração focada: primeiro tenta DialoGPT, se falhar usa RAG puro
+
+        ``request`` é um ``RAGRequest``; prompts em texto ainda são aceitos e
+        convertidos uma única vez. ``in_scope`` é o resultado de uma verificação
+        de escopo já feita antes da recuperação (ver ``main.py``); se None, usa
+        as palavras-chave. ``embedding`` é o vetor da pergunta calculado pelo
+        ``Retriever``, usado no cache semântico. Com ``session_id`` (e
+        ``session_cache``) o histórico entra no prompt e a geração segue o
+        caminho de ``generate_stream``, reaproveitando o KV cache da sessão.
+
+        ``decoding`` escolhe uma das ``DECODING_PRESETS`` (padrão:
+        ``self.decoding``); sessões só aceitam as de ``STREAM_DECODERS``. Com
+        ``request.deadline``, a geração para quando o prazo acaba e a resposta
+        cai para o RAG puro.
         """
-        # Extrair pergunta do usuário primeiro
-        user_question = self._extract_user_question(prompt)
-        
+        if session_id is not None and self.session_cache is not None:
+            # Sessões passam pelo streaming, que não faz beam search
+            return ''.join(self.generate_stream(request, max_length, in_scope, embedding, decoding=decoding,
+                                                session_id=session_id))
+        return self.generate_batch([request], max_length,
+                                   in_scope=None if in_scope is None else [in_scope],
+                                   embeddings=None if embedding is None else [embedding], decoding=decoding)[0]
+
+    def generate_batch(self, requests: List[Union[RAGRequest, str]], max_length=200,
+                       in_scope: Optional[List[Optional[bool]]] = None, embeddings=None,
+                       decoding: Optional[str] = None) -> List[str]:
+        """Como ``generate`` para vários pedidos, com um único ``model.generate``.
+
+        Os prompts são preenchidos à esquerda num só tensor; validação,
+        polimento e fallback RAG puro são aplicados a cada item. Com ``seed``
+        o lote é determinístico, mas a amostragem de um item pode diferir da
+        chamada isolada (o gerador aleatório é compartilhado pelo lote).
+        """
+        params = self._decoding_params(decoding)
+        requests = [RAGRequest.from_prompt(r) if isinstance(r, str) else r for r in requests]
+        answers: List[Optional[str]] = [None] * len(requests)
+
         # Verificar se é sobre DSM ANTES de processar
-        if not self._is_dsm_question(user_question):
-            return self._get_scope_warning()
-        
+        pending = []
+        for i, request in enumerate(requests):
+            ok = in_scope[i] if in_scope is not None else None
+            if ok is None:
+                ok = self.is_dsm_question(request.question)
+            if ok:
+                pending.append(i)
+            else:
+                answers[i] = self._get_scope_warning()
+
+        # Os caches não dependem do modelo: consultados antes de carregá-lo
+        to_generate = []
+        for i in pending:
+            answers[i] = self._cached_answer(requests[i], max_length, params,
+                                             None if embeddings is None else embeddings[i])
+            if answers[i] is None and requests[i].timed_out:
+                # Prazo esgotado na fila ou na busca: o modelo nem é chamado
+                answers[i] = self._get_rag_pure_response(requests[i])
+            elif answers[i] is None:
+                to_generate.append(i)
+
         # Tentar DialoGPT apenas se modelo está funcionando
-        if self.model and self.tokenizer:
-            try:
-                response = self._try_dialogpt_generation(prompt, max_length)
-                if response and self._is_valid_response(response):
-                    return self._polish_response(response)
-            except Exception as e:
-                print(f"DialoGPT falhou: {e}")
-        
-        # Fallback: RAG puro
-        return self._get_rag_pure_response(prompt)
+        if to_generate and self.model and self.tokenizer:
+            results = self._generate_answers([requests[i] for i in to_generate], max_length, params)
+            for i, (answer, generated) in zip(to_generate, results):
+                answers[i] = answer
+                # Só respostas do modelo vão para o cache: o fallback de uma falha
+                # passageira (ou de um corte pelo prazo) não fica preso à pergunta
+                if generated:
+                    self._cache_answer(requests[i], max_length, params,
+                                       None if embeddings is None else embeddings[i], answer)
+        else:
+            # Fallback: RAG puro
+            for i in to_generate:
+                answers[i] = self._get_rag_pure_response(requests[i])
+        return answers  # type: ignore
+
+    def generate_stream(self, request: Union[RAGRequest, str], max_length=200, in_scope: Optional[bool] = None,
+                        embedding=None, decoding: Optional[str] = None,
+                        session_id: Optional[str] = None) -> TokenStream:
+        """Como ``generate``, mas devolve a resposta aos poucos (``TokenStream``).
+
+        Os primeiros ``STREAM_VALIDATION_CHARS`` caracteres são retidos e
+        validados; se falharem, a geração é interrompida e o stream entrega a
+        resposta RAG pura. ``decoding`` é ``'sample'`` ou ``'greedy'``; None
+        usa ``self.decoding`` (``'sample'`` se ela usar beam search).
+
+        Com ``session_id`` o prompt inclui o histórico da conversa
+        (``request.history`` completo; os turnos antigos saem quando passam de
+        ``SESSION_MAX_PROMPT_TOKENS``) e só os tokens novos são processados.
+        """
+        decoding = self._stream_decoding(decoding)
+        if isinstance(request, str):
+            request = RAGRequest.from_prompt(request)
+        if self.session_cache is None:
+            session_id = None
+        return TokenStream(lambda stream: self._stream_answer(stream, request, max_length, in_scope,  # type: ignore
+                                                              embedding, STREAM_DECODERS[decoding], session_id))
+
+    def _stream_answer(self, stream: TokenStream, request: RAGRequest, max_length: int,
+                       in_scope: Optional[bool], embedding, params: dict,
+                       session_id: Optional[str] = None) -> Iterator[str]:
+        if in_scope is None:
+            in_scope = self.is_dsm_question(request.question)
+        if not in_scope:
+            yield self._get_scope_warning()
+            return
+
+        # Com sessão a resposta depende do histórico: os caches de respostas não se aplicam
+        if session_id is None:
+            cached = self._cached_answer(request, max_length, params, embedding)
+            if cached is not None:
+                stream.cached = True
+                yield cached
+                return
+        if request.timed_out:
+            stream.fallback = stream.timed_out = True
+            yield self._get_rag_pure_response(request)
+            return
+        if not (self.model and self.tokenizer):
+            stream.fallback = True
+            yield self._get_rag_pure_response(request)
+            return
+        if session_id is not None:
+            return (yield from self._stream_dialogpt(stream, request, max_length, params, session_id))
+        answer = yield from self._stream_dialogpt(stream, request, max_length, params)
+        # Fallback e respostas truncadas pelo prazo não vão para o cache
+        if not (stream.fallback or stream.timed_out):
+            self._cache_answer(request, max_length, params, embedding, answer)
+
+    def _encode(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False)['input_ids']
+
+    def _session_prompt(self, request: RAGRequest, entry: Optional[SessionEntry]):
+        """Tokens do prompt da sessão, primeiro turno mantido e tokens de cada turno.
+
+        Turnos que a sessão já gerou entram com os tokens registrados; os
+        demais são codificados a partir do texto do histórico.
+        """
+        window_start = entry.window_start if entry else 0
+        if window_start > len(request.history):
+            # Histórico menor que o da sessão: a conversa recomeçou
+            window_start = 0
+        turns = {}
+        for i in range(window_start, len(request.history)):
+            turn = request.history[i]
+            known = entry.turns.get(i) if entry else None
+            turns[i] = known[1] if known and known[0] == turn else self._encode(f"Usuário: {turn.user}\nBot: {turn.bot}\n")
+        new_ids = self._encode(self._conversation(request))
+        total = sum(len(t) for t in turns.values()) + len(new_ids)
+        if total > SESSION_MAX_PROMPT_TOKENS:
+            while window_start < len(request.history) and total > SESSION_MAX_PROMPT_TOKENS // 2:
+                total -= len(turns.pop(window_start))
+                window_start += 1
+        ids = [tok for i in sorted(turns) for tok in turns[i]] + new_ids
+        return ids[-SESSION_MAX_PROMPT_TOKENS:], window_start, {i: (request.history[i], t) for i, t in turns.items()}
+
+    def _prompt_inputs(self, request: RAGRequest, session_id: Optional[str]):
+        """(ids do prompt, KV cache reaproveitado ou None, estado da sessão sem o cache)."""
+        if session_id is None:
+            ids = self.tokenizer(self._conversation(request), truncation=True, max_length=400)['input_ids']
+            past = self.prefix_cache.seed(ids)[0] if self.prefix_cache else None
+            return ids, past, None
+        entry = self.session_cache.take(session_id)  # type: ignore
+        ids, window_start, turns = self._session_prompt(request, entry)
+        past = None
+        # Ao menos um token novo precisa passar pelo modelo para gerar
+        reused = min(common_prefix_len(entry.ids, ids), len(ids) - 1) if entry else 0
+        if reused > 0:
+            past = entry.past  # type: ignore
+            crop_cache(past, reused)
+        self.session_cache.record(reused, len(ids) - reused)  # type: ignore
+        if reused == 0 and self.prefix_cache:
+            # Sessão nova ou sem nada em comum: ao menos o prefixo fixo é reaproveitado
+            past = self.prefix_cache.seed(ids)[0]
+        return ids, past, SessionEntry([], None, window_start, turns)
+
+    def _stream_dialogpt(self, stream: TokenStream, request: RAGRequest, max_length: int, params: dict,
+                         session_id: Optional[str] = None):
+        """Gera numa thread e repassa o texto polido; retorna a resposta final."""
+        import torch
+        from transformers import TextIteratorStreamer
+
+        ids, past, session = self._prompt_inputs(request, session_id)
+        input_ids = torch.tensor([ids], device=torch.device(self.device))
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                        timeout=STREAM_TIMEOUT_SECONDS)
+        stop = threading.Event()
+        stopping_criteria = event_stopping_criteria(stop)
+        deadline_stop = None
+        if request.deadline is not None:
+            deadline_stop = deadline_stopping_criteria([request.deadline], self.tokenizer.eos_token_id)
+            stopping_criteria.append(deadline_stop)
+        result: list = []
+        kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past,
+            return_dict_in_generate=session_id is not None,
+            max_new_tokens=min(max_length, 100),
+            **params,
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            streamer=streamer,
+            stopping_criteria=stopping_criteria,
+        )
+        thread = threading.Thread(target=self._generate_into, args=(streamer, kwargs, result), daemon=True)
+        thread.start()
+
+        raw, emitted, valid = '', '', False
+        try:
+            for piece in streamer:
+                raw += piece
+                if not valid:
+                    if len(raw.strip()) < STREAM_VALIDATION_CHARS:
+                        continue
+                    if not self._is_valid_response(raw):
+                        break
+                    valid = True
+                polished = self._polish_prefix(raw)
+                if len(polished) > len(emitted):
+                    yield polished[len(emitted):]
+                    emitted = polished
+            else:
+                # Respostas curtas terminam antes da janela de validação
+                valid = valid or self._is_valid_response(raw)
+        except Exception as e:
+            print(f"Erro no DialoGPT: {e}")
+            valid = valid and bool(emitted)
+        finally:
+            stop.set()
+            thread.join()
+
+        if deadline_stop is not None and deadline_stop.cut[0]:
+            # Cortada pelo prazo: só segue se um trecho validado já foi entregue
+            stream.timed_out = True
+            valid = valid and bool(emitted)
+        answer = self._polish_response(raw) if valid else self._get_rag_pure_response(request)
+        if session is not None and result:
+            self._save_session(session_id, session, request, ids, result[0], answer if valid else None)  # type: ignore
+        if not valid:
+            stream.fallback = True
+            yield answer
+            return answer
+        yield answer[len(emitted):]
+        return answer
+
+    def _save_session(self, session_id: str, session: SessionEntry, request: RAGRequest, prompt_ids: List[int],
+                      output, answer: Optional[str]):
+        """Guarda o KV cache da geração; o turno só é registrado se a resposta gerada foi usada."""
+        # O KV cache devolvido cobre todos os tokens menos o último gerado
+        sequence = output.sequences[0].tolist()
+        session.past = output.past_key_values
+        session.ids = sequence[:session.past.get_seq_length()]  # type: ignore
+        session.turns = {i: t for i, t in session.turns.items() if i >= session.window_start}
+        if answer is not None:
+            generated = [tok for tok in sequence[len(prompt_ids):] if tok != self.tokenizer.eos_token_id]
+            # Os tokens do histórico vêm antes; o resto do prompt é o turno novo
+            new_turn = prompt_ids[sum(len(ids) for _, ids in session.turns.values()):]
+            session.turns[len(request.history)] = (Turn(request.question, answer),
+                                                   new_turn + generated + self._encode("\n"))
+        self.session_cache.put(session_id, session)  # type: ignore
+
+    def _generate_into(self, streamer, kwargs: dict, result: list):
+        import torch
+        try:
+            with self._generate_lock, torch.no_grad():
+                if self.seed is not None:
+                    torch.manual_seed(self.seed)
+                result.append(self.model.generate(**kwargs))
+        except Exception as e:
+            print(f"DialoGPT falhou: {e}")
+            streamer.end()
+
+    def _cached_answer(self, request: RAGRequest, max_length: int, generation_params: dict,
+                       embedding=None) -> Optional[str]:
+        """Resposta do cache exato ou, com ``embedding``, do cache semântico."""
+        params = self._generation_key_params(max_length, generation_params)
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get(answer_key(request, self.model_name, params))
+            if cached is not None:
+                return cached
+        if self._semantic_cacheable(request, embedding):
+            return self.semantic_cache.get(embedding, request.chunk_ids,  # type: ignore
+                                           generation_key(self.model_name, params))
+        return None
+
+    def _cache_answer(self, request: RAGRequest, max_length: int, generation_params: dict, embedding,
+                      answer: str):
+        params = self._generation_key_params(max_length, generation_params)
+        if self.answer_cache is not None:
+            self.answer_cache.put(answer_key(request, self.model_name, params), answer)
+        if self._semantic_cacheable(request, embedding):
+            self.semantic_cache.put(embedding, request.chunk_ids,  # type: ignore
+                                    generation_key(self.model_name, params), answer)
+
+    def _semantic_cacheable(self, request: RAGRequest, embedding) -> bool:
+        # Só chunks vindos do índice (ids válidos) garantem o mesmo contexto
+        return (self.semantic_cache is not None and embedding is not None and bool(request.chunks)
+                and min(request.chunk_ids) >= 0)
+
+    def _generation_key_params(self, max_length: int, generation_params: dict = GENERATION_PARAMS) -> dict:
+        """Tudo o que, além da pergunta e dos chunks, muda a resposta gerada."""
+        return dict(generation_params, max_new_tokens=min(max_length, 100),
+                    precision=self.precision, seed=self.seed)
+
+    def _generate_answers(self, requests: List[RAGRequest], max_length: int,
+                          params: dict = GENERATION_PARAMS) -> List[Tuple[str, bool]]:
+        """(resposta, veio do modelo) de cada pedido; False indica o fallback RAG puro."""
+        if not requests:
+            return []
+        responses = self._try_dialogpt_generation(requests, max_length, params)
+        answers = []
+        for request, response in zip(requests, responses):
+            if response and self._is_valid_response(response):
+                answers.append((self._polish_response(response), True))
+            else:
+                answers.append((self._get_rag_pure_response(request), False))
+        return answers
+
+    def _conversation(self, request: RAGRequest) -> str:
+        """Prompt conversacional simples para o DialoGPT"""
+        context_info = self._extract_clean_context(request)
+        if context_info:
+            return f"Sobre mobile: {context_info[:200]}\nUsuário: {request.question}\nBot:"
+        return f"Usuário: {request.question}\nBot:"
     
-    def _try_dialogpt_generation(self, prompt: str, max_length: int) -> Optional[str]:
-        """Tentativa limpa de gerar com DialoGPT"""
+    def _try_dialogpt_generation(self, requests: List[RAGRequest], max_length: int,
+                                 params: dict = GENERATION_PARAMS) -> List[Optional[str]]:
+        """Tentativa limpa de gerar com DialoGPT, um lote numa única chamada
+
+        Itens cortados pelo prazo (``request.deadline``) voltam como None.
+        """
         # Verificar se modelo está disponível
         if self.model is None or self.tokenizer is None:
-            return None
+            return [None] * len(requests)
+        import torch
+        from transformers import StoppingCriteriaList
             
         try:
-            # Preparar prompt otimizado para DialoGPT
-            context_info = self._extract_clean_context(prompt)
-            user_question = self._extract_user_question(prompt)
-            
-            # Prompt conversacional simples
-            if context_info:
-                conversation = f"Sobre mobile: {context_info[:200]}\nUsuário: {user_question}\nBot:"
-            else:
-                conversation = f"Usuário: {user_question}\nBot:"
-            
-            # Tokenizar
             inputs = self.tokenizer(
-                conversation,
+                [self._conversation(r) for r in requests],
                 return_tensors='pt',
                 truncation=True,
                 max_length=400,
@@ -78,50 +487,80 @@ class HuggingFaceLLM:
             input_ids = inputs['input_ids'].to(torch.device(self.device))
             attention_mask = inputs['attention_mask'].to(torch.device(self.device))
             
+            # Lotes sem preenchimento começam do KV cache do prefixo fixo
+            past = self._prefix_past(input_ids, params) if bool(attention_mask.all()) else None
+            deadline_stop = None
+            if any(r.deadline is not None for r in requests):
+                deadline_stop = deadline_stopping_criteria([r.deadline for r in requests],
+                                                           self.tokenizer.eos_token_id)
+
             # Gerar
-            with torch.no_grad():
+            with self._generate_lock, torch.no_grad():
+                if self.seed is not None:
+                    torch.manual_seed(self.seed)
                 outputs = self.model.generate(
                     input_ids,
                     attention_mask=attention_mask,
+                    past_key_values=past,
                     max_new_tokens=min(max_length, 100),
-                    num_beams=2,
-                    no_repeat_ngram_size=2,
-                    do_sample=True,
-                    temperature=0.8,
-                    top_p=0.9,
-                    repetition_penalty=1.1,
+                    **params,
                     pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    stopping_criteria=StoppingCriteriaList([deadline_stop] if deadline_stop else []),
                 )
         
-            # Extrair apenas resposta nova
-            generated_tokens = outputs[0][input_ids.shape[1]:]
-            response = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
-            
-            return response.strip() if response else None
+            # Extrair apenas resposta nova de cada item
+            responses = []
+            for row, generated_tokens in enumerate(outputs[:, input_ids.shape[1]:]):
+                if deadline_stop is not None and deadline_stop.cut[row]:
+                    responses.append(None)
+                    continue
+                response = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
+                responses.append(response.strip() if response else None)
+            return responses
             
         except Exception as e:
             print(f"Erro no DialoGPT: {e}")
-            return None
+            return [None] * len(requests)
     
+    def _prefix_past(self, input_ids, params: dict = GENERATION_PARAMS):
+        """Cópia do KV cache do prefixo fixo comum a todas as linhas, ou None."""
+        if self.prefix_cache is None:
+            return None
+        rows = input_ids.tolist()
+        length = self.prefix_cache.match(rows[0])
+        if not length or any(row[:length] != rows[0][:length] for row in rows[1:]):
+            return None
+        # Uma cópia por linha e por feixe do beam search
+        return self.prefix_cache.seed(rows[0], copies=len(rows) * params.get('num_beams', 1))[0]
+
+    def _stream_decoding(self, decoding: Optional[str]) -> str:
+        """Decodificador do streaming e das sessões, que não fazem beam search."""
+        if decoding is None:
+            # Só o padrão com beam search é trocado; pedir um explicitamente é erro
+            return self.decoding if self.decoding in STREAM_DECODERS else 'sample'
+        if decoding not in STREAM_DECODERS:
+            raise ValueError(f'Decodificador {decoding} indisponível em streaming e sessões '
+                             f'(use um de {tuple(STREAM_DECODERS)})')
+        return decoding
+
+    def _decoding_params(self, decoding: Optional[str]) -> dict:
+        name = self.decoding if decoding is None else decoding
+        if name not in DECODING_PRESETS:
+            raise ValueError(f'Decodificador desconhecido: {name} (use um de {tuple(DECODING_PRESETS)})')
+        return DECODING_PRESETS[name]
+
     def _is_valid_response(self, response: str) -> bool:
         """Validação rigorosa de qualidade"""
         if not response or len(response.strip()) < 10:
             return False
         
         response_clean = response.strip().lower()
+        categories = self.matcher.categories(response_clean)
         
         # Padrões de nonsense comuns
-        nonsense_patterns = [
-            'pupupu', 'lalala', 'hahaha', 'jejeje', 'xoxoxo',
-            'meu o que', 'estava a ou', 'según', 'híbrido pwa',
-            '!!!!!!', '??????', '.......',
-            'íticas:', 'púpúpú'
-        ]
-        
-        for pattern in nonsense_patterns:
-            if pattern in response_clean:
-                return False
+        if 'nonsense' in categories:
+            return False
         
         # Verificar repetição excessiva
         words = response_clean.split()
@@ -132,28 +571,24 @@ class HuggingFaceLLM:
                 return False
         
         # Deve ter pelo menos algumas palavras relacionadas a tech/mobile
-        tech_words = [
-            'react', 'native', 'flutter', 'dart', 'javascript', 'mobile',
-            'app', 'desenvolvimento', 'framework', 'componente', 'teste',
-            'performance', 'android', 'ios', 'arquitetura'
-        ]
-        
-        has_tech_content = any(word in response_clean for word in tech_words)
+        has_tech_content = 'tech' in categories
         
         # Aceitar se tem conteúdo tech OU é substancial (>50 chars)
         return has_tech_content or len(response.strip()) > 50
     
-    def _polish_response(self, response: str) -> str:
-        """Polimento final da resposta"""
-        # Limpar quebras de linha excessivas
-        polished = re.sub(r'\n\s*\n', '\n\n', response.strip())
-        
-        # Remover espaços extras
-        polished = re.sub(r'\s+', ' ', polished)
+    def _polish_prefix(self, text: str) -> str:
+        """Polimento de um trecho (início da resposta), sem a pontuação final"""
+        # Remover espaços e quebras de linha extras
+        polished = re.sub(r'\s+', ' ', text.strip())
         
         # Capitalizar primeira letra
         if polished and not polished[0].isupper():
             polished = polished[0].upper() + polished[1:]
+        return polished
+    
+    def _polish_response(self, response: str) -> str:
+        """Polimento final da resposta"""
+        polished = self._polish_prefix(response)
         
         # Garantir pontuação adequada
         if polished and not polished.endswith(('.', '!', '?', ':')):
@@ -161,117 +596,17 @@ class HuggingFaceLLM:
         
         return polished
     
-    def _extract_user_question(self, prompt: str) -> str:
-        """Extrai pergunta do usuário do prompt"""
-        lines = prompt.split('\n')
-        for line in reversed(lines):
-            line = line.strip()
-            if line.startswith('Usuário:'):
-                return line.replace('Usuário:', '').strip()
-        return ""
-    
-    def _extract_clean_context(self, prompt: str) -> str:
+    def _extract_clean_context(self, request: RAGRequest) -> str:
         """Extrai contexto RAG limpo"""
-        contexts = []
-        
-        if "Informações relevantes:" in prompt:
-            lines = prompt.split('\n')
-            in_context = False
-            
-            for line in lines:
-                line = line.strip()
-                if line == "Informações relevantes:":
-                    in_context = True
-                    continue
-                elif in_context and line.startswith('•'):
-                    raw_context = line[1:].strip()
-                    clean_context = self._deep_clean_context(raw_context)
-                    if len(clean_context) > 25:
-                        contexts.append(clean_context)
-                elif in_context and line and not line.startswith('Usuário:'):
-                    break
-        
+        contexts = request.clean_contexts(CONTEXT_MIN_CHARS)
         return ' '.join(contexts[:2]) if contexts else ""
     
-    def _clean_rag_context(self, context: str) -> str:
-        """Limpa contexto RAG removendo títulos e formatação desnecessária"""
-        # Remove títulos em maiúscula comuns
-        titles_to_remove = [
-            'COMPARISON:', 'REACT NATIVE VS FLUTTER ARQUITETURA:',
-            'OTIMIZAÇÃO DE PERFORMANCE EM FLUTTER:', 'OTIMIZAÇÃO DE PERFORMANCE EM REACT NATIVE:',
-            'CI/CD PARA REACT NATIVE - GUIA COMPLETO:', 'CI/CD E DEPLOYMENT PARA DESENVOLVIMENTO MOBILE:',
-            'TESTING EM REACT NATIVE:', 'TESTES PARA APLICAÇÕES MOBILE:', 'ESTRATÉGIAS DE TESTE:',
-            'ARQUITETURAS MOBILE:', 'CLEAN ARCHITECTURE:', 'MVVM PATTERN:'
-        ]
-        
-        clean_context = context
-        for title in titles_to_remove:
-            clean_context = clean_context.replace(title, '')
-        
-        # Remove linhas com apenas símbolos
-        lines = clean_context.split('\n')
-        clean_lines = []
-        for line in lines:
-            line = line.strip()
-            # Remove linhas vazias, símbolos e bullets
-            if line and not line.startswith('===') and len(line) > 15:
-                if line.startswith('- '):
-                    line = line[2:]
-                clean_lines.append(line)
-        
-        # Retorna texto limpo
-        return ' '.join(clean_lines).strip()
-    
-    def _get_simple_fallback(self, prompt: str) -> str:
+    def _get_simple_fallback(self, request: RAGRequest) -> str:
         """Fallback focado exclusivamente em DSM usando RAG puro"""
-        # Extrair contextos do prompt se existirem
-        contexts = []
-        user_question = ""
-        
-        if "Informações relevantes:" in prompt:
-            lines = prompt.split('\n')
-            in_context_section = False
-            for line in lines:
-                if line.strip() == "Informações relevantes:":
-                    in_context_section = True
-                    continue
-                elif in_context_section and line.startswith('•'):
-                    contexts.append(line[1:].strip())
-                elif in_context_section and line.strip() and not line.startswith('•'):
-                    break
-                    
-        # Extrair pergunta do usuário para melhor contexto
-        lines = prompt.split('\n')
-        for line in reversed(lines):
-            if line.startswith('Usuário:'):
-                user_question = line.replace('Usuário:', '').strip()
-                break
-        
-        # Verificar se a pergunta é sobre DSM (Desenvolvimento de Software Mobile)
-        question_lower = user_question.lower()
-        
-        # Palavras-chave relacionadas ao DSM
-        dsm_keywords = [
-            # Frameworks mobile
-            'react native', 'flutter', 'ionic', 'xamarin', 'cordova', 'phonegap',
-            # Plataformas
-            'android', 'ios', 'mobile', 'app', 'aplicativo', 'multiplataforma',
-            # Tecnologias mobile
-            'expo', 'metro', 'gradle', 'xcode', 'fastlane', 'apk', 'ipa',
-            # Conceitos mobile
-            'responsivo', 'push notification', 'deep link', 'offline', 'sqlite',
-            # Testes mobile
-            'detox', 'appium', 'maestro', 'e2e mobile', 'device testing',
-            # Performance mobile
-            'fps', 'battery', 'memory mobile', 'startup time', 'bundle size',
-            # Deploy mobile
-            'play store', 'app store', 'testflight', 'play console', 'code push',
-            # Arquiteturas mobile
-            'mvvm mobile', 'clean mobile', 'repository pattern mobile'
-        ]
+        contexts = request.contexts
         
         # Verificar se a pergunta contém palavras-chave de DSM
-        is_dsm_related = any(keyword in question_lower for keyword in dsm_keywords)
+        is_dsm_related = self.matcher.has(request.question, 'dsm')
         
         # Se não for sobre DSM, alertar o usuário
         if not is_dsm_related and not contexts:
@@ -287,13 +622,8 @@ class HuggingFaceLLM:
         
         # Se há contexto do RAG, usar apenas ele (RAG puro)
         if contexts:
-            # Limpar contextos de títulos e formatação
-            clean_contexts = []
-            for context in contexts:
-                # Remove títulos em maiúscula e formatação
-                clean_context = self._clean_rag_context(context)
-                if len(clean_context) > 30:  # Contexto substancial
-                    clean_contexts.append(clean_context)
+            # Contextos sem títulos e formatação (limpos no build do índice)
+            clean_contexts = request.clean_rag_contexts(RAG_RESPONSE_MIN_CHARS)
             
             if clean_contexts:
                 # Retornar resposta RAG pura baseada no contexto
@@ -310,30 +640,9 @@ class HuggingFaceLLM:
         return ("🚫 Por favor, faça perguntas sobre **Desenvolvimento de Software Mobile**.\n\n"
                "Especialidades: React Native, Flutter, Ionic, arquiteturas, testes e CI/CD mobile. 📱")
     
-    def _is_dsm_question(self, question: str) -> bool:
+    def is_dsm_question(self, question: str) -> bool:
         """Verifica se a pergunta é sobre Desenvolvimento de Software Mobile"""
-        question_lower = question.lower()
-        
-        dsm_keywords = [
-            # Frameworks mobile
-            'react native', 'flutter', 'ionic', 'xamarin', 'cordova', 'phonegap',
-            # Plataformas
-            'android', 'ios', 'mobile', 'app', 'aplicativo', 'multiplataforma',
-            # Tecnologias mobile
-            'expo', 'metro', 'gradle', 'xcode', 'fastlane', 'apk', 'ipa',
-            # Conceitos mobile
-            'responsivo', 'push notification', 'deep link', 'offline', 'sqlite',
-            # Testes mobile
-            'detox', 'appium', 'maestro', 'e2e mobile', 'device testing',
-            # Performance mobile
-            'fps', 'battery', 'memory mobile', 'startup time', 'bundle size',
-            # Deploy mobile
-            'play store', 'app store', 'testflight', 'play console', 'code push',
-            # Arquiteturas mobile
-            'mvvm mobile', 'clean mobile', 'repository pattern mobile'
-        ]
-        
-        return any(keyword in question_lower for keyword in dsm_keywords)
+        return self.matcher.has(question, 'dsm')
     
     def _get_scope_warning(self) -> str:
         """Retorna mensagem de aviso sobre escopo DSM"""
@@ -347,29 +656,12 @@ class HuggingFaceLLM:
                "• **Deploy:** App Store, Google Play\n\n"
                "Faça uma pergunta sobre desenvolvimento mobile! 📱")
     
-    def _get_rag_pure_response(self, prompt: str) -> str:
+    def _get_rag_pure_response(self, request: RAGRequest) -> str:
         """Processa resposta usando apenas RAG puro"""
-        # Extrair contextos do prompt
-        contexts = []
-        if "Informações relevantes:" in prompt:
-            lines = prompt.split('\n')
-            in_context_section = False
-            for line in lines:
-                if line.strip() == "Informações relevantes:":
-                    in_context_section = True
-                    continue
-                elif in_context_section and line.startswith('•'):
-                    contexts.append(line[1:].strip())
-                elif in_context_section and line.strip() and not line.startswith('•'):
-                    break
-        
+        contexts = request.contexts
         if contexts:
-            # Limpar contextos 
-            clean_contexts = []
-            for context in contexts:
-                clean_context = self._deep_clean_context(context)
-                if len(clean_context) > 30:
-                    clean_contexts.append(clean_context)
+            # Contextos limpos (pré-calculados no build do índice)
+            clean_contexts = request.clean_contexts(RAG_RESPONSE_MIN_CHARS)
             
             if clean_contexts:
                 # Retornar resposta RAG pura
@@ -379,50 +671,3 @@ class HuggingFaceLLM:
         return ("Não encontrei informações específicas sobre isso na minha base de conhecimento DSM.\n\n"
                "Posso ajudar com React Native, Flutter, Ionic, arquiteturas móveis, testes, CI/CD e performance mobile.\n\n"
                "Você pode reformular a pergunta ou ser mais específico sobre qual framework ou aspecto mobile te interessa?")
-    
-    def _deep_clean_context(self, context: str) -> str:
-        """Limpeza profunda de contexto RAG"""
-        if not context or len(context.strip()) < 10:
-            return ""
-        
-        clean_text = context.strip()
-        
-        # Remover padrões específicos de títulos e formatação
-        patterns_to_remove = [
-            r'^[A-Z\s]+$',  # Linhas só em maiúscula
-            r'^={3,}.*={3,}$',  # Linhas com ===
-            r'^\*+\s*.*\s*\*+$',  # Linhas com asteriscos
-            r'^#+\s*',  # Headers markdown
-            r'^\s*[-•]\s*$',  # Bullets vazios
-        ]
-        
-        lines = clean_text.split('\n')
-        clean_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Verificar se linha deve ser removida
-            should_remove = False
-            for pattern in patterns_to_remove:
-                if re.match(pattern, line):
-                    should_remove = True
-                    break
-            
-            if not should_remove and len(line) > 15:
-                # Limpar prefixos de lista
-                if line.startswith('- '):
-                    line = line[2:].strip()
-                elif line.startswith('• '):
-                    line = line[2:].strip()
-                
-                clean_lines.append(line)
-        
-        result = ' '.join(clean_lines).strip()
-        
-        # Remover duplicações e espaços extras
-        result = re.sub(r'\s+', ' ', result)
-        
-        return result
\ No newline at end of file
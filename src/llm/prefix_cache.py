@@ -0,0 +1,85 @@
+"""KV cache dos prefixos fixos do prompt.
+
+Todo prompt do DialoGPT começa com o mesmo texto ("Sobre mobile:" quando há
+contexto, "Usuário:" sem contexto). O KV cache desses prefixos é calculado uma
+vez, quando o modelo é carregado, e cada geração começa de uma cópia dele: só
+os tokens depois do prefixo passam pelo modelo no prefill.
+"""
+import copy
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Prefixos pré-calculados por padrão; o maior que casar com o prompt é usado
+STATIC_PREFIXES = ("Sobre mobile:", "Usuário:")
+
+
+class StaticPrefixCache:
+    """KV caches de prefixos fixos, somente leitura; ``seed`` entrega cópias."""
+
+    def __init__(self, entries: Sequence[Tuple[List[int], object]]):
+        # Maior prefixo primeiro: "Sobre mobile: ..." pode começar com outro prefixo
+        self._entries = sorted(entries, key=lambda e: -len(e[0]))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    @classmethod
+    def build(cls, model, tokenizer, prefixes: Sequence[str], device: str) -> 'StaticPrefixCache':
+        """Roda o prefill de cada prefixo uma única vez."""
+        import torch
+
+        entries = []
+        for text in prefixes:
+            ids = tokenizer(text, add_special_tokens=False)['input_ids']
+            if not ids:
+                continue
+            with torch.no_grad():
+                out = model(input_ids=torch.tensor([ids], device=torch.device(device)), use_cache=True)
+            entries.append((ids, out.past_key_values))
+        return cls(entries)
+
+    @property
+    def prefixes(self) -> List[List[int]]:
+        return [ids for ids, _ in self._entries]
+
+    def _find(self, ids: Sequence[int]) -> Optional[Tuple[List[int], object]]:
+        # Ao menos um token de ``ids`` precisa ficar de fora para a geração
+        for prefix, past in self._entries:
+            if len(prefix) < len(ids) and list(ids[:len(prefix)]) == prefix:
+                return prefix, past
+        return None
+
+    def match(self, ids: Sequence[int]) -> int:
+        """Tamanho do maior prefixo com que ``ids`` começa (0 se nenhum)."""
+        found = self._find(ids)
+        return len(found[0]) if found else 0
+
+    def seed(self, ids: Sequence[int], copies: int = 1) -> Tuple[Optional[object], int]:
+        """Cópia do KV cache do prefixo de ``ids`` e quantos tokens ela cobre.
+
+        ``copies`` repete o cache no eixo do lote (linhas x feixes do beam
+        search), pois ``generate`` não expande um ``past_key_values`` recebido.
+        """
+        found = self._find(ids)
+        with self._lock:
+            if found:
+                self.hits += 1
+                self.reused_tokens += len(found[0]) * copies
+            else:
+                self.misses += 1
+        if not found:
+            return None, 0
+        past = copy.deepcopy(found[1])
+        if copies > 1:
+            past.batch_repeat_interleave(copies)  # type: ignore
+        return past, len(found[0])
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'prefixes': len(self._entries),
+            'prefix_tokens': sum(len(ids) for ids, _ in self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reused_tokens': self.reused_tokens,
+        }
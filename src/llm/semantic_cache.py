@@ -0,0 +1,106 @@
+"""Cache semântico de respostas para perguntas quase iguais.
+
+Paráfrases ("diferença entre flutter e react native" / "React Native vs
+Flutter?") não batem no cache exato, mas têm embeddings muito próximos. Aqui
+os embeddings das perguntas já respondidas ficam numa matriz normalizada; uma
+pergunta nova reaproveita a resposta quando a similaridade de cosseno passa do
+limiar e a recuperação trouxe exatamente os mesmos chunks.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype='float32').reshape(-1)
+    return v / max(float(np.linalg.norm(v)), 1e-12)
+
+
+class SemanticAnswerCache:
+    """Até ``capacity`` respostas; ao encher, sai a usada há mais tempo.
+
+    ``false_hits`` conta perguntas que passaram do limiar mas recuperaram
+    chunks diferentes: teriam recebido a resposta de outra pergunta.
+    """
+
+    def __init__(self, threshold: float = 0.92, capacity: int = 1024):
+        self.threshold = threshold
+        self.capacity = capacity
+        self._vectors: Optional[np.ndarray] = None
+        self._keys: List[Tuple[Tuple[int, ...], str]] = []
+        self._answers: List[str] = []
+        self._last_used = np.zeros(capacity, dtype='int64')
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.false_hits = 0
+        self.evictions = 0
+
+    def get(self, embedding: np.ndarray, chunk_ids: Tuple[int, ...], generation: str) -> Optional[str]:
+        """Resposta de uma pergunta similar com os mesmos chunks e parâmetros de geração."""
+        query = _normalize(embedding)
+        with self._lock:
+            n = len(self._answers)
+            if n == 0:
+                self.misses += 1
+                return None
+            sims = self._vectors[:n] @ query  # type: ignore
+            near = np.flatnonzero(sims >= self.threshold)
+            for row in near[np.argsort(-sims[near])]:
+                if self._keys[row] == (tuple(chunk_ids), generation):
+                    self._touch(int(row))
+                    self.hits += 1
+                    return self._answers[row]
+            if len(near):
+                self.false_hits += 1
+            self.misses += 1
+            return None
+
+    def put(self, embedding: np.ndarray, chunk_ids: Tuple[int, ...], generation: str, answer: str):
+        query = _normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, len(query)), dtype='float32')
+            if len(self._answers) < self.capacity:
+                row = len(self._answers)
+                self._keys.append(None)  # type: ignore
+                self._answers.append('')
+            else:
+                row = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vectors[row] = query
+            self._keys[row] = (tuple(chunk_ids), generation)
+            self._answers[row] = answer
+            self._touch(row)
+
+    def _touch(self, row: int):
+        self._clock += 1
+        self._last_used[row] = self._clock
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._answers.clear()
+            self._last_used[:] = 0
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'entries': len(self._answers),
+            'capacity': self.capacity,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'false_hits': self.false_hits,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
@@ -0,0 +1,132 @@
+"""KV cache (``past_key_values``) por sessão de conversa.
+
+Entre turnos o prompt da sessão cresce só no final: histórico já visto +
+contexto e pergunta novos. Cada turno gerado fica registrado com os tokens que
+o modelo de fato processou (contexto e resposta crua), então o prompt seguinte
+começa exatamente com os tokens do cache. Só os tokens depois do maior prefixo
+comum passam pelo modelo; o cache é cortado nesse ponto, e qualquer divergência
+(histórico truncado ou editado, resposta trocada pelo fallback) apenas reduz o
+reaproveitamento.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from rag.request import Turn
+
+
+def common_prefix_len(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+def crop_cache(past, length: int):
+    """Mantém só os primeiros ``length`` tokens do KV cache."""
+    extra = past.get_seq_length() - length
+    if extra > 0:
+        past.crop(-extra)
+
+
+def cache_nbytes(past) -> int:
+    """Memória ocupada pelas chaves e valores de um ``DynamicCache``."""
+    layers = getattr(past, 'layers', None)
+    if layers is not None:
+        tensors = [t for layer in layers for t in (layer.keys, layer.values) if t is not None]
+    else:
+        tensors = list(getattr(past, 'key_cache', [])) + list(getattr(past, 'value_cache', []))
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+@dataclass
+class SessionEntry:
+    ids: List[int]  # tokens cobertos por ``past``
+    past: object
+    window_start: int = 0  # primeiro turno do histórico ainda presente no prompt
+    # Índice no histórico -> (turno, tokens com que foi processado)
+    turns: Dict[int, Tuple[Turn, List[int]]] = field(default_factory=dict)
+    nbytes: int = 0
+
+
+class SessionKVCache:
+    """KV caches por sessão, com limite por sessão e LRU entre sessões.
+
+    Uma sessão acima de ``max_session_bytes`` tem o cache cortado (o início
+    do prompt continua reaproveitável); acima de ``max_bytes`` no total, as
+    sessões usadas há mais tempo são descartadas.
+    """
+
+    def __init__(self, max_session_bytes: int = 64 * 1024 * 1024, max_bytes: int = 512 * 1024 * 1024):
+        self.max_session_bytes = max_session_bytes
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        self.computed_tokens = 0
+
+    def take(self, session_id: str) -> Optional[SessionEntry]:
+        """Retira a entrada da sessão; quem a usa devolve a nova com ``put``."""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._bytes -= entry.nbytes
+            self.hits += 1
+            return entry
+
+    def put(self, session_id: str, entry: SessionEntry):
+        entry.nbytes = cache_nbytes(entry.past)
+        if entry.nbytes > self.max_session_bytes and entry.ids:
+            keep = int(len(entry.ids) * self.max_session_bytes // entry.nbytes)
+            if keep <= 0:
+                return
+            crop_cache(entry.past, keep)
+            entry.ids = entry.ids[:keep]
+            entry.nbytes = cache_nbytes(entry.past)
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[session_id] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def record(self, reused: int, computed: int):
+        with self._lock:
+            self.reused_tokens += reused
+            self.computed_tokens += computed
+
+    def drop(self, session_id: str):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.reused_tokens + self.computed_tokens
+        return {
+            'sessions': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'max_session_bytes': self.max_session_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'reused_tokens': self.reused_tokens,
+            'computed_tokens': self.computed_tokens,
+            'reuse_rate': self.reused_tokens / total if total else 0.0,
+        }
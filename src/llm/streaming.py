@@ -0,0 +1,63 @@
+"""Geração em streaming: texto entregue aos poucos, com tempo até o primeiro token.
+
+``model.generate`` roda numa thread e publica os tokens num
+``TextIteratorStreamer``; quem consome o ``TokenStream`` recebe pedaços de
+texto já polidos assim que são validados.
+"""
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+# Espera máxima por um novo token antes de desistir da geração
+STREAM_TIMEOUT_SECONDS = 60
+
+
+class TokenStream:
+    """Iterador de pedaços de texto de uma resposta.
+
+    Ao final, ``ttft_seconds`` é o tempo até o primeiro pedaço, ``total_seconds``
+    o tempo total e ``text`` a resposta completa. ``fallback`` indica que a
+    resposta veio do RAG puro, ``cached`` que veio de um dos caches e
+    ``timed_out`` que o prazo do pedido acabou antes do fim da geração.
+    """
+
+    def __init__(self, produce: Callable[['TokenStream'], Iterator[str]]):
+        self._produce = produce
+        self.start = time.perf_counter()
+        self.ttft_seconds: Optional[float] = None
+        self.total_seconds: Optional[float] = None
+        self.text = ''
+        self.fallback = False
+        self.cached = False
+        self.timed_out = False
+
+    def __iter__(self) -> Iterator[str]:
+        for piece in self._produce(self):
+            if not piece:
+                continue
+            if self.ttft_seconds is None:
+                self.ttft_seconds = time.perf_counter() - self.start
+            self.text += piece
+            yield piece
+        self.total_seconds = time.perf_counter() - self.start
+
+    def stats(self) -> dict:
+        return {
+            'ttft_ms': None if self.ttft_seconds is None else round(self.ttft_seconds * 1000, 1),
+            'total_ms': None if self.total_seconds is None else round(self.total_seconds * 1000, 1),
+            'fallback': self.fallback,
+            'cached': self.cached,
+            'timed_out': self.timed_out,
+        }
+
+
+def event_stopping_criteria(event: threading.Event):
+    """StoppingCriteriaList que interrompe a geração quando ``event`` é acionado."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class EventStop(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([EventStop()])
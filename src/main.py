@@ -1,17 +1,11 @@
 """Ponto de entrada simples para o chatbot RAG."""
-import os
-from rag.retriever import Retriever
-from llm.model import HuggingFaceLLM
-
-DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'dsm_material.txt')
+from api.service import ChatService
+from rag.request import Turn
 
 
 def main():
     print("DSM Chatbot - RAG + Hugging Face")
-    retriever = Retriever()
-    retriever.build_index_if_needed(DATA_PATH)
-
-    llm = HuggingFaceLLM(model_name="microsoft/DialoGPT-small")
+    service = ChatService.create()
 
     history = []
     while True:
@@ -20,26 +14,16 @@ def main():
             print("Encerrando...")
             break
 
-        contexts = retriever.retrieve(user, top_k=3)
-        
-        # Construir prompt simples
-        prompt = f"Conversa sobre desenvolvimento mobile:\n\n"
-        for h in history[-3:]:  # Últimas 3 interações
-            prompt += f"Usuário: {h['user']}\nBot: {h['bot']}\n\n"
-        
-        if contexts:
-            prompt += "Informações relevantes:\n"
-            for ctx in contexts:
-                prompt += f"• {ctx}\n"
-            prompt += "\n"
-        
-        prompt += f"Usuário: {user}\nBot:"
-        
-        response = llm.generate(prompt)
-
-        print("Bot:", response)
-        history.append({"user": user, "bot": response})
+        # O histórico da sessão vai junto com a pergunta e os chunks recuperados;
+        # o KV cache da sessão evita reprocessar os turnos anteriores e a
+        # resposta aparece conforme é gerada
+        _, _, stream = service.stream(user, history, session_id="cli")
+        print("Bot:", end=" ", flush=True)
+        for piece in stream:
+            print(piece, end="", flush=True)
+        print(f"\n   (primeiro token em {stream.ttft_seconds or 0:.2f}s, total {stream.total_seconds:.2f}s)")
+        history.append(Turn(user, stream.text))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
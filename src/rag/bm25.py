@@ -0,0 +1,125 @@
+"""Índice léxico BM25 sobre os chunks, sem depender do modelo de embeddings."""
+import json
+import os
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Palavras muito frequentes nas perguntas que não ajudam a ranquear
+STOPWORDS = frozenset('''
+a ao aos as com como da das de do dos e é em entre na nas no nos o os ou para pela pelo
+por qual quais que se sem sobre um uma uns umas usar uso quando onde the of and to in is
+'''.split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Índice invertido em arrays (estilo CSR): termo -> (docs, frequências).
+
+    Os ids dos documentos são as posições no chunk store, os mesmos usados
+    pelo índice FAISS.
+    """
+
+    def __init__(self, vocab: dict, offsets: np.ndarray, docs: np.ndarray, tfs: np.ndarray,
+                 doc_len: np.ndarray, k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        live_len = doc_len[doc_len > 0]
+        self.n_docs = len(live_len)
+        self.avg_len = float(live_len.mean()) if len(live_len) else 1.0
+        df = np.diff(offsets)
+        self.idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5)).astype('float32')
+
+    @classmethod
+    def build(cls, texts: Iterable[Optional[str]], k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        """Constrói o índice; ``None`` marca documentos removidos (ficam sem postings)."""
+        vocab = {}
+        # Arrays compactos em vez de uma lista de tuplas: ~20 bytes por posting
+        term_col, doc_col, tf_col = array('q'), array('q'), array('f')
+        doc_len = array('f')
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text) if text else []
+            doc_len.append(len(tokens))
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                term_col.append(vocab.setdefault(tok, len(vocab)))
+                doc_col.append(doc_id)
+                tf_col.append(tf)
+
+        term_ids = np.frombuffer(term_col, dtype='int64') if term_col else np.zeros(0, dtype='int64')
+        order = np.argsort(term_ids, kind='stable')  # docs já estão em ordem crescente
+        docs = (np.frombuffer(doc_col, dtype='int64') if doc_col else np.zeros(0, dtype='int64'))[order]
+        tfs = (np.frombuffer(tf_col, dtype='float32') if tf_col else np.zeros(0, dtype='float32'))[order]
+        offsets = np.zeros(len(vocab) + 1, dtype='int64')
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+        return cls(vocab, offsets, docs, tfs, np.array(doc_len, dtype='float32'), k1, b)
+
+    def search(self, query: str, top_k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (scores, ids) dos ``top_k`` melhores documentos, em ordem decrescente."""
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not term_ids:
+            return np.zeros(0, dtype='float32'), np.zeros(0, dtype='int64')
+
+        docs = np.concatenate([self.docs[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        tfs = np.concatenate([self.tfs[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        idf = np.concatenate([np.full(self.offsets[t + 1] - self.offsets[t], self.idf[t]) for t in term_ids])
+
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[docs] / self.avg_len)
+        contrib = idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        # Soma as contribuições por documento tocando só as postings dos termos da consulta
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib).astype('float32')
+
+        k = min(top_k, len(unique_docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return scores[top], unique_docs[top]
+
+    def save(self, prefix: str):
+        # Arquivos temporários + os.replace: um leitor nunca vê um arquivo pela metade
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(f'{prefix}.npz.tmp', 'wb') as f:
+            np.savez(f, offsets=self.offsets, docs=self.docs, tfs=self.tfs, doc_len=self.doc_len)
+        with open(f'{prefix}.vocab.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'terms': terms, 'k1': self.k1, 'b': self.b}, f, ensure_ascii=False)
+        os.replace(f'{prefix}.npz.tmp', f'{prefix}.npz')
+        os.replace(f'{prefix}.vocab.json.tmp', f'{prefix}.vocab.json')
+
+    @classmethod
+    def load(cls, prefix: str) -> 'BM25Index':
+        with open(f'{prefix}.vocab.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = np.load(f'{prefix}.npz')
+        vocab = {term: i for i, term in enumerate(meta['terms'])}
+        return cls(vocab, arrays['offsets'], arrays['docs'], arrays['tfs'], arrays['doc_len'],
+                   meta['k1'], meta['b'])
+
+
+def reciprocal_rank_scores(rankings: List[Iterable[int]], k: int = 60) -> Dict[int, float]:
+    """Score RRF de cada id: soma de 1 / (k + posição) nas listas ordenadas."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[int(doc_id)] = scores.get(int(doc_id), 0.0) + 1.0 / (k + rank + 1)
+    return scores
+
+
+def reciprocal_rank_fusion(rankings: List[Iterable[int]], k: int = 60) -> List[int]:
+    """Combina listas ordenadas de ids pela soma de 1 / (k + posição)."""
+    scores = reciprocal_rank_scores(rankings, k)
+    return sorted(scores, key=lambda d: -scores[d])
@@ -0,0 +1,209 @@
+"""Armazenamento compacto dos chunks indexados.
+
+Cada campo de texto é gravado como um único blob UTF-8 (``<prefixo>.<campo>.bin``)
+mais um array de offsets int64 (``<prefixo>.<campo>.offsets.npy``); campos
+numéricos por chunk ficam em ``<prefixo>.<campo>.npy``. Tudo pode ser mapeado
+em memória, e a posição do chunk no store é o id usado no índice FAISS.
+"""
+import json
+import os
+import shutil
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class TextColumn:
+    """Sequência de strings em um blob UTF-8 com offsets."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> 'TextColumn':
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype='uint8')
+        return cls(blob, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def concat(self, other: 'TextColumn') -> 'TextColumn':
+        offsets = np.concatenate([self.offsets[:-1], other.offsets + self.offsets[-1]])
+        return TextColumn(np.concatenate([self.blob, other.blob]), offsets)
+
+    def select(self, rows: np.ndarray) -> 'TextColumn':
+        return TextColumn.from_strings(self[int(i)] for i in rows)
+
+
+class ChunkStore:
+    """Textos dos chunks e campos opcionais, acessíveis em O(1) pelo id do FAISS.
+
+    Chunks removidos em atualizações incrementais continuam no store com
+    ``live=False`` até a próxima compactação.
+    """
+
+    def __init__(self, texts: Dict[str, TextColumn], columns: Dict[str, np.ndarray]):
+        self.texts = texts
+        self.columns = columns
+
+    @classmethod
+    def from_chunks(cls, texts: List[str], text_fields: Optional[Dict[str, List[str]]] = None,
+                    **columns) -> 'ChunkStore':
+        text_columns = {'text': TextColumn.from_strings(texts)}
+        for name, values in (text_fields or {}).items():
+            text_columns[name] = TextColumn.from_strings(values)
+        arrays = {name: np.asarray(values) for name, values in columns.items()}
+        arrays.setdefault('live', np.ones(len(texts), dtype=bool))
+        return cls(text_columns, arrays)
+
+    def __len__(self) -> int:
+        return len(self.texts['text'])
+
+    def text(self, i: int, field: str = 'text') -> str:
+        return self.texts[field][i]
+
+    def get(self, i: int, field: str):
+        return self.columns[field][i]
+
+    def is_live(self, i: int) -> bool:
+        return 0 <= i < len(self) and bool(self.columns['live'][i])
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.columns['live'])
+
+    def append(self, other: 'ChunkStore') -> 'ChunkStore':
+        texts = {name: col.concat(other.texts[name]) for name, col in self.texts.items()}
+        columns = {name: np.concatenate([arr, other.columns[name]]) for name, arr in self.columns.items()}
+        return ChunkStore(texts, columns)
+
+    def delete(self, rows: Iterable[int]) -> 'ChunkStore':
+        live = np.array(self.columns['live'], dtype=bool, copy=True)
+        live[list(rows)] = False
+        return ChunkStore(self.texts, dict(self.columns, live=live))
+
+    def select(self, rows: np.ndarray) -> 'ChunkStore':
+        """Novo store apenas com as linhas pedidas (usado na compactação)."""
+        texts = {name: col.select(rows) for name, col in self.texts.items()}
+        columns = {name: np.asarray(arr)[rows] for name, arr in self.columns.items()}
+        return ChunkStore(texts, columns)
+
+    def save(self, prefix: str):
+        # Cada arquivo é gravado num temporário e renomeado, para não truncar
+        # arquivos que outros processos mantêm mapeados em memória
+        for name, col in self.texts.items():
+            _atomic_write(f'{prefix}.{name}.bin', lambda f, col=col: f.write(col.blob.tobytes()))
+            _atomic_write(f'{prefix}.{name}.offsets.npy', lambda f, col=col: np.save(f, col.offsets))
+        for name, arr in self.columns.items():
+            _atomic_write(f'{prefix}.{name}.npy', lambda f, arr=arr: np.save(f, arr))
+        schema = {'count': len(self), 'text_fields': list(self.texts), 'columns': list(self.columns)}
+        _atomic_write(f'{prefix}.json', lambda f: f.write(json.dumps(schema, indent=2).encode('utf-8')))
+
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = False) -> 'ChunkStore':
+        with open(f'{prefix}.json', 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+        mmap_mode = 'r' if mmap else None
+
+        texts = {}
+        for name in schema['text_fields']:
+            blob_path = f'{prefix}.{name}.bin'
+            if os.path.getsize(blob_path) == 0:
+                blob = np.zeros(0, dtype='uint8')
+            elif mmap:
+                blob = np.memmap(blob_path, dtype='uint8', mode='r')
+            else:
+                blob = np.fromfile(blob_path, dtype='uint8')
+            texts[name] = TextColumn(blob, np.load(f'{prefix}.{name}.offsets.npy', mmap_mode=mmap_mode))
+        columns = {name: np.load(f'{prefix}.{name}.npy', mmap_mode=mmap_mode) for name in schema['columns']}
+        return cls(texts, columns)
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(f'{prefix}.json')
+
+
+class NpyWriter:
+    """Grava um array .npy incrementalmente, lote a lote.
+
+    Os lotes vão para um arquivo bruto temporário; ``close`` escreve o
+    cabeçalho com o shape final e copia os dados em blocos.
+    """
+
+    def __init__(self, path: str, dtype, row_shape: tuple = ()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self._raw = open(path + '.raw', 'wb')
+
+    def append(self, values):
+        arr = np.ascontiguousarray(values, dtype=self.dtype)
+        if not self.row_shape and arr.ndim > 1:
+            self.row_shape = arr.shape[1:]
+        self._raw.write(arr.tobytes())
+        self.rows += len(arr)
+
+    def close(self):
+        self._raw.close()
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                  'shape': (self.rows,) + self.row_shape}
+        with open(self.path + '.tmp', 'wb') as out, open(self.path + '.raw', 'rb') as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 1 << 20)
+        os.remove(self.path + '.raw')
+        os.replace(self.path + '.tmp', self.path)
+
+
+class ChunkStoreWriter:
+    """Escreve um ChunkStore em streaming, sem manter os textos em memória."""
+
+    def __init__(self, prefix: str, text_fields: Iterable[str] = (), columns: Optional[Dict[str, str]] = None):
+        self.prefix = prefix
+        self.count = 0
+        self._text_fields = ['text'] + [f for f in text_fields if f != 'text']
+        self._blobs = {name: open(f'{prefix}.{name}.bin.tmp', 'wb') for name in self._text_fields}
+        self._sizes = {name: 0 for name in self._text_fields}
+        self._offsets = {name: NpyWriter(f'{prefix}.{name}.offsets.npy', 'int64') for name in self._text_fields}
+        for writer in self._offsets.values():
+            writer.append([0])
+        columns = dict(columns or {})
+        columns.setdefault('live', 'bool')
+        self._columns = {name: NpyWriter(f'{prefix}.{name}.npy', dtype) for name, dtype in columns.items()}
+
+    def append(self, texts: List[str], text_fields: Optional[Dict[str, List[str]]] = None, **columns):
+        fields = dict(text_fields or {}, text=texts)
+        for name in self._text_fields:
+            encoded = [t.encode('utf-8') for t in fields[name]]
+            lengths = np.cumsum([len(b) for b in encoded], dtype='int64') + self._sizes[name]
+            self._blobs[name].write(b''.join(encoded))
+            self._offsets[name].append(lengths)
+            if len(lengths):
+                self._sizes[name] = int(lengths[-1])
+        columns.setdefault('live', np.ones(len(texts), dtype=bool))
+        for name, writer in self._columns.items():
+            writer.append(columns[name])
+        self.count += len(texts)
+
+    def close(self):
+        for name in self._text_fields:
+            self._blobs[name].close()
+            os.replace(f'{self.prefix}.{name}.bin.tmp', f'{self.prefix}.{name}.bin')
+            self._offsets[name].close()
+        for writer in self._columns.values():
+            writer.close()
+        schema = {'count': self.count, 'text_fields': self._text_fields, 'columns': list(self._columns)}
+        _atomic_write(f'{self.prefix}.json', lambda f: f.write(json.dumps(schema, indent=2).encode('utf-8')))
+
+
+def _atomic_write(path: str, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
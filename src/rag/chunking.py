@@ -1,15 +1,39 @@
 """Funções para chunking de texto."""
+from itertools import islice
+from typing import Iterable, Iterator, List
 
-def simple_chunk_text(text: str, max_words: int = 150):
-    text = text.replace('\r\n', '\n')
-    paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
-    chunks = []
-    for p in paragraphs:
+
+def iter_chunks(lines: Iterable[str], max_words: int = 150) -> Iterator[str]:
+    """Gera os chunks linha a linha, sem materializar o texto inteiro."""
+    for line in lines:
+        p = line.strip()
+        if not p:
+            continue
         words = p.split()
         if len(words) <= max_words:
-            chunks.append(p)
+            yield p
         else:
             for i in range(0, len(words), max_words):
                 slice_words = words[i:i+max_words]
-                chunks.append(' '.join(slice_words))
-    return chunks
\ No newline at end of file
+                yield ' '.join(slice_words)
+
+
+def iter_file_chunks(path: str, max_words: int = 150) -> Iterator[str]:
+    """Lê o arquivo incrementalmente e gera seus chunks."""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_chunks(f, max_words=max_words)
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Agrupa um iterável em listas de até ``size`` itens."""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def simple_chunk_text(text: str, max_words: int = 150):
+    text = text.replace('\r\n', '\n')
+    return list(iter_chunks(text.split('\n'), max_words=max_words))
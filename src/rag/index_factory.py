@@ -0,0 +1,157 @@
+"""Construção dos índices FAISS suportados pelo Retriever.
+
+Tipos disponíveis:
+- ``flat``: busca exata (IndexFlatL2), padrão.
+- ``ivf_flat``: IVF com vetores completos; parâmetros ``nlist`` e ``nprobe``.
+- ``hnsw``: grafo HNSW; parâmetros ``M``, ``ef_construction`` e ``ef_search``.
+- ``ivf_pq``: IVF com product quantization; ``nlist``, ``nprobe``, ``pq_m`` e ``pq_nbits``.
+
+A precisão (``float32``, ``float16`` ou ``int8``) define como os vetores são
+guardados: ``float16`` e ``int8`` usam o scalar quantizer do FAISS (SQfp16 /
+SQ8) no lugar dos vetores float32. No ``ivf_pq`` os códigos já são
+quantizados e a precisão não se aplica.
+
+Todos são embrulhados em ``IndexIDMap2``, de modo que os ids são as posições
+dos chunks no chunk store. O ``faiss`` só é importado quando um índice é
+criado ou lido: as funções de configuração não dependem dele.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+PRECISIONS = ('float32', 'float16', 'int8')
+
+# Sufixo do factory string do FAISS para os vetores de cada precisão
+_STORAGE = {'float32': 'Flat', 'float16': 'SQfp16', 'int8': 'SQ8'}
+
+# Vetores usados para treinar IVF/PQ; acima disso o treino amostra o corpus
+TRAIN_SAMPLE_SIZE = 100_000
+
+DEFAULT_PARAMS = {
+    'flat': {},
+    'ivf_flat': {'nlist': None, 'nprobe': 8},
+    'hnsw': {'M': 32, 'ef_construction': 40, 'ef_search': 64},
+    'ivf_pq': {'nlist': None, 'nprobe': 8, 'pq_m': 16, 'pq_nbits': 8},
+}
+
+
+def resolve_params(index_type: str, params: Optional[dict] = None) -> dict:
+    """Combina os parâmetros informados com os padrões do tipo de índice."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f'Tipo de índice desconhecido: {index_type} (use um de {INDEX_TYPES})')
+    resolved = dict(DEFAULT_PARAMS[index_type])
+    unknown = set(params or {}) - set(resolved)
+    if unknown:
+        raise ValueError(f'Parâmetros inválidos para {index_type}: {sorted(unknown)}')
+    resolved.update(params or {})
+    return resolved
+
+
+def _nlist_for(n: int, requested: Optional[int]) -> int:
+    # Regra usual: ~4*sqrt(n) listas, sem exceder o número de vetores de treino
+    nlist = requested or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n))
+
+
+def check_precision(precision: str):
+    if precision not in PRECISIONS:
+        raise ValueError(f'Precisão desconhecida: {precision} (use uma de {PRECISIONS})')
+
+
+def create_index(dim: int, n: int, index_type: str = 'flat', params: Optional[dict] = None,
+                 precision: str = 'float32'):
+    """Cria o índice vazio; ``n`` (número esperado de vetores) dimensiona o IVF."""
+    import faiss
+
+    params = resolve_params(index_type, params)
+    check_precision(precision)
+    storage = _STORAGE[precision]
+
+    if index_type == 'flat':
+        description = f'IDMap2,{storage}'
+    elif index_type == 'ivf_flat':
+        description = f"IDMap2,IVF{_nlist_for(n, params['nlist'])},{storage}"
+    elif index_type == 'hnsw':
+        suffix = '' if precision == 'float32' else f'_{storage}'
+        description = f"IDMap2,HNSW{params['M']}{suffix}"
+    else:
+        pq_m = params['pq_m']
+        if dim % pq_m:
+            raise ValueError(f'pq_m={pq_m} precisa dividir a dimensão {dim}')
+        # PQ com 2^nbits centróides precisa de pelo menos esse número de vetores de treino
+        nbits = min(params['pq_nbits'], max(1, int(math.log2(max(n, 2)))))
+        description = f"IDMap2,IVF{_nlist_for(n, params['nlist'])},PQ{pq_m}x{nbits}"
+
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if index_type == 'hnsw':
+        faiss.downcast_index(index.index).hnsw.efConstruction = params['ef_construction']
+    configure_search(index, index_type, params)
+    return index
+
+
+def needs_training(index_type: str, precision: str = 'float32') -> bool:
+    return index_type in ('ivf_flat', 'ivf_pq') or precision == 'int8'
+
+
+def training_sample(embeddings: np.ndarray, max_rows: int = TRAIN_SAMPLE_SIZE) -> np.ndarray:
+    """Amostra de treino; lê só as linhas sorteadas quando ``embeddings`` é um memmap."""
+    if len(embeddings) <= max_rows:
+        return np.ascontiguousarray(embeddings, dtype='float32')
+    rows = np.sort(np.random.default_rng(0).choice(len(embeddings), max_rows, replace=False))
+    return np.ascontiguousarray(embeddings[rows], dtype='float32')
+
+
+def build_index(embeddings: np.ndarray, ids: np.ndarray, index_type: str = 'flat',
+                params: Optional[dict] = None, precision: str = 'float32'):
+    """Cria, treina (quando necessário) e popula um índice do tipo pedido."""
+    n, dim = embeddings.shape
+    index = create_index(dim, n, index_type, params, precision)
+    if not index.is_trained:
+        index.train(training_sample(embeddings))  # type: ignore
+    index.add_with_ids(np.ascontiguousarray(embeddings, dtype='float32'), ids.astype('int64'))  # type: ignore
+    return index
+
+
+def configure_search(index, index_type: str, params: Optional[dict] = None):
+    """Aplica os parâmetros de busca (nprobe / efSearch) a um índice carregado."""
+    import faiss
+
+    params = resolve_params(index_type, params)
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        faiss.extract_index_ivf(index).nprobe = params['nprobe']
+    elif index_type == 'hnsw':
+        inner = index.index if isinstance(index, faiss.IndexIDMap) else index
+        faiss.downcast_index(inner).hnsw.efSearch = params['ef_search']
+
+
+def supports_removal(index_type: str) -> bool:
+    """HNSW não permite remover vetores; nesses casos o índice é reconstruído."""
+    return index_type != 'hnsw'
+
+
+def index_nbytes(index) -> int:
+    """Tamanho do índice serializado, usado como estimativa de memória."""
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def mmap_flags(index_type: str) -> int:
+    """Flags de leitura que mapeiam o índice em memória em vez de copiá-lo.
+
+    Índices IVF mapeiam as listas invertidas; flat e HNSW mapeiam os códigos
+    dos vetores. O índice mapeado é somente leitura: não adicione nem remova ids.
+    """
+    import faiss
+
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        return faiss.IO_FLAG_MMAP
+    return faiss.IO_FLAG_MMAP_IFC
+
+
+def storage_dtype(precision: str) -> np.dtype:
+    """Tipo do ``embeddings.npy`` em disco: float32, ou float16 nas precisões reduzidas."""
+    check_precision(precision)
+    return np.dtype('float32' if precision == 'float32' else 'float16')
@@ -0,0 +1,169 @@
+"""Ingestão paralela de um diretório de documentos em shards.
+
+Os arquivos são divididos em shards de tamanho parecido; cada shard é
+chunkado e embedado em um processo separado, com a mesma precisão de
+inferência do Retriever, gravando seu próprio chunk store e
+``embeddings.npy``. Os shards não têm índice próprio: o Retriever os percorre
+em ordem e constrói um único índice (ver ``Retriever.build_index_if_needed``),
+o mesmo que uma ingestão em um só processo produziria.
+"""
+import fnmatch
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.chunk_store import ChunkStore, ChunkStoreWriter, NpyWriter
+from rag.chunking import batched, iter_file_chunks
+from rag.manifest import chunk_hash, file_sha256
+from utils.inference import load_with_precision
+
+DEFAULT_PATTERNS = ('*.txt', '*.md')
+
+
+def list_corpus_files(root: str, patterns: Sequence[str] = DEFAULT_PATTERNS) -> List[str]:
+    """Arquivos do corpus em ordem estável, percorrendo subdiretórios."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if any(fnmatch.fnmatch(name, p) for p in patterns):
+                paths.append(os.path.join(dirpath, name))
+    return paths
+
+
+def corpus_sha256(root: str, paths: Sequence[str]) -> str:
+    """Hash do corpus inteiro: caminhos relativos mais o hash de cada arquivo."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.relpath(path, root).encode('utf-8'))
+        h.update(file_sha256(path).encode('ascii'))
+    return h.hexdigest()
+
+
+def partition_files(paths: Sequence[str], n_shards: int) -> List[List[str]]:
+    """Distribui os arquivos em shards de tamanho total parecido (guloso por tamanho)."""
+    shards: List[List[str]] = [[] for _ in range(max(1, min(n_shards, len(paths))))]
+    sizes = [0] * len(shards)
+    for path in sorted(paths, key=os.path.getsize, reverse=True):
+        i = sizes.index(min(sizes))
+        shards[i].append(path)
+        sizes[i] += os.path.getsize(path)
+    for shard in shards:
+        shard.sort()
+    return shards
+
+
+_empty_embedder_lock = threading.Lock()
+
+
+def _empty_embedder(embed_model_name: str, device: Optional[str]):
+    """SentenceTransformer com a estrutura do modelo, sem ler os pesos do checkpoint.
+
+    O sentence-transformers só monta o transformer com ``from_pretrained``; aqui
+    o ``_load_model`` do módulo Transformer usa ``from_config`` durante a
+    construção. Tokenizer, pooling e normalização são lidos normalmente.
+    """
+    from sentence_transformers import SentenceTransformer
+    from transformers import AutoModel, PretrainedConfig
+    try:
+        from sentence_transformers.base.modules.transformer import Transformer
+    except ImportError:  # sentence-transformers < 6
+        from sentence_transformers.models import Transformer
+
+    def load_from_config(self, *args, **kwargs):
+        config = next(a for a in (*args, *kwargs.values()) if isinstance(a, PretrainedConfig))
+        return AutoModel.from_config(config)
+
+    with _empty_embedder_lock:
+        original = Transformer._load_model
+        Transformer._load_model = load_from_config
+        try:
+            return SentenceTransformer(embed_model_name, device=device)
+        finally:
+            Transformer._load_model = original
+
+
+def load_embedder(embed_model_name: str, inference_precision: str = 'float32',
+                  cache_dir: Optional[str] = None):
+    """SentenceTransformer com a precisão de inferência (Retriever e workers da ingestão)."""
+    from sentence_transformers import SentenceTransformer
+    # Modelos int8 (quantização dinâmica) só rodam em CPU
+    device = 'cpu' if inference_precision == 'int8' else None
+    return load_with_precision(lambda: SentenceTransformer(embed_model_name, device=device),
+                               inference_precision, embed_model_name, cache_dir,
+                               build_empty=lambda: _empty_embedder(embed_model_name, device))
+
+
+def _init_worker(threads: int):
+    # Evita que N processos disputem todos os núcleos com threads do torch
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _build_shard(task: Tuple[str, str, List[str], str, str, Optional[str], int, int]) -> Tuple[str, int]:
+    root, shard_dir, paths, embed_model_name, inference_precision, cache_dir, chunk_max_words, batch_size = task
+    embedder = load_embedder(embed_model_name, inference_precision, cache_dir)
+    os.makedirs(shard_dir, exist_ok=True)
+    store_writer = ChunkStoreWriter(os.path.join(shard_dir, 'chunks'), text_fields=['source'],
+                                    columns={'hash': 'S40'})
+    emb_writer = NpyWriter(os.path.join(shard_dir, 'embeddings.npy'), 'float32')
+
+    def chunks_with_source():
+        for path in paths:
+            source = os.path.relpath(path, root)
+            for chunk in iter_file_chunks(path, max_words=chunk_max_words):
+                yield chunk, source
+
+    for batch in batched(chunks_with_source(), batch_size):
+        texts = [c for c, _ in batch]
+        embs = embedder.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+        store_writer.append(texts, text_fields={'source': [s for _, s in batch]},
+                            hash=np.array([chunk_hash(c) for c in texts], dtype='S40'))
+        emb_writer.append(embs)
+    store_writer.close()
+    emb_writer.close()
+    return shard_dir, store_writer.count
+
+
+def build_shards(root: str, paths: Sequence[str], shard_root: str, embed_model_name: str,
+                 chunk_max_words: int = 150, batch_size: int = 256, workers: int = 0,
+                 n_shards: int = 0, inference_precision: str = 'float32',
+                 cache_dir: Optional[str] = None) -> List[str]:
+    """Chunka e embeda os shards em paralelo; retorna os diretórios dos shards não vazios.
+
+    ``inference_precision`` e ``cache_dir`` são os do Retriever: os workers
+    embedam com a mesma precisão e compartilham o cache de modelos int8.
+    """
+    workers = workers or os.cpu_count() or 1
+    groups = partition_files(paths, n_shards or workers)
+    tasks = [
+        (root, os.path.join(shard_root, f'shard-{i:04d}'), group, embed_model_name, inference_precision,
+         cache_dir, chunk_max_words, batch_size)
+        for i, group in enumerate(groups)
+    ]
+    workers = min(workers, len(tasks))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    print(f'Ingerindo {len(paths)} arquivos em {len(tasks)} shards com {workers} processos...')
+    # spawn: processos filhos não herdam o estado de threads do torch do processo pai
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(threads,)) as pool:
+        results = list(pool.map(_build_shard, tasks))
+    return [shard_dir for shard_dir, count in results if count]
+
+
+def iter_shard_batches(shard_dirs: Sequence[str], batch_size: int) -> Iterator[Tuple[List[str], List[str], np.ndarray]]:
+    """Percorre os shards em ordem, gerando (textos, fontes, embeddings) por bloco."""
+    for shard_dir in shard_dirs:
+        store = ChunkStore.load(os.path.join(shard_dir, 'chunks'), mmap=True)
+        embeddings = np.load(os.path.join(shard_dir, 'embeddings.npy'), mmap_mode='r')
+        for start in range(0, len(store), batch_size):
+            rows = range(start, min(start + batch_size, len(store)))
+            yield ([store.text(i) for i in rows], [store.text(i, 'source') for i in rows],
+                   np.ascontiguousarray(embeddings[start:start + len(rows)], dtype='float32'))
@@ -0,0 +1,59 @@
+"""Manifesto do índice: registra como o índice em cache foi construído."""
+import hashlib
+import json
+import os
+from typing import Optional
+
+MANIFEST_VERSION = 2
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hash SHA-256 do arquivo, lido em blocos."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    """Hash de conteúdo de um chunk, usado para detectar o que mudou."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def load_manifest(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path: str, manifest: dict):
+    manifest = dict(manifest, version=MANIFEST_VERSION)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_compatible(manifest: Optional[dict], chunker: dict, model_name: str) -> bool:
+    """Indica se o índice existente pode ser reaproveitado (mesmo chunker e modelo)."""
+    return (
+        manifest is not None
+        and manifest.get('chunker') == chunker
+        and manifest.get('embed_model') == model_name
+    )
+
+
+def manifest_fingerprint(manifest: Optional[dict]) -> str:
+    """Identifica um índice construído; muda sempre que o manifesto muda."""
+    if manifest is None:
+        return ''
+    data = json.dumps(manifest, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
@@ -0,0 +1,108 @@
+"""Requisição RAG estruturada: pergunta, chunks recuperados e histórico.
+
+O ``Retriever`` produz os ``RetrievedChunk`` e o ``HuggingFaceLLM`` consome o
+``RAGRequest`` diretamente; o prompt em texto só é montado onde o tokenizer
+precisa dele (``render_prompt``).
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from utils.deadline import Deadline
+from utils.preprocessing import clean_rag_context, deep_clean_context
+
+CONTEXT_HEADER = 'Informações relevantes:'
+
+
+@dataclass(frozen=True)
+class RetrievedChunk:
+    """Chunk recuperado; ``id`` é a posição no chunk store.
+
+    ``score`` é maior para chunks mais relevantes: L2 negativa no modo dense,
+    BM25 no lexical e RRF no hybrid. ``clean`` e ``clean_rag`` são os textos
+    limpos calculados no build do índice (``None`` quando não vieram do store).
+    """
+    id: int
+    text: str
+    score: float
+    clean: Optional[str] = None
+    clean_rag: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Turn:
+    user: str
+    bot: str
+
+
+@dataclass
+class RAGRequest:
+    question: str
+    chunks: List[RetrievedChunk] = field(default_factory=list)
+    history: List[Turn] = field(default_factory=list)
+    # Prazo do pedido, da chegada ao fim da geração; não entra nas chaves de cache
+    deadline: Optional[Deadline] = field(default=None, compare=False, repr=False)
+
+    @property
+    def timed_out(self) -> bool:
+        return self.deadline is not None and self.deadline.expired
+
+    @property
+    def contexts(self) -> List[str]:
+        return [c.text for c in self.chunks]
+
+    @property
+    def chunk_ids(self) -> Tuple[int, ...]:
+        return tuple(c.id for c in self.chunks)
+
+    def clean_contexts(self, min_chars: int) -> List[str]:
+        """Contextos após ``deep_clean_context`` com mais de ``min_chars`` caracteres.
+
+        Usa o texto limpo gravado no índice; só limpa na hora chunks sem ele.
+        """
+        cleaned = (deep_clean_context(c.text) if c.clean is None else c.clean for c in self.chunks)
+        return [c for c in cleaned if len(c) > min_chars]
+
+    def clean_rag_contexts(self, min_chars: int) -> List[str]:
+        """Como ``clean_contexts``, com a limpeza de títulos de ``clean_rag_context``."""
+        cleaned = (clean_rag_context(c.text) if c.clean_rag is None else c.clean_rag for c in self.chunks)
+        return [c for c in cleaned if len(c) > min_chars]
+
+    def render_prompt(self, max_history: int = 3) -> str:
+        """Prompt em texto no formato usado pelo chatbot."""
+        prompt = "Conversa sobre desenvolvimento mobile:\n\n"
+        for turn in (self.history[-max_history:] if max_history else []):
+            prompt += f"Usuário: {turn.user}\nBot: {turn.bot}\n\n"
+        if self.chunks:
+            prompt += CONTEXT_HEADER + "\n"
+            for ctx in self.contexts:
+                prompt += f"• {ctx}\n"
+            prompt += "\n"
+        prompt += f"Usuário: {self.question}\nBot:"
+        return prompt
+
+    @classmethod
+    def from_prompt(cls, prompt: str) -> 'RAGRequest':
+        """Converte um prompt em texto (formato de ``render_prompt``) numa única passada.
+
+        Chunks vindos do texto não têm id nem score: recebem id -1 e score 0.
+        """
+        question = ''
+        chunks: List[RetrievedChunk] = []
+        history: List[Turn] = []
+        in_context = False
+        pending_user = None
+        for line in prompt.split('\n'):
+            line = line.strip()
+            if line == CONTEXT_HEADER:
+                in_context = True
+            elif in_context and line.startswith('•'):
+                chunks.append(RetrievedChunk(-1, line[1:].strip(), 0.0))
+            elif line.startswith('Usuário:'):
+                in_context = False
+                pending_user = question = line[len('Usuário:'):].strip()
+            elif line.startswith('Bot:') and pending_user is not None and line[len('Bot:'):].strip():
+                history.append(Turn(pending_user, line[len('Bot:'):].strip()))
+                pending_user = None
+            elif line:
+                in_context = False
+        return cls(question=question, chunks=chunks, history=history)
@@ -1,57 +1,483 @@
 import os
-import json
+import shutil
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
-from typing import List
-from rag.chunking import simple_chunk_text
+from typing import Dict, Iterable, List, Optional, Tuple
+from rag.bm25 import BM25Index, reciprocal_rank_scores
+from rag.chunk_store import ChunkStore, ChunkStoreWriter, NpyWriter
+from rag.chunking import batched, iter_file_chunks
+from rag.embedding_cache import QueryEmbeddingCache, normalize_query
+from rag.ingest import build_shards, corpus_sha256, iter_shard_batches, list_corpus_files, load_embedder
+from rag.index_factory import check_precision, resolve_params, storage_dtype
+from rag.manifest import (chunk_hash, file_sha256, is_compatible, load_manifest, manifest_fingerprint,
+                          save_manifest)
+from rag.request import RetrievedChunk
+from rag.scope import ScopeClassifier
+from rag.vector_store import (VectorStore, build_vector_store, check_backend, create_vector_store,
+                              load_vector_store, vector_store_exists)
+from utils.inference import check_inference_precision
+from utils.lazy import LazyLoader
+from utils.preprocessing import PREPROCESSING_VERSION, clean_chunk_fields
 
 CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'cache')
 os.makedirs(CACHE_DIR, exist_ok=True)
 
 EMBEDDINGS_PATH = os.path.join(CACHE_DIR, 'embeddings.npy')
-META_PATH = os.path.join(CACHE_DIR, 'metadata.json')
-INDEX_PATH = os.path.join(CACHE_DIR, 'vector_index.faiss')
+CHUNKS_PREFIX = os.path.join(CACHE_DIR, 'chunks')
+INDEX_PREFIX = os.path.join(CACHE_DIR, 'vector_index')
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'manifest.json')
+
+# dense: só FAISS; lexical: só BM25 (não roda o embedder); hybrid: fusão RRF dos dois
+RETRIEVAL_MODES = ('dense', 'lexical', 'hybrid')
+# No modo híbrido cada ranking contribui com top_k * HYBRID_DEPTH candidatos para a fusão
+HYBRID_DEPTH = 3
 
 
 class Retriever:
-    def __init__(self, embed_model_name: str = 'sentence-transformers/all-MiniLM-L6-v2'):
-        self.embedder = SentenceTransformer(embed_model_name)
-        self.index = None
-        self.metadata = []
+    def __init__(self, embed_model_name: str = 'sentence-transformers/all-MiniLM-L6-v2',
+                 query_cache_bytes: int = 16 * 1024 * 1024,
+                 cache_dir: str = CACHE_DIR,
+                 chunk_max_words: int = 150,
+                 index_type: str = 'flat',
+                 index_params: Optional[dict] = None,
+                 mmap: bool = False,
+                 retrieval_mode: str = 'dense',
+                 embed_batch_size: int = 256,
+                 ingest_workers: int = 0,
+                 ingest_shards: int = 0,
+                 precision: str = 'float32',
+                 backend: str = 'faiss',
+                 inference_precision: str = 'float32',
+                 scope_topics: int = 16,
+                 scope_threshold: Optional[float] = None):
+        self.embed_model_name = embed_model_name
+        # Precisão do embedder em CPU (float32, int8 ou bfloat16); não afeta o índice salvo
+        check_inference_precision(inference_precision)
+        self.inference_precision = inference_precision
+        # O modelo só é carregado quando algo precisa ser embedado: carregar um
+        # índice existente ou consultar em modo léxico não paga esse custo
+        self._embedder = LazyLoader(self._load_embedder, name=embed_model_name)
+        self.index: Optional[VectorStore] = None
+        self.chunks: Optional[ChunkStore] = None
+        # query_cache_bytes=0 desativa o cache de embeddings de consultas
+        self.query_cache = QueryEmbeddingCache(query_cache_bytes) if query_cache_bytes > 0 else None
+        self.chunk_max_words = chunk_max_words
+        # Tamanho dos lotes da ingestão em streaming: limita a memória do build
+        self.embed_batch_size = embed_batch_size
+        # Ingestão de diretórios: processos e shards (0 = número de núcleos)
+        self.ingest_workers = ingest_workers
+        self.ingest_shards = ingest_shards
+        self.index_type = index_type
+        self.index_params = resolve_params(index_type, index_params)
+        # float16/int8: embeddings.npy em float16 e índice com scalar quantizer
+        check_precision(precision)
+        self.precision = precision
+        # faiss: qualquer index_type; numpy: força bruta exata, sem faiss
+        check_backend(backend, index_type, precision)
+        self.backend = backend
+        # mmap=True mapeia índice e embeddings somente leitura: vários workers
+        # no mesmo host compartilham as mesmas páginas do page cache
+        self.mmap = mmap
+        self._embeddings = None
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f'Modo de recuperação desconhecido: {retrieval_mode} (use um de {RETRIEVAL_MODES})')
+        self.retrieval_mode = retrieval_mode
+        self._bm25: Optional[BM25Index] = None
+        # Classificador de escopo: centróides de tópicos ajustados a cada build;
+        # scope_threshold substitui o limiar calibrado no corpus
+        self.scope_topics = scope_topics
+        self.scope_threshold = scope_threshold
+        self._scope: Optional[ScopeClassifier] = None
+        self._corpus_kind = 'file'
+
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.embeddings_path = os.path.join(cache_dir, 'embeddings.npy')
+        self.chunks_prefix = os.path.join(cache_dir, 'chunks')
+        self.index_prefix = os.path.join(cache_dir, 'vector_index')
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.bm25_prefix = os.path.join(cache_dir, 'bm25')
+        self.scope_prefix = os.path.join(cache_dir, 'scope')
+
+    def _load_embedder(self):
+        return load_embedder(self.embed_model_name, self.inference_precision, self.cache_dir)
+
+    @property
+    def embedder(self):
+        """SentenceTransformer, construído na primeira utilização."""
+        return self._embedder.get()
+
+    def preload(self, background: bool = True) -> Optional[threading.Thread]:
+        """Antecipa o carregamento do embedder (em segundo plano por padrão)."""
+        return self._embedder.preload(background)
+
+    @property
+    def chunker_params(self) -> dict:
+        return {'name': 'simple_chunk_text', 'max_words': self.chunk_max_words,
+                'preprocessing': PREPROCESSING_VERSION}
+
+    @property
+    def index_config(self) -> dict:
+        # nprobe/efSearch só afetam a busca e não exigem reconstruir o índice
+        build_params = {k: v for k, v in self.index_params.items() if k not in ('nprobe', 'ef_search')}
+        return {'type': self.index_type, 'params': build_params, 'precision': self.precision,
+                'backend': self.backend}
 
     def build_index_if_needed(self, data_path: str):
-        if os.path.exists(INDEX_PATH):
+        """Carrega o índice em cache, atualizando-o se o material, chunker ou modelo mudou.
+
+        ``data_path`` pode ser um arquivo ou um diretório de documentos; diretórios
+        são ingeridos em paralelo, em shards, e unidos em um único índice.
+        """
+        is_dir = os.path.isdir(data_path)
+        if is_dir:
+            paths = list_corpus_files(data_path)
+            if not paths:
+                raise ValueError(f'Nenhum documento encontrado em {data_path}')
+            corpus_hash = corpus_sha256(data_path, paths)
+        else:
+            corpus_hash = file_sha256(data_path)
+        manifest = load_manifest(self.manifest_path)
+        reusable = (
+            is_compatible(manifest, self.chunker_params, self.embed_model_name)
+            and vector_store_exists(self.backend, self.index_prefix)
+            and ChunkStore.exists(self.chunks_prefix)
+            and manifest.get('corpus_kind', 'file') == ('dir' if is_dir else 'file')  # type: ignore
+        )
+        self._corpus_kind = 'dir' if is_dir else 'file'
+
+        if reusable and manifest['corpus_sha256'] == corpus_hash:  # type: ignore
             print('Carregando índice existente...')
-            self._load_index()
+            if not self._load_existing(manifest):  # type: ignore
+                self._save(np.load(self.embeddings_path), corpus_hash)
+            return
+
+        if is_dir:
+            print('Construindo índice a partir do diretório:', data_path)
+            self._build_from_directory(data_path, paths, corpus_hash)
+            print('Índice construído e salvo.')
+            return
+
+        chunks = iter_file_chunks(data_path, max_words=self.chunk_max_words)
+
+        if reusable:
+            print('Material alterado, atualizando índice:', data_path)
+            self._load_existing(manifest, writable=True)  # type: ignore
+            self._update_index(chunks, corpus_hash)
             return
 
         print('Construindo índice a partir de:', data_path)
-        with open(data_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+        batches = (
+            (batch, self.embedder.encode(batch, batch_size=len(batch), convert_to_numpy=True), {})
+            for batch in batched(chunks, self.embed_batch_size)
+        )
+        self._build_streaming(batches, corpus_hash)
+        print('Índice construído e salvo.')
 
-        chunks = simple_chunk_text(text)
-        embeddings = self.embedder.encode(chunks, show_progress_bar=True, convert_to_numpy=True)
+    def _build_from_directory(self, root: str, paths: List[str], corpus_hash: str):
+        """Embeda os shards em paralelo e os une no índice deste cache_dir."""
+        shard_root = os.path.join(self.cache_dir, 'shards')
+        shutil.rmtree(shard_root, ignore_errors=True)
+        shard_dirs = build_shards(root, paths, shard_root, self.embed_model_name,
+                                  chunk_max_words=self.chunk_max_words, batch_size=self.embed_batch_size,
+                                  workers=self.ingest_workers, n_shards=self.ingest_shards,
+                                  inference_precision=self.inference_precision, cache_dir=self.cache_dir)
+        batches = (
+            (texts, embs, {'source': sources})
+            for texts, sources, embs in iter_shard_batches(shard_dirs, self.embed_batch_size)
+        )
+        self._build_streaming(batches, corpus_hash, text_fields=['source'])
+        shutil.rmtree(shard_root, ignore_errors=True)
 
-        self.metadata = [{'text': c} for c in chunks]
-        np.save(EMBEDDINGS_PATH, embeddings)
-        with open(META_PATH, 'w', encoding='utf-8') as mf:
-            json.dump(self.metadata, mf, ensure_ascii=False, indent=2)
+    def _build_streaming(self, batches: Iterable[Tuple[List[str], np.ndarray, Dict[str, List[str]]]],
+                         corpus_hash: str, text_fields: Iterable[str] = ()):
+        """Constrói índice, embeddings e chunk store lote a lote.
 
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dim)
-        index.add(embeddings) # type: ignore
-        faiss.write_index(index, INDEX_PATH)
+        ``batches`` gera (textos, embeddings, campos de texto extras). Cada lote
+        é gravado antes do próximo ser produzido, então a memória do build não
+        cresce com o corpus. Índices que exigem treino (IVF/PQ, SQ8) são
+        treinados ao final, a partir do ``embeddings.npy`` mapeado em memória.
+        """
+        self._embeddings = None
+        store_writer = ChunkStoreWriter(self.chunks_prefix, text_fields=list(text_fields) + ['clean', 'clean_rag'],
+                                        columns={'hash': 'S40', 'clean_len': 'int32', 'clean_rag_len': 'int32'})
+        emb_writer = NpyWriter(self.embeddings_path, storage_dtype(self.precision))
+        index = None
+        for batch, embs, extra_fields in batches:
+            embs = np.ascontiguousarray(embs, dtype='float32')
+            ids = np.arange(store_writer.count, store_writer.count + len(batch), dtype='int64')
+            fields, columns = self._chunk_fields(batch)
+            store_writer.append(batch, text_fields=dict(extra_fields, **fields), **columns)
+            emb_writer.append(embs)
+            if index is None:
+                index = create_vector_store(self.backend, embs.shape[1], 0, self.index_type, self.index_params,
+                                            self.precision)
+            if not index.needs_training:
+                index.add(embs, ids)
+        store_writer.close()
+        emb_writer.close()
+        if store_writer.count == 0:
+            raise ValueError('O material não contém texto para indexar')
+
+        embeddings = np.load(self.embeddings_path, mmap_mode='r')
+        if index.needs_training:  # type: ignore
+            # O nlist do IVF depende do tamanho do corpus, conhecido só agora
+            index = create_vector_store(self.backend, embeddings.shape[1], len(embeddings), self.index_type,
+                                        self.index_params, self.precision)
+            index.train(embeddings)
+            for start in range(0, len(embeddings), self.embed_batch_size):
+                block = np.ascontiguousarray(embeddings[start:start + self.embed_batch_size], dtype='float32')
+                index.add(block, np.arange(start, start + len(block), dtype='int64'))
 
         self.index = index
-        print('Índice construído e salvo.')
+        self._load_chunks(mmap=self.mmap)
+        self._save_index(int(embeddings.shape[1]), corpus_hash)
+
+    def _update_index(self, chunks: Iterable[str], corpus_hash: str):
+        """Reindexa apenas os chunks cujo conteúdo mudou.
+
+        Os ids no índice vetorial são as posições no chunk store; chunks removidos
+        ficam marcados como ``live=False`` até a próxima compactação.
+        """
+        hashes = self.chunks.columns['hash']  # type: ignore
+        rows_by_hash = {}
+        for row in self.chunks.live_rows():  # type: ignore
+            rows_by_hash.setdefault(hashes[row].decode('ascii'), []).append(int(row))
+
+        added = []
+        for c in chunks:
+            rows = rows_by_hash.get(chunk_hash(c))
+            if rows:
+                rows.pop()
+            else:
+                added.append(c)
+        removed = [row for rows in rows_by_hash.values() for row in rows]
+
+        embeddings = np.load(self.embeddings_path)
+        self._embeddings = None
+        if removed:
+            if self.index.supports_removal:  # type: ignore
+                self.index.remove(np.array(removed, dtype='int64'))  # type: ignore
+            self.chunks = self.chunks.delete(removed)  # type: ignore
+            embeddings[removed] = 0
+
+        if added:
+            new_embs = self.embedder.encode(added, batch_size=self.embed_batch_size, convert_to_numpy=True)
+            new_embs = np.ascontiguousarray(new_embs, dtype='float32')
+            start = len(self.chunks)  # type: ignore
+            ids = np.arange(start, start + len(added), dtype='int64')
+            self.index.add(new_embs, ids)  # type: ignore
+            self.chunks = self.chunks.append(self._new_chunks(added))  # type: ignore
+            embeddings = np.vstack([embeddings, new_embs])
+
+        live = self.chunks.live_rows()  # type: ignore
+        if len(live) * 2 < len(self.chunks):  # type: ignore
+            # Muitas lápides: compacta sem recalcular embeddings
+            self.chunks = self.chunks.select(live)  # type: ignore
+            embeddings = np.ascontiguousarray(embeddings[live])
+            self.index = self._new_index(embeddings)
+        elif removed and not self.index.supports_removal:  # type: ignore
+            self.index = self._new_index(embeddings)
+
+        self._save(embeddings, corpus_hash)
+        print(f'Índice atualizado: {len(added)} chunks novos, {len(removed)} removidos.')
+
+    @staticmethod
+    def _chunk_fields(texts: List[str]) -> Tuple[Dict[str, List[str]], Dict[str, np.ndarray]]:
+        """Campos derivados de cada chunk: hash e textos limpos usados pelo LLM."""
+        fields, columns = clean_chunk_fields(texts)
+        return fields, dict(columns, hash=np.array([chunk_hash(t) for t in texts], dtype='S40'))
+
+    @classmethod
+    def _new_chunks(cls, texts: List[str]) -> ChunkStore:
+        fields, columns = cls._chunk_fields(texts)
+        return ChunkStore.from_chunks(texts, text_fields=fields, **columns)
+
+    def _new_index(self, embeddings: np.ndarray) -> VectorStore:
+        """Cria o índice configurado com os embeddings dos chunks vivos."""
+        ids = self.chunks.live_rows().astype('int64')  # type: ignore
+        vectors = np.ascontiguousarray(embeddings[ids], dtype='float32')
+        return build_vector_store(self.backend, vectors, ids, self.index_type, self.index_params, self.precision)
+
+    def _save(self, embeddings: np.ndarray, corpus_hash: str):
+        # Grava em temporários e renomeia: outros workers podem estar com os
+        # arquivos antigos mapeados em memória
+        self._embeddings = None
+        with open(self.embeddings_path + '.tmp', 'wb') as f:
+            np.save(f, np.asarray(embeddings, dtype=storage_dtype(self.precision)))
+        os.replace(self.embeddings_path + '.tmp', self.embeddings_path)
+        self.chunks.save(self.chunks_prefix)  # type: ignore
+        self._save_index(int(embeddings.shape[1]), corpus_hash)
+
+    def _save_index(self, dim: int, corpus_hash: str):
+        self.index.save(self.index_prefix)  # type: ignore
+        self._build_bm25()
+        self._build_scope()
+        save_manifest(self.manifest_path, {
+            'corpus_sha256': corpus_hash,
+            'corpus_kind': self._corpus_kind,
+            'chunker': self.chunker_params,
+            'embed_model': self.embed_model_name,
+            'dim': dim,
+            'num_chunks': self.index.ntotal,  # type: ignore
+            'index': self.index_config,
+        })
+
+    @property
+    def fingerprint(self) -> str:
+        """Impressão digital do índice atual (muda a cada reconstrução ou atualização)."""
+        return manifest_fingerprint(load_manifest(self.manifest_path))
+
+    def _load_existing(self, manifest: dict, writable: bool = False) -> bool:
+        """Carrega o índice salvo; se o tipo ou backend mudou, reconstrói a partir dos embeddings.
+
+        Retorna False quando o índice foi reconstruído e ainda precisa ser salvo.
+        """
+        if manifest.get('index') == self.index_config:
+            self._load_index(mmap=self.mmap and not writable)
+            return True
+        print(f'Reconstruindo índice {self.index_type} a partir dos embeddings salvos...')
+        self._load_chunks(mmap=False)
+        self.index = self._new_index(np.load(self.embeddings_path))
+        return False
+
+    def _load_index(self, mmap: bool = False):
+        self.index = load_vector_store(self.backend, self.index_prefix, self.index_type, self.index_params,
+                                       self.precision, mmap=mmap)
+        self._load_chunks(mmap=mmap)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Matriz de embeddings dos chunks (linhas alinhadas com o chunk store)."""
+        if self._embeddings is None:
+            self._embeddings = np.load(self.embeddings_path, mmap_mode='r' if self.mmap else None)
+        return self._embeddings
+
+    def _load_chunks(self, mmap: bool):
+        self.chunks = ChunkStore.load(self.chunks_prefix, mmap=mmap)
+        self._bm25 = None
+        self._scope = None
+
+    def _build_bm25(self):
+        store = self.chunks
+        self._bm25 = BM25Index.build(store.text(i) if store.is_live(i) else None for i in range(len(store)))  # type: ignore
+        self._bm25.save(self.bm25_prefix)
+
+    @property
+    def bm25(self) -> BM25Index:
+        """Índice BM25, carregado do cache na primeira consulta léxica."""
+        if self._bm25 is None:
+            if os.path.exists(self.bm25_prefix + '.npz'):
+                self._bm25 = BM25Index.load(self.bm25_prefix)
+            else:
+                self._build_bm25()
+        return self._bm25  # type: ignore
+
+    def _build_scope(self):
+        # Memmap próprio: o ajuste lê só a amostra, sem carregar (nem manter em
+        # self._embeddings) a matriz inteira
+        embeddings = np.load(self.embeddings_path, mmap_mode='r')
+        self._scope = ScopeClassifier.fit(embeddings, n_topics=self.scope_topics,
+                                          rows=self.chunks.live_rows())  # type: ignore
+        self._scope.save(self.scope_prefix)
+
+    @property
+    def scope(self) -> ScopeClassifier:
+        """Classificador de escopo, carregado do cache na primeira pergunta."""
+        if self._scope is None:
+            if ScopeClassifier.exists(self.scope_prefix):
+                self._scope = ScopeClassifier.load(self.scope_prefix)
+            else:
+                self._build_scope()
+        return self._scope  # type: ignore
+
+    def in_scope(self, embedding: np.ndarray) -> Tuple[bool, float]:
+        """Indica se a pergunta (já embedada) é do domínio do corpus, sem tocar no índice."""
+        inside, scores = self.scope.predict(embedding.reshape(1, -1), self.scope_threshold)
+        return bool(inside[0]), float(scores[0])
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embedding de uma pergunta, para reaproveitar no escopo e na busca."""
+        return self.embed_queries([query])[0]
+
+    def retrieve(self, query: str, top_k: int = 3, mode: Optional[str] = None,
+                 embedding: Optional[np.ndarray] = None) -> List[str]:
+        return [c.text for c in self.retrieve_chunks(query, top_k=top_k, mode=mode, embedding=embedding)]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 3, mode: Optional[str] = None,
+                       embeddings: Optional[np.ndarray] = None) -> List[List[str]]:
+        """Recupera contextos para várias perguntas com um único encode e uma única busca."""
+        results = self.retrieve_chunks_batch(queries, top_k=top_k, mode=mode, embeddings=embeddings)
+        return [[c.text for c in chunks] for chunks in results]
+
+    def retrieve_chunks(self, query: str, top_k: int = 3, mode: Optional[str] = None,
+                        embedding: Optional[np.ndarray] = None) -> List[RetrievedChunk]:
+        embeddings = None if embedding is None else embedding.reshape(1, -1)
+        return self.retrieve_chunks_batch([query], top_k=top_k, mode=mode, embeddings=embeddings)[0]
+
+    def retrieve_chunks_batch(self, queries: List[str], top_k: int = 3, mode: Optional[str] = None,
+                              embeddings: Optional[np.ndarray] = None) -> List[List[RetrievedChunk]]:
+        """Como ``retrieve_batch``, mas com o id e o score de cada chunk.
+
+        ``embeddings`` (opcional) são os vetores das perguntas já calculados,
+        por exemplo no classificador de escopo; assim nada é embedado de novo.
+        """
+        if not queries:
+            return []
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f'Modo de recuperação desconhecido: {mode} (use um de {RETRIEVAL_MODES})')
+
+        if mode == 'lexical':
+            results = [self.bm25.search(q, top_k) for q in queries]
+        else:
+            depth = top_k if mode == 'dense' else top_k * HYBRID_DEPTH
+            if embeddings is None:
+                embeddings = self.embed_queries(queries)
+            D, I = self.index.search(embeddings, depth) # type: ignore
+            results = list(zip(-D, I))
+            if mode == 'hybrid':
+                results = []
+                for q, dense in zip(queries, I):
+                    scores = reciprocal_rank_scores([
+                        [idx for idx in dense if self.chunks.is_live(idx)],  # type: ignore
+                        self.bm25.search(q, depth)[1],
+                    ])
+                    ids = sorted(scores, key=lambda d: -scores[d])[:top_k]
+                    results.append(([scores[i] for i in ids], ids))
+        # Só os chunks retornados são lidos do store
+        return [
+            [self._retrieved_chunk(int(idx), float(score))
+             for score, idx in zip(scores, ids) if self.chunks.is_live(idx)]  # type: ignore
+            for scores, ids in results
+        ]
+
+    def _retrieved_chunk(self, idx: int, score: float) -> RetrievedChunk:
+        # Textos limpos vazios não são decodificados: o tamanho gravado basta
+        store = self.chunks
+        clean = store.text(idx, 'clean') if store.get(idx, 'clean_len') else ''  # type: ignore
+        clean_rag = store.text(idx, 'clean_rag') if store.get(idx, 'clean_rag_len') else ''  # type: ignore
+        return RetrievedChunk(idx, store.text(idx), score, clean=clean, clean_rag=clean_rag)  # type: ignore
 
-    def _load_index(self):
-        self.index = faiss.read_index(INDEX_PATH)
-        with open(META_PATH, 'r', encoding='utf-8') as mf:
-            self.metadata = json.load(mf)
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Gera embeddings das consultas, reaproveitando o cache quando possível."""
+        if self.query_cache is None:
+            embs = self.embedder.encode(queries, batch_size=len(queries), convert_to_numpy=True)
+            return np.ascontiguousarray(embs, dtype='float32')
 
-    def retrieve(self, query: str, top_k: int = 3) -> List[str]:
-        q_emb = self.embedder.encode([query], convert_to_numpy=True)
-        D, I = self.index.search(q_emb, top_k) # type: ignore
-        return [self.metadata[idx]['text'] for idx in I[0] if idx < len(self.metadata)]
\ No newline at end of file
+        cached = [self.query_cache.get(self.embed_model_name, q) for q in queries]
+        missing = [i for i, emb in enumerate(cached) if emb is None]
+        if missing:
+            # Perguntas repetidas dentro do mesmo lote (mesma chave normalizada do
+            # cache) são codificadas uma única vez, pela primeira grafia recebida
+            unique: Dict[str, str] = {}
+            for i in missing:
+                unique.setdefault(normalize_query(queries[i]), queries[i])
+            texts = list(unique.values())
+            new_embs = self.embedder.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+            by_key = dict(zip(unique, new_embs))
+            for i in missing:
+                cached[i] = by_key[normalize_query(queries[i])]
+            for q, emb in zip(texts, new_embs):
+                self.query_cache.put(self.embed_model_name, q, emb)
+        return np.ascontiguousarray(np.stack(cached), dtype='float32')
@@ -0,0 +1,78 @@
+"""Classificador de escopo pelos embeddings: a pergunta é do domínio do corpus?
+
+Na construção do índice os embeddings dos chunks são agrupados (k-means
+esférico) em centróides de tópicos. Uma pergunta está no escopo quando a
+similaridade de cosseno com o centróide mais próximo passa do limiar,
+calibrado pela similaridade dos próprios chunks com seus centróides.
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Vetores usados para ajustar os centróides; acima disso o corpus é amostrado
+FIT_SAMPLE_SIZE = 20_000
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype='float32')
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+class ScopeClassifier:
+    def __init__(self, centroids: np.ndarray, threshold: float):
+        self.centroids = _normalize(centroids)
+        self.threshold = float(threshold)
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, n_topics: int = 16, percentile: float = 1.0,
+            iterations: int = 20, seed: int = 0, rows: Optional[np.ndarray] = None) -> 'ScopeClassifier':
+        """Ajusta ``n_topics`` centróides; o limiar é o percentil ``percentile``
+        da similaridade de cada chunk com seu centróide mais próximo.
+
+        ``rows`` restringe o ajuste a essas linhas (os chunks vivos). A amostra é
+        sorteada entre os ids antes de ler ``embeddings``: com um memmap, só as
+        linhas sorteadas são lidas e convertidas para float32.
+        """
+        rng = np.random.default_rng(seed)
+        if rows is None:
+            rows = np.arange(len(embeddings))
+        if len(rows) > FIT_SAMPLE_SIZE:
+            rows = np.sort(rows[rng.choice(len(rows), FIT_SAMPLE_SIZE, replace=False)])
+        vectors = _normalize(embeddings[rows])
+        k = max(1, min(n_topics, len(vectors)))
+        centroids = vectors[rng.choice(len(vectors), k, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(k):
+                members = vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+        best = np.max(vectors @ centroids.T, axis=1)
+        return cls(centroids, float(np.percentile(best, percentile)))
+
+    def scores(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """Similaridade de cada consulta com o centróide de tópico mais próximo."""
+        return np.max(_normalize(query_embeddings) @ self.centroids.T, axis=1)
+
+    def predict(self, query_embeddings: np.ndarray,
+                threshold: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (no escopo?, score) por consulta."""
+        scores = self.scores(query_embeddings)
+        return scores >= (self.threshold if threshold is None else threshold), scores
+
+    def save(self, prefix: str):
+        with open(prefix + '.npz.tmp', 'wb') as f:
+            np.savez(f, centroids=self.centroids, threshold=np.float32(self.threshold))
+        os.replace(prefix + '.npz.tmp', prefix + '.npz')
+
+    @classmethod
+    def load(cls, prefix: str) -> 'ScopeClassifier':
+        data = np.load(prefix + '.npz')
+        return cls(data['centroids'], float(data['threshold']))
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(prefix + '.npz')
@@ -0,0 +1,221 @@
+"""Backends de busca vetorial usados pelo Retriever.
+
+- ``faiss``: qualquer tipo de índice de ``rag.index_factory``.
+- ``numpy``: força bruta exata com produto de matrizes e ``argpartition``;
+  sem dependência do faiss, bom para corpora pequenos e containers enxutos.
+
+Os dois usam distância L2 ao quadrado e ids = posições no chunk store.
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from rag.index_factory import check_precision, resolve_params, storage_dtype
+
+VECTOR_BACKENDS = ('faiss', 'numpy')
+
+
+class VectorStore:
+    """Interface comum: add, remove, search, save e load."""
+
+    needs_training = False
+    supports_removal = True
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        raise NotImplementedError
+
+    def remove(self, ids: np.ndarray):
+        raise NotImplementedError
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (distâncias, ids) com shape (n_queries, k); ids faltantes são -1."""
+        raise NotImplementedError
+
+    def save(self, prefix: str):
+        raise NotImplementedError
+
+    @property
+    def ntotal(self) -> int:
+        raise NotImplementedError
+
+
+class FaissVectorStore(VectorStore):
+    def __init__(self, index, index_type: str, params: dict, precision: str):
+        from rag.index_factory import supports_removal
+
+        self.index = index
+        self.index_type = index_type
+        self.params = params
+        self.precision = precision
+        self.needs_training = not index.is_trained
+        self.supports_removal = supports_removal(index_type)
+
+    @classmethod
+    def create(cls, dim: int, n: int, index_type: str, params: dict, precision: str) -> 'FaissVectorStore':
+        from rag.index_factory import create_index
+        return cls(create_index(dim, n, index_type, params, precision), index_type, params, precision)
+
+    def train(self, vectors: np.ndarray):
+        from rag.index_factory import training_sample
+        self.index.train(training_sample(vectors))
+        self.needs_training = False
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), ids.astype('int64'))
+
+    def remove(self, ids: np.ndarray):
+        self.index.remove_ids(np.asarray(ids, dtype='int64'))
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.index.search(np.ascontiguousarray(queries, dtype='float32'), k)
+
+    def save(self, prefix: str):
+        import faiss
+        path = prefix + '.faiss'
+        faiss.write_index(self.index, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, prefix: str, index_type: str, params: dict, precision: str,
+             mmap: bool = False) -> 'FaissVectorStore':
+        import faiss
+        from rag.index_factory import configure_search, mmap_flags
+
+        if mmap:
+            index = faiss.read_index(prefix + '.faiss', mmap_flags(index_type))
+        else:
+            index = faiss.read_index(prefix + '.faiss')
+        configure_search(index, index_type, params)
+        return cls(index, index_type, params, precision)
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(prefix + '.faiss')
+
+    @property
+    def ntotal(self) -> int:
+        return int(self.index.ntotal)
+
+
+class NumpyVectorStore(VectorStore):
+    """Busca exata vetorizada: ||x||² - 2·x·q + ||q||² sobre toda a matriz."""
+
+    # Linhas processadas por vez na busca, limitando a matriz de scores temporária
+    BLOCK_ROWS = 65536
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray, norms: np.ndarray):
+        self.vectors = vectors
+        self.ids = ids
+        self.norms = norms
+        # Lotes de add ainda não concatenados: o build em streaming chama add
+        # uma vez por lote e só paga uma cópia, na próxima busca ou save
+        self._pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+
+    @classmethod
+    def create(cls, dim: int, precision: str = 'float32') -> 'NumpyVectorStore':
+        dtype = storage_dtype(precision)
+        return cls(np.zeros((0, dim), dtype=dtype), np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32'))
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        vectors = np.asarray(vectors, dtype=self.vectors.dtype)
+        norms = np.einsum('ij,ij->i', vectors.astype('float32'), vectors.astype('float32'))
+        self._pending.append((vectors, np.asarray(ids, dtype='int64'), norms.astype('float32')))
+
+    def _flush(self):
+        if not self._pending:
+            return
+        vectors, ids, norms = zip(*self._pending)
+        self.vectors = np.concatenate([self.vectors, *vectors])
+        self.ids = np.concatenate([self.ids, *ids])
+        self.norms = np.concatenate([self.norms, *norms])
+        self._pending = []
+
+    def remove(self, ids: np.ndarray):
+        self._flush()
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype='int64'))
+        self.vectors, self.ids, self.norms = self.vectors[keep], self.ids[keep], self.norms[keep]
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        self._flush()
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        n_queries = len(queries)
+        best_d = np.full((n_queries, k), np.inf, dtype='float32')
+        best_i = np.full((n_queries, k), -1, dtype='int64')
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+
+        for start in range(0, len(self.ids), self.BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + self.BLOCK_ROWS], dtype='float32')
+            dists = self.norms[start:start + len(block)][None, :] - 2.0 * (queries @ block.T) + q_norms[:, None]
+            kk = min(k, len(block))
+            top = np.argpartition(dists, kk - 1, axis=1)[:, :kk]
+            # Junta o top-k do bloco com o melhor até agora; empates saem pelo menor id, como no faiss
+            cand_d = np.concatenate([best_d, np.take_along_axis(dists, top, axis=1)], axis=1)
+            cand_i = np.concatenate([best_i, self.ids[start + top]], axis=1)
+            order = np.lexsort((cand_i, cand_d), axis=1)[:, :k]
+            best_d = np.take_along_axis(cand_d, order, axis=1)
+            best_i = np.take_along_axis(cand_i, order, axis=1)
+        return np.maximum(best_d, 0.0), best_i
+
+    def save(self, prefix: str):
+        self._flush()
+        for name, arr in (('vectors', self.vectors), ('ids', self.ids), ('norms', self.norms)):
+            path = f'{prefix}.{name}.npy'
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, arr)
+            os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = False) -> 'NumpyVectorStore':
+        mode = 'r' if mmap else None
+        return cls(*(np.load(f'{prefix}.{name}.npy', mmap_mode=mode) for name in ('vectors', 'ids', 'norms')))
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(prefix + '.vectors.npy')
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids) + sum(len(ids) for _, ids, _ in self._pending)
+
+
+def check_backend(backend: str, index_type: str, precision: str):
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f'Backend desconhecido: {backend} (use um de {VECTOR_BACKENDS})')
+    check_precision(precision)
+    if backend == 'numpy' and (index_type != 'flat' or precision == 'int8'):
+        raise ValueError("O backend numpy só suporta index_type='flat' em float32 ou float16")
+
+
+def create_vector_store(backend: str, dim: int, n: int, index_type: str = 'flat',
+                        params: Optional[dict] = None, precision: str = 'float32') -> VectorStore:
+    """Cria um store vazio; ``n`` é o número esperado de vetores (dimensiona o IVF)."""
+    check_backend(backend, index_type, precision)
+    if backend == 'numpy':
+        return NumpyVectorStore.create(dim, precision)
+    return FaissVectorStore.create(dim, n, index_type, resolve_params(index_type, params), precision)
+
+
+def load_vector_store(backend: str, prefix: str, index_type: str = 'flat', params: Optional[dict] = None,
+                      precision: str = 'float32', mmap: bool = False) -> VectorStore:
+    check_backend(backend, index_type, precision)
+    if backend == 'numpy':
+        return NumpyVectorStore.load(prefix, mmap=mmap)
+    return FaissVectorStore.load(prefix, index_type, resolve_params(index_type, params), precision, mmap=mmap)
+
+
+def vector_store_exists(backend: str, prefix: str) -> bool:
+    return (NumpyVectorStore if backend == 'numpy' else FaissVectorStore).exists(prefix)
+
+
+def build_vector_store(backend: str, vectors: np.ndarray, ids: np.ndarray, index_type: str = 'flat',
+                       params: Optional[dict] = None, precision: str = 'float32') -> VectorStore:
+    """Cria, treina (se preciso) e popula um store com todos os vetores."""
+    store = create_vector_store(backend, vectors.shape[1], len(vectors), index_type, params, precision)
+    if store.needs_training:
+        store.train(vectors)
+    store.add(vectors, ids)
+    return store
@@ -0,0 +1,39 @@
+"""API HTTP do chatbot, com micro-batching das requisições concorrentes.
+
+Uso:
+    python src/server.py [--port 8000] [--max-batch-size 8] [--max-wait-ms 5] [--budget-ms 2000]
+
+    curl -X POST localhost:8000/chat -H 'Content-Type: application/json' \\
+         -d '{"question": "Como configurar testes E2E com Detox?"}'
+"""
+import argparse
+
+from api.server import create_app
+from api.service import DATA_PATH, ChatService
+from llm.model import DECODING_PRESETS, DEFAULT_DECODING
+from utils.inference import INFERENCE_PRECISIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API HTTP do DSM Chatbot')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--model', default='microsoft/DialoGPT-small')
+    parser.add_argument('--precision', choices=INFERENCE_PRECISIONS, default='float32')
+    parser.add_argument('--max-batch-size', type=int, default=8, help='perguntas por lote')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='espera máxima por outras perguntas antes de processar o lote')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='orçamento de latência por pedido; esgotado, a resposta vem do RAG puro')
+    parser.add_argument('--decoding', choices=list(DECODING_PRESETS), default=DEFAULT_DECODING)
+    args = parser.parse_args()
+
+    service = ChatService.create(args.data, model_name=args.model, precision=args.precision,
+                                 budget_ms=args.budget_ms, decoding=args.decoding)
+    app = create_app(service, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Orçamento de latência de ponta a ponta de um pedido.
+
+O ``Deadline`` é criado quando o pedido chega (antes da fila, da busca e da
+geração) e segue no ``RAGRequest``. A geração é interrompida por um critério
+de parada quando o prazo acaba, e a resposta cai para o RAG puro.
+"""
+import time
+from typing import List, Optional, Sequence
+
+
+class Deadline:
+    """Prazo de um pedido; ``Deadline(None)`` nunca expira."""
+
+    def __init__(self, budget_seconds: Optional[float] = None):
+        if budget_seconds is not None and budget_seconds <= 0:
+            raise ValueError(f'Orçamento de latência deve ser positivo: {budget_seconds}')
+        self.budget_seconds = budget_seconds
+        self.start = time.perf_counter()
+
+    @classmethod
+    def from_ms(cls, budget_ms: Optional[float]) -> 'Deadline':
+        return cls(None if budget_ms is None else budget_ms / 1000.0)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def remaining(self) -> float:
+        if self.budget_seconds is None:
+            return float('inf')
+        return self.budget_seconds - self.elapsed()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def deadline_stopping_criteria(deadlines: Sequence[Optional[Deadline]], eos_token_id: Optional[int] = None):
+    """StoppingCriteria que para cada linha do lote quando o seu prazo acaba.
+
+    ``generate`` repete as linhas (feixes do beam search) de forma contígua;
+    o critério distribui o prazo de cada pedido pelas suas cópias. ``cut[i]``
+    indica que a linha ``i`` ainda estava gerando quando o prazo acabou (o
+    texto dela está truncado).
+    """
+    import torch
+    from transformers import StoppingCriteria
+
+    class DeadlineStop(StoppingCriteria):
+        def __init__(self):
+            self.cut: List[bool] = [False] * len(deadlines)
+
+        def __call__(self, input_ids, scores, **kwargs):
+            copies = max(input_ids.shape[0] // len(deadlines), 1)
+            expired = [d is not None and d.expired for d in deadlines]
+            for i, done in enumerate(expired):
+                if done and not self.cut[i]:
+                    last = input_ids[i * copies:(i + 1) * copies, -1]
+                    # Linhas já terminadas recebem eos como preenchimento
+                    self.cut[i] = eos_token_id is None or bool((last != eos_token_id).any())
+            stop = torch.tensor(expired, dtype=torch.bool, device=input_ids.device)
+            return stop.repeat_interleave(copies)
+
+    return DeadlineStop()
@@ -0,0 +1,177 @@
+"""Precisão de inferência em CPU para o modelo de linguagem e o embedder.
+
+- ``float32``: padrão, sem alterações no modelo.
+- ``int8``: quantização dinâmica do PyTorch nas camadas Linear (pesos int8,
+  ativações quantizadas em tempo de execução). Só roda em CPU.
+- ``bfloat16``: autocast bf16 em volta do forward, com os pesos em float32
+  (camadas sensíveis, como LayerNorm e softmax, continuam em float32); usado
+  apenas se a CPU tiver suporte nativo (AVX512-BF16/AMX), senão mantém float32.
+
+Os pesos int8 são gravados em ``<cache_dir>/quantized`` (só o ``state_dict``).
+Nas próximas execuções eles preenchem a estrutura do modelo, montada a partir
+da configuração: o checkpoint fp32 não é lido e nada é quantizado de novo.
+"""
+import os
+import pickle
+import re
+from typing import Callable, Optional
+
+INFERENCE_PRECISIONS = ('float32', 'int8', 'bfloat16')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'cache')
+
+
+def check_inference_precision(precision: str):
+    if precision not in INFERENCE_PRECISIONS:
+        raise ValueError(f'Precisão de inferência desconhecida: {precision} (use uma de {INFERENCE_PRECISIONS})')
+
+
+def bf16_supported() -> bool:
+    """Indica se a CPU executa bf16 nativamente (oneDNN)."""
+    import torch
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_inference_precision(precision: str) -> str:
+    """Precisão efetiva: ``bfloat16`` cai para ``float32`` sem suporte da CPU."""
+    check_inference_precision(precision)
+    if precision == 'bfloat16' and not bf16_supported():
+        print('CPU sem suporte a bfloat16; usando float32.')
+        return 'float32'
+    return precision
+
+
+def quantized_path(cache_dir: str, model_name: str) -> str:
+    """Arquivo do modelo int8 em cache; inclui as versões de torch/transformers."""
+    import torch
+    import transformers
+    name = f'{model_name}-int8-torch{torch.__version__}-transformers{transformers.__version__}.pt'
+    return os.path.join(cache_dir, 'quantized', re.sub(r'[^\w.-]+', '_', name))
+
+
+def _conv1d_to_linear(model):
+    """Troca as Conv1D do GPT-2 (Linear com pesos transpostos) por nn.Linear."""
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.nx, child.nf)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+    return model
+
+
+def quantize_int8(model):
+    """Quantização dinâmica int8 de todas as camadas Linear do modelo."""
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    model = _conv1d_to_linear(model.eval())
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _empty_int8(model):
+    """Troca Linear e Conv1D por Linear int8 vazias, no mesmo formato do ``quantize_int8``.
+
+    Usado com a estrutura do modelo sem pesos: o ``state_dict`` do cache
+    preenche as camadas depois, sem converter nem quantizar nada.
+    """
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear as Int8Linear
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                setattr(parent, name, Int8Linear(child.nx, child.nf, dtype=torch.qint8))
+            elif type(child) is torch.nn.Linear:
+                setattr(parent, name, Int8Linear(child.in_features, child.out_features,
+                                                 bias_=child.bias is not None, dtype=torch.qint8))
+    return model.eval()
+
+
+def _save_state_dict(model, path: str):
+    """torch.save do ``state_dict``, com os qschemes gravados como ``torch.<nome>``.
+
+    ``torch.per_tensor_affine`` e afins não têm ``__module__``; sem isso o
+    pickle varre ``sys.modules`` e esbarra nos imports preguiçosos do transformers.
+    ``torch.<nome>`` é o global que o ``weights_only=True`` aceita na leitura.
+    """
+    import torch
+
+    class Pickler(pickle._Pickler):
+        def save_global(self, obj, name=None):
+            if isinstance(obj, torch.qscheme):
+                self.write(pickle.GLOBAL + f"torch\n{str(obj).split('.')[-1]}\n".encode())
+                self.memoize(obj)
+                return
+            super().save_global(obj, name)
+
+    pickle_module = type('pickle_module', (), {'Pickler': Pickler, '__name__': 'pickle'})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Temporário por processo: os workers da ingestão podem quantizar ao mesmo tempo
+    tmp = f'{path}.{os.getpid()}.tmp'
+    torch.save(model.state_dict(), tmp, pickle_module=pickle_module)
+    os.replace(tmp, path)
+
+
+def autocast_bf16(model):
+    """Executa o forward do modelo sob autocast bf16 em CPU; os pesos ficam em float32.
+
+    O autocast vale por thread: envolver o ``forward`` cobre ``generate`` (inclusive
+    na thread do streaming) e o ``encode`` do sentence-transformers.
+    """
+    import torch
+
+    forward = model.forward
+
+    def autocast_forward(*args, **kwargs):
+        with torch.autocast('cpu', dtype=torch.bfloat16):
+            return forward(*args, **kwargs)
+
+    model.forward = autocast_forward
+    return model
+
+
+def load_with_precision(build: Callable, precision: str, model_name: str,
+                        cache_dir: Optional[str] = None, build_empty: Optional[Callable] = None):
+    """Constrói o modelo com ``build()`` e aplica a precisão de inferência.
+
+    Em ``int8``, na primeira execução o modelo fp32 é quantizado e os pesos
+    int8 são salvos. Nas seguintes, ``build_empty()`` monta só a estrutura do
+    modelo (configuração, sem ler o checkpoint nem inicializar pesos) e o
+    ``state_dict`` do cache a preenche: nem o fp32 é carregado nem a
+    quantização roda de novo. Sem ``build_empty`` os pesos int8 não são salvos.
+    """
+    precision = resolve_inference_precision(precision)
+    if precision == 'float32':
+        return build()
+
+    if precision == 'bfloat16':
+        return autocast_bf16(build())
+
+    if build_empty is None:
+        return quantize_int8(build())
+
+    import torch
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:  # transformers < 5
+        from transformers.modeling_utils import no_init_weights
+
+    path = quantized_path(cache_dir or DEFAULT_CACHE_DIR, model_name)
+    if not os.path.exists(path):
+        model = quantize_int8(build())
+        _save_state_dict(model, path)
+        return model
+    with no_init_weights():
+        model = _empty_int8(build_empty())
+    # Só tensores: nada do diretório de cache é desserializado como objeto Python
+    model.load_state_dict(torch.load(path, weights_only=True))
+    return model
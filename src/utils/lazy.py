@@ -0,0 +1,63 @@
+"""Carregamento preguiçoso e thread-safe de recursos pesados (modelos)."""
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class LazyLoader(Generic[T]):
+    """Constrói o recurso na primeira chamada de ``get``, uma única vez.
+
+    Várias threads podem chamar ``get`` ao mesmo tempo: só a primeira executa
+    a fábrica e as demais esperam pelo mesmo resultado. ``preload`` inicia o
+    carregamento numa thread em segundo plano, para que o processo já possa
+    aceitar conexões enquanto o modelo carrega.
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str = ''):
+        self._factory = factory
+        self.name = name
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._loaded = False
+        self._thread: Optional[threading.Thread] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        if self._loaded:
+            return self._value  # type: ignore
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                self._value = self._factory()
+                self.load_seconds = time.perf_counter() - start
+                self._loaded = True
+        return self._value  # type: ignore
+
+    def preload(self, background: bool = True) -> Optional[threading.Thread]:
+        """Carrega agora (``background=False``) ou numa thread daemon."""
+        if not background:
+            self.get()
+            return None
+        if self._thread is None and not self._loaded:
+            self._thread = threading.Thread(target=self._preload, name=f'preload-{self.name}', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _preload(self):
+        try:
+            self.get()
+        except Exception as e:
+            # O erro reaparece na próxima chamada de get(), na thread que usa o recurso
+            print(f'Falha ao pré-carregar {self.name}: {e}')
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera um preload em andamento; retorna se o recurso já está carregado."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self._loaded
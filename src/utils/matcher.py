@@ -0,0 +1,85 @@
+"""Casamento de muitas palavras-chave de uma vez, por categoria.
+
+Todas as palavras-chave viram uma única regex em forma de trie, compilada uma
+vez: cada posição do texto é testada percorrendo a trie, então o custo por
+texto depende do tamanho do texto e não do número de palavras-chave. A
+semântica é a mesma de ``any(kw in text.lower() for kw in keywords)``
+para cada categoria.
+"""
+import json
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Set
+
+
+class KeywordMatcher:
+    """Encontra, numa única passada, todas as categorias presentes no texto."""
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        categories: Dict[str, Set[str]] = {}
+        for category, words in keywords.items():
+            for word in words:
+                word = word.lower()
+                if word:
+                    categories.setdefault(word, set()).add(category)
+        self._trie = _build_trie(categories)
+        # A regex devolve, em cada posição, só a palavra mais longa; as
+        # categorias de cada palavra incluem as das palavras contidas nela
+        self._categories = {word: self._closure(word) for word in categories}
+        self._regex = re.compile('(?=(' + _trie_pattern(self._trie) + '))') if categories else None
+
+    @classmethod
+    def from_config(cls, path: str) -> 'KeywordMatcher':
+        """Lê um JSON no formato {"categoria": ["palavra", ...]}."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _closure(self, word: str) -> FrozenSet[str]:
+        found: Set[str] = set()
+        for start in range(len(word)):
+            node = self._trie
+            for ch in word[start:]:
+                node = node.get(ch)
+                if node is None:
+                    break
+                found |= node.get('', set())
+        return frozenset(found)
+
+    def categories(self, text: str) -> Set[str]:
+        """Categorias com ao menos uma palavra-chave contida no texto."""
+        found: Set[str] = set()
+        if self._regex is not None:
+            for match in self._regex.finditer(text.lower()):
+                found |= self._categories[match.group(1)]
+        return found
+
+    def has(self, text: str, category: str) -> bool:
+        return category in self.categories(text)
+
+
+def _build_trie(categories: Dict[str, Set[str]]) -> dict:
+    # Chave '' marca fim de palavra e guarda suas categorias
+    trie: dict = {}
+    for word, cats in categories.items():
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = set(cats)
+    return trie
+
+
+def _trie_pattern(node: dict) -> str:
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        # Quantificador guloso: tenta a palavra mais longa antes de parar aqui
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+@lru_cache(maxsize=None)
+def load_matcher(path: str) -> KeywordMatcher:
+    """Matcher compartilhado por processo para um arquivo de configuração."""
+    return KeywordMatcher.from_config(path)
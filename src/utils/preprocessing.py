@@ -1,6 +1,89 @@
 import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Versão da limpeza de contexto; entra nos parâmetros do chunker para que
+# índices com textos limpos desatualizados sejam reconstruídos
+PREPROCESSING_VERSION = 1
+
+# Tamanho mínimo do contexto limpo usado na geração e nas respostas RAG puras
+CONTEXT_MIN_CHARS = 25
+RAG_RESPONSE_MIN_CHARS = 30
+
+# Padrões de títulos e formatação removidos por deep_clean_context
+_REMOVE_LINE_RE = re.compile('|'.join([
+    r'^[A-Z\s]+$',  # Linhas só em maiúscula
+    r'^={3,}.*={3,}$',  # Linhas com ===
+    r'^\*+\s*.*\s*\*+$',  # Linhas com asteriscos
+    r'^#+\s*',  # Headers markdown
+    r'^\s*[-•]\s*$',  # Bullets vazios
+]))
+_SPACES_RE = re.compile(r'\s+')
+
+# Títulos em maiúscula comuns removidos por clean_rag_context
+_TITLES = [
+    'COMPARISON:', 'REACT NATIVE VS FLUTTER ARQUITETURA:',
+    'OTIMIZAÇÃO DE PERFORMANCE EM FLUTTER:', 'OTIMIZAÇÃO DE PERFORMANCE EM REACT NATIVE:',
+    'CI/CD PARA REACT NATIVE - GUIA COMPLETO:', 'CI/CD E DEPLOYMENT PARA DESENVOLVIMENTO MOBILE:',
+    'TESTING EM REACT NATIVE:', 'TESTES PARA APLICAÇÕES MOBILE:', 'ESTRATÉGIAS DE TESTE:',
+    'ARQUITETURAS MOBILE:', 'CLEAN ARCHITECTURE:', 'MVVM PATTERN:'
+]
+_TITLES_RE = re.compile('|'.join(re.escape(t) for t in _TITLES))
+
 
 def clean_text(text: str) -> str:
     text = text.replace('\r\n', '\n')
     text = re.sub(r'\s+', ' ', text)
-    return text.strip()
\ No newline at end of file
+    return text.strip()
+
+
+def deep_clean_context(context: str) -> str:
+    """Limpeza profunda de contexto RAG"""
+    if not context or len(context.strip()) < 10:
+        return ""
+
+    clean_lines = []
+    for line in context.strip().split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        # Remove títulos e formatação; mantém só linhas substanciais
+        if not _REMOVE_LINE_RE.match(line) and len(line) > 15:
+            # Limpar prefixos de lista
+            if line.startswith('- '):
+                line = line[2:].strip()
+            elif line.startswith('• '):
+                line = line[2:].strip()
+
+            clean_lines.append(line)
+
+    # Remover duplicações e espaços extras
+    return _SPACES_RE.sub(' ', ' '.join(clean_lines).strip())
+
+
+def clean_rag_context(context: str) -> str:
+    """Limpa contexto RAG removendo títulos e formatação desnecessária"""
+    clean_lines = []
+    for line in _TITLES_RE.sub('', context).split('\n'):
+        line = line.strip()
+        # Remove linhas vazias, símbolos e bullets
+        if line and not line.startswith('===') and len(line) > 15:
+            if line.startswith('- '):
+                line = line[2:]
+            clean_lines.append(line)
+
+    # Retorna texto limpo
+    return ' '.join(clean_lines).strip()
+
+
+def clean_chunk_fields(texts: List[str]) -> Tuple[Dict[str, List[str]], Dict[str, np.ndarray]]:
+    """Formas limpas de cada chunk e seus tamanhos, gravadas no chunk store no build."""
+    clean = [deep_clean_context(t) for t in texts]
+    clean_rag = [clean_rag_context(t) for t in texts]
+    return (
+        {'clean': clean, 'clean_rag': clean_rag},
+        {'clean_len': np.array([len(c) for c in clean], dtype='int32'),
+         'clean_rag_len': np.array([len(c) for c in clean_rag], dtype='int32')},
+    )
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos em src/ importam uns aos outros como pacotes de topo (rag, llm, utils)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
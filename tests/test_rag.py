@@ -1,4 +1,5 @@
 import os
+import time
 from src.rag.retriever import Retriever
 
 
@@ -9,4 +10,766 @@ def test_retriever_build_and_query(tmp_path):
     r = Retriever()
     r.build_index_if_needed(str(fp))
     results = r.retrieve("testes em DSM", top_k=1)
-    assert isinstance(results, list)
\ No newline at end of file
+    assert isinstance(results, list)
+
+def test_retrieve_batch_preserves_order(tmp_path):
+    fp = tmp_path / "material.txt"
+    fp.write_text("Flutter usa Dart e widgets.\nReact Native usa JavaScript e componentes nativos.")
+
+    r = Retriever()
+    r.build_index_if_needed(str(fp))
+    batch = r.retrieve_batch(["Dart widgets", "JavaScript componentes"], top_k=1)
+    assert len(batch) == 2
+    assert batch == [r.retrieve("Dart widgets", top_k=1), r.retrieve("JavaScript componentes", top_k=1)]
+
+
+def test_query_embedding_cache_lru_eviction():
+    import numpy as np
+    from src.rag.embedding_cache import QueryEmbeddingCache
+
+    emb = np.ones(4, dtype='float32')
+    cache = QueryEmbeddingCache(max_bytes=2 * emb.nbytes)
+    cache.put("m", "Flutter?", emb)
+    cache.put("m", "React Native?", emb)
+    assert cache.get("m", "  flutter? ") is not None
+    cache.put("m", "Ionic?", emb)
+
+    assert cache.get("m", "React Native?") is None
+    assert cache.get("outro-modelo", "Flutter?") is None
+    assert cache.evictions == 1
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_embed_queries_dedupes_normalized_queries(tmp_path, monkeypatch):
+    import numpy as np
+
+    encoded = []
+
+    class StubEmbedder:
+        def encode(self, texts, **kw):
+            encoded.append(list(texts))
+            return np.array([[len(t), 1.0] for t in texts], dtype='float32')
+
+    monkeypatch.setattr(Retriever, 'embedder', property(lambda self: StubEmbedder()))
+    r = Retriever(cache_dir=str(tmp_path))
+    embs = r.embed_queries(["Flutter?", "  flutter? ", "Ionic?", "FLUTTER?"])
+
+    assert encoded == [["Flutter?", "Ionic?"]]
+    assert embs.tolist() == [[8, 1], [8, 1], [6, 1], [8, 1]]
+    r.embed_queries(["flutter?"])
+    assert len(encoded) == 1
+
+
+def test_incremental_reindex_only_embeds_changed_chunks(tmp_path):
+    fp = tmp_path / "material.txt"
+    fp.write_text("Flutter usa Dart e widgets.\nReact Native usa JavaScript.\nDetox faz testes E2E.")
+    cache_dir = str(tmp_path / "cache")
+
+    r = Retriever(cache_dir=cache_dir)
+    r.build_index_if_needed(str(fp))
+
+    fp.write_text("Flutter usa Dart e widgets.\nReact Native usa TypeScript.\nDetox faz testes E2E.")
+    r2 = Retriever(cache_dir=cache_dir)
+    encoded = []
+    original_encode = r2.embedder.encode
+    r2.embedder.encode = lambda texts, **kw: encoded.append(list(texts)) or original_encode(texts, **kw)
+    r2.build_index_if_needed(str(fp))
+
+    assert encoded == [["React Native usa TypeScript."]]
+    assert r2.index.ntotal == 3
+    assert "React Native usa JavaScript." not in r2.retrieve("React Native", top_k=3)
+
+
+def test_mmap_loading_matches_in_memory(tmp_path):
+    fp = tmp_path / "material.txt"
+    fp.write_text("Flutter usa Dart e widgets.\nReact Native usa JavaScript.\nDetox faz testes E2E.")
+    cache_dir = str(tmp_path / "cache")
+
+    r = Retriever(cache_dir=cache_dir)
+    r.build_index_if_needed(str(fp))
+    shared = Retriever(cache_dir=cache_dir, mmap=True)
+    shared.build_index_if_needed(str(fp))
+
+    assert shared.retrieve("testes E2E", top_k=2) == r.retrieve("testes E2E", top_k=2)
+    assert not shared.embeddings.flags.writeable
+
+
+def test_sharded_ingestion_matches_single_process(tmp_path):
+    import numpy as np
+
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "flutter.txt").write_text("Flutter usa Dart e widgets.\nHot reload acelera o desenvolvimento.")
+    (docs / "rn.md").write_text("React Native usa JavaScript.\nExpo simplifica o build.")
+    (docs / "sub" / "testes.txt").write_text("Detox faz testes E2E.\nJest roda testes unitários.")
+
+    single = Retriever(cache_dir=str(tmp_path / "single"), ingest_workers=1, ingest_shards=1)
+    single.build_index_if_needed(str(docs))
+    sharded = Retriever(cache_dir=str(tmp_path / "sharded"), ingest_workers=2, ingest_shards=3)
+    sharded.build_index_if_needed(str(docs))
+
+    rows = lambda r: [(r.chunks.text(i), r.chunks.text(i, 'source')) for i in range(len(r.chunks))]
+    assert len(rows(single)) == 6 and rows(sharded) == rows(single)
+    assert np.allclose(sharded.embeddings, single.embeddings, atol=1e-5)
+    assert sharded.index.ntotal == single.index.ntotal
+    for query in ("Dart widgets", "testes E2E", "build com Expo"):
+        assert sharded.retrieve(query, top_k=3) == single.retrieve(query, top_k=3)
+
+
+def test_chunk_store_roundtrip_and_mmap(tmp_path):
+    from src.rag.chunk_store import ChunkStore
+
+    store = ChunkStore.from_chunks(["Flutter usa Dart.", "Ação em React Native ⚛"], score=[0.5, 1.5])
+    store = store.append(ChunkStore.from_chunks(["Detox"], score=[2.0])).delete([0])
+    prefix = str(tmp_path / "chunks")
+    store.save(prefix)
+
+    loaded = ChunkStore.load(prefix, mmap=True)
+    assert len(loaded) == 3
+    assert loaded.text(1) == "Ação em React Native ⚛"
+    assert loaded.get(2, "score") == 2.0
+    assert not loaded.is_live(0) and loaded.is_live(2)
+    assert list(loaded.live_rows()) == [1, 2]
+
+
+def test_bm25_ranks_exact_framework_names(tmp_path):
+    from src.rag.bm25 import BM25Index, reciprocal_rank_fusion
+
+    index = BM25Index.build([
+        "Flutter usa Dart e widgets.",
+        None,
+        "Detox faz testes E2E em React Native.",
+        "Fastlane automatiza o deploy.",
+    ])
+    scores, ids = index.search("Como usar Detox?", top_k=2)
+    assert list(ids) == [2]
+    assert index.search("palavra inexistente")[1].size == 0
+    assert reciprocal_rank_fusion([[3, 2], [2, 0]])[0] == 2
+
+    index.save(str(tmp_path / "bm25"))
+    assert sorted(os.listdir(tmp_path)) == ["bm25.npz", "bm25.vocab.json"]
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+    assert [a.tolist() for a in loaded.search("Como usar Detox?", top_k=2)] == [scores.tolist(), ids.tolist()]
+
+
+def test_streaming_chunks_and_npy_writer(tmp_path):
+    import numpy as np
+    from src.rag.chunk_store import NpyWriter
+    from src.rag.chunking import batched, iter_file_chunks, simple_chunk_text
+
+    text = "Flutter\r\n\r\n" + " ".join(["palavra"] * 7) + "\nDetox\n"
+    fp = tmp_path / "material.txt"
+    fp.write_bytes(text.encode("utf-8"))
+    assert list(iter_file_chunks(str(fp), max_words=3)) == simple_chunk_text(text, max_words=3)
+    assert [len(b) for b in batched(range(5), 2)] == [2, 2, 1]
+
+    writer = NpyWriter(str(tmp_path / "emb.npy"), "float32")
+    writer.append(np.ones((2, 3)))
+    writer.append(np.zeros((1, 3)))
+    writer.close()
+    assert np.load(str(tmp_path / "emb.npy")).tolist() == [[1, 1, 1], [1, 1, 1], [0, 0, 0]]
+
+
+def test_numpy_vector_store_matches_exact_search(tmp_path):
+    import numpy as np
+    from src.rag.vector_store import NumpyVectorStore, build_vector_store
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype('float32')
+    queries = rng.standard_normal((4, 8)).astype('float32')
+    ids = np.arange(100, 150, dtype='int64')
+
+    store = build_vector_store('numpy', vectors, ids)
+    store.BLOCK_ROWS = 16
+    dists, found = store.search(queries, 5)
+    exact = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(-1)
+    assert (found == ids[np.argsort(exact, axis=1)[:, :5]]).all()
+    assert np.allclose(dists, np.sort(exact, axis=1)[:, :5], atol=1e-4)
+
+    store.remove(np.array([found[0, 0]]))
+    store.save(str(tmp_path / 'vi'))
+    loaded = NumpyVectorStore.load(str(tmp_path / 'vi'), mmap=True)
+    assert loaded.ntotal == 49
+    assert found[0, 0] not in loaded.search(queries[:1], 5)[1]
+
+    # Vários lotes de add (build em streaming) equivalem a um só
+    batched = NumpyVectorStore.create(8)
+    for start in range(0, 50, 16):
+        batched.add(vectors[start:start + 16], ids[start:start + 16])
+    assert batched.ntotal == 50 and (batched.search(queries, 5)[1] == found).all()
+
+
+def test_float16_storage_roundtrip(tmp_path):
+    import numpy as np
+    from src.rag.chunk_store import NpyWriter
+    from src.rag.index_factory import storage_dtype
+    from src.rag.vector_store import build_vector_store, load_vector_store
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((40, 16)).astype('float32')
+    queries = vectors[:5] + 0.01 * rng.standard_normal((5, 16)).astype('float32')
+    ids = np.arange(40, dtype='int64')
+
+    dtype = storage_dtype('float16')
+    writer = NpyWriter(str(tmp_path / "emb.npy"), dtype)
+    writer.append(vectors[:25])
+    writer.append(vectors[25:])
+    writer.close()
+    stored = np.load(str(tmp_path / "emb.npy"), mmap_mode='r')
+    assert stored.dtype == np.float16 and stored.shape == vectors.shape
+    assert np.allclose(stored, vectors, atol=1e-2)
+
+    store = build_vector_store('numpy', vectors, ids, precision='float16')
+    before = store.search(queries, 3)
+    store.save(str(tmp_path / "np"))
+    for mmap in (False, True):
+        loaded = load_vector_store('numpy', str(tmp_path / "np"), precision='float16', mmap=mmap)
+        assert loaded.vectors.dtype == np.float16
+        after = loaded.search(queries, 3)
+        assert np.array_equal(after[1], before[1]) and np.allclose(after[0], before[0])
+    assert before[1][:, 0].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_scalar_quantized_indexes_roundtrip(tmp_path):
+    import faiss
+    import numpy as np
+    from src.rag.vector_store import build_vector_store, load_vector_store
+
+    rng = np.random.default_rng(0)
+    dim = 16
+    vectors = rng.standard_normal((300, dim)).astype('float32')
+    queries = vectors[:20] + 0.01 * rng.standard_normal((20, dim)).astype('float32')
+    ids = np.arange(1000, 1300, dtype='int64')
+    code_size = {'float16': 2 * dim, 'int8': dim}
+
+    for precision in ('float16', 'int8'):
+        for index_type in ('flat', 'ivf_flat', 'hnsw'):
+            store = build_vector_store('faiss', vectors, ids, index_type, precision=precision)
+            inner = faiss.downcast_index(store.index.index)
+            codes = faiss.downcast_index(inner.storage) if index_type == 'hnsw' else inner
+            assert codes.code_size == code_size[precision], (precision, index_type)
+
+            before = store.search(queries, 5)
+            assert (before[1][:, 0] == ids[:20]).mean() >= 0.9, (precision, index_type)
+            prefix = str(tmp_path / f"{index_type}-{precision}")
+            store.save(prefix)
+            for mmap in (False, True):
+                loaded = load_vector_store('faiss', prefix, index_type, precision=precision, mmap=mmap)
+                after = loaded.search(queries, 5)
+                assert loaded.ntotal == 300
+                assert np.array_equal(after[1], before[1]), (precision, index_type, mmap)
+                assert np.allclose(after[0], before[0])
+
+
+def test_lazy_loader_builds_once_across_threads():
+    import threading
+    import time
+    from src.utils.lazy import LazyLoader
+
+    calls = []
+    loader = LazyLoader(lambda: calls.append(1) or time.sleep(0.05) or 'modelo')
+    threads = [threading.Thread(target=loader.get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    loader.preload()
+    for t in threads:
+        t.join()
+    assert loader.wait() and loader.get() == 'modelo'
+    assert calls == [1]
+
+
+def test_project_imports_do_not_load_heavy_dependencies():
+    import subprocess
+    import sys
+
+    src = os.path.join(os.path.dirname(__file__), '..', 'src')
+    code = ('import sys; sys.path.insert(0, sys.argv[1]); import rag.retriever, llm.model, api.service; '
+            'print([m for m in ("torch", "transformers", "sentence_transformers", "faiss") if m in sys.modules])')
+    out = subprocess.run([sys.executable, '-c', code, src], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
+
+
+def test_int8_quantization_is_cached_and_close_to_fp32(tmp_path, monkeypatch):
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+    from src.utils import inference
+    from src.utils.inference import bf16_supported, load_with_precision
+
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=64, n_positions=32, n_embd=32, n_layer=2, n_head=2)
+    fp32 = GPT2LMHeadModel(config).eval()
+    fp32.save_pretrained(str(tmp_path / 'fp32'))
+    built = []
+    build = lambda: built.append('fp32') or GPT2LMHeadModel.from_pretrained(str(tmp_path / 'fp32'))
+    build_empty = lambda: built.append('empty') or GPT2LMHeadModel(config)
+    quantize = inference.quantize_int8
+    monkeypatch.setattr(inference, 'quantize_int8', lambda m: built.append('quantize') or quantize(m))
+
+    int8 = load_with_precision(build, 'int8', 'tiny-gpt2', str(tmp_path), build_empty=build_empty)
+    cached = load_with_precision(build, 'int8', 'tiny-gpt2', str(tmp_path), build_empty=build_empty)
+    # Segunda carga: só a estrutura do modelo, sem pesos fp32 nem quantização
+    assert built == ['fp32', 'quantize', 'empty'] and len(os.listdir(tmp_path / 'quantized')) == 1
+    assert isinstance(cached.transformer.h[0].mlp.c_fc, torch.ao.nn.quantized.dynamic.Linear)
+
+    ids = torch.arange(16)[None, :]
+    with torch.no_grad():
+        reference = fp32(ids).logits
+        assert torch.allclose(cached(ids).logits, reference, atol=0.05)
+        assert torch.allclose(int8(ids).logits, reference, atol=0.05)
+        assert torch.equal(cached(ids).logits, int8(ids).logits)
+
+    bf16 = load_with_precision(build, 'bfloat16', 'tiny-gpt2', str(tmp_path))
+    if bf16_supported():
+        # Autocast: pesos continuam em float32, ativações em bf16
+        assert bf16.transformer.h[0].mlp.c_fc.weight.dtype == torch.float32
+        with torch.no_grad():
+            assert bf16(ids).logits.dtype == torch.bfloat16
+
+
+def test_keyword_matcher_matches_substring_semantics():
+    import json
+    import random
+    from src.llm.model import KEYWORDS_PATH
+    from src.utils.matcher import KeywordMatcher
+
+    with open(KEYWORDS_PATH, encoding='utf-8') as f:
+        keywords = json.load(f)
+    matcher = KeywordMatcher(keywords)
+    assert matcher.categories('Como usar React Native?') == {'dsm', 'tech'}
+    assert matcher.categories('receita de bolo') == set()
+
+    rng = random.Random(0)
+    vocab = [w for words in keywords.values() for w in words] + ['bolo', 'de', 'pp', 'reac', 'as']
+    for _ in range(300):
+        text = ' '.join(rng.choice(vocab) for _ in range(rng.randint(0, 5))).upper()
+        expected = {c for c, words in keywords.items() if any(w in text.lower() for w in words)}
+        assert matcher.categories(text) == expected
+
+
+def test_scope_classifier_separates_corpus_topics(tmp_path, monkeypatch):
+    import numpy as np
+    from src.rag import scope as scope_module
+    from src.rag.scope import ScopeClassifier
+
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((3, 16)).astype('float32')
+    corpus = np.repeat(topics, 50, axis=0) + 0.1 * rng.standard_normal((150, 16)).astype('float32')
+    scope = ScopeClassifier.fit(corpus, n_topics=3)
+    scope.save(str(tmp_path / 'scope'))
+    loaded = ScopeClassifier.load(str(tmp_path / 'scope'))
+
+    on_topic = topics + 0.1 * rng.standard_normal(topics.shape).astype('float32')
+    off_topic = rng.standard_normal((3, 16)).astype('float32')
+    inside, _ = loaded.predict(np.vstack([on_topic, off_topic]))
+    assert list(inside) == [True] * 3 + [False] * 3
+
+    # Só as linhas vivas sorteadas são lidas do memmap (e convertidas para float32)
+    np.save(str(tmp_path / 'emb.npy'), np.vstack([corpus, off_topic]).astype('float16'))
+    mapped = np.load(str(tmp_path / 'emb.npy'), mmap_mode='r')
+    read = []
+
+    class Spy:
+        def __len__(self):
+            return len(mapped)
+
+        def __getitem__(self, rows):
+            read.append(np.asarray(rows))
+            return mapped[rows]
+
+    live = np.arange(150)
+    monkeypatch.setattr(scope_module, 'FIT_SAMPLE_SIZE', 60)
+    sampled = ScopeClassifier.fit(Spy(), n_topics=3, rows=live)
+    assert len(read) == 1 and len(read[0]) == 60 and set(read[0]) <= set(live)
+    assert list(sampled.predict(np.vstack([on_topic, off_topic]))[0]) == [True] * 3 + [False] * 3
+
+
+def test_rag_request_prompt_roundtrip():
+    from src.rag.request import RAGRequest, RetrievedChunk, Turn
+
+    request = RAGRequest(
+        question="Como usar Detox?",
+        chunks=[RetrievedChunk(7, "Detox faz testes E2E em React Native.", 0.9),
+                RetrievedChunk(2, "Appium testa apps nativos.", 0.5)],
+        history=[Turn("O que é Flutter?", "Um framework do Google.")],
+    )
+    parsed = RAGRequest.from_prompt(request.render_prompt())
+    assert parsed.question == request.question
+    assert parsed.contexts == request.contexts
+    assert parsed.history == request.history
+    assert request.chunk_ids == (7, 2)
+
+
+def test_precomputed_clean_context_matches_on_the_fly():
+    from src.rag.request import RAGRequest, RetrievedChunk
+    from src.utils.preprocessing import clean_chunk_fields
+
+    texts = ["TESTES PARA APLICAÇÕES MOBILE:\n- Detox roda testes E2E em React Native\n===",
+             "CLEAN ARCHITECTURE:\nSepara domínio, dados e apresentação em camadas.",
+             "Curto"]
+    fields, columns = clean_chunk_fields(texts)
+    assert list(columns['clean_len']) == [len(c) for c in fields['clean']]
+
+    raw = RAGRequest("teste", [RetrievedChunk(i, t, 0.0) for i, t in enumerate(texts)])
+    stored = RAGRequest("teste", [RetrievedChunk(i, t, 0.0, clean=c, clean_rag=r) for i, (t, c, r)
+                                  in enumerate(zip(texts, fields['clean'], fields['clean_rag']))])
+    for min_chars in (25, 30):
+        assert stored.clean_contexts(min_chars) == raw.clean_contexts(min_chars)
+        assert stored.clean_rag_contexts(min_chars) == raw.clean_rag_contexts(min_chars)
+    # Títulos somem na limpeza de fallback; prefixos de lista nas duas
+    assert raw.clean_rag_contexts(30) == ["Detox roda testes E2E em React Native",
+                                          "Separa domínio, dados e apresentação em camadas."]
+
+
+def test_answer_cache_tiers_ttl_and_invalidation(tmp_path):
+    from src.llm.answer_cache import AnswerCache, answer_key
+    from src.rag.request import RAGRequest, RetrievedChunk
+
+    db = str(tmp_path / 'answers.sqlite')
+    request = RAGRequest("Como usar  Detox?", [RetrievedChunk(3, "Detox", 1.0)])
+    key = answer_key(request, "gpt", {'seed': 0})
+    assert key == answer_key(RAGRequest("como usar detox?", [RetrievedChunk(3, "x", 0.2)]), "gpt", {'seed': 0})
+    assert key != answer_key(RAGRequest("como usar detox?", [RetrievedChunk(4, "Detox", 1.0)]), "gpt", {'seed': 0})
+
+    cache = AnswerCache(db, fingerprint='v1', max_entries=1)
+    cache.put(key, "resposta")
+    cache.put('outra', "x")  # tira `key` da memória, mas não do disco
+    assert cache.get(key) == "resposta" and cache.disk_hits == 1
+    assert cache.get(key) == "resposta" and cache.memory_hits == 1
+    cache.close()
+
+    assert AnswerCache(db, fingerprint='v1').get(key) == "resposta"
+    assert AnswerCache(db, fingerprint='v2').get(key) is None
+    assert AnswerCache(db, fingerprint='v1').get(key) is None
+
+    expiring = AnswerCache(ttl_seconds=0)
+    expiring.put(key, "resposta")
+    time.sleep(0.01)
+    assert expiring.get(key) is None
+
+    capped = AnswerCache(str(tmp_path / 'capped.sqlite'), max_entries=1, max_disk_entries=2)
+    for i in range(3):
+        capped.put(str(i), "x")
+    capped.put('2', "y")
+    assert capped.stats()['disk_entries'] == 2 and capped.get('0') is None and capped.get('1') == "x"
+
+
+def test_semantic_cache_requires_similar_query_and_same_chunks():
+    import numpy as np
+    from src.llm.semantic_cache import SemanticAnswerCache
+
+    rng = np.random.default_rng(0)
+    q1, q2 = rng.standard_normal((2, 8)).astype('float32')
+    cache = SemanticAnswerCache(threshold=0.95, capacity=2)
+    cache.put(q1, (3, 1), 'gen', "React Native usa JavaScript; Flutter usa Dart.")
+
+    paraphrase = q1 + 0.01 * rng.standard_normal(8).astype('float32')
+    assert cache.get(paraphrase, (3, 1), 'gen') == "React Native usa JavaScript; Flutter usa Dart."
+    assert cache.get(paraphrase, (3, 2), 'gen') is None and cache.false_hits == 1
+    assert cache.get(paraphrase, (3, 1), 'outro') is None
+    assert cache.get(q2, (3, 1), 'gen') is None
+
+    cache.put(q2, (5,), 'gen', "b")
+    cache.get(q1, (3, 1), 'gen')
+    cache.put(-q1, (6,), 'gen', "c")  # sai q2, usado há mais tempo
+    assert cache.get(q2, (5,), 'gen') is None and cache.get(q1, (3, 1), 'gen') is not None
+    assert cache.evictions == 1 and len(cache) == 2
+
+
+def test_micro_batch_scheduler_groups_concurrent_requests():
+    import threading
+    from src.api.scheduler import MicroBatchScheduler
+
+    sizes = []
+
+    def process(items):
+        sizes.append(len(items))
+        if 'erro' in items:
+            raise ValueError('falhou')
+        return [x.upper() for x in items]
+
+    scheduler = MicroBatchScheduler(process, max_batch_size=4, max_wait_ms=200)
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.update({i: scheduler(f'q{i}')})) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: f'Q{i}' for i in range(6)}
+    assert max(sizes) == 4 and sum(sizes) == 6
+
+    try:
+        scheduler('erro')
+        assert False
+    except ValueError:
+        pass
+    scheduler.close()
+    assert scheduler.stats()['items'] == 7
+
+
+def _save_tiny_gpt(path):
+    """GPT-2 minúsculo com vocabulário de bytes, sem downloads."""
+    import json
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel, GPT2Tokenizer
+    from transformers.convert_slow_tokenizer import bytes_to_unicode
+
+    vocab = {c: i for i, c in enumerate(bytes_to_unicode().values())}
+    vocab['<|endoftext|>'] = len(vocab)
+    (path / 'vocab.json').write_text(json.dumps(vocab))
+    (path / 'merges.txt').write_text('#version: 0.2\n')
+    GPT2Tokenizer(str(path / 'vocab.json'), str(path / 'merges.txt')).save_pretrained(str(path))
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(vocab), n_positions=256, n_embd=32, n_layer=2, n_head=2,
+                        bos_token_id=256, eos_token_id=256)
+    GPT2LMHeadModel(config).save_pretrained(str(path))
+    return str(path)
+
+
+def test_generate_batch_matches_single_calls(tmp_path, monkeypatch):
+    from src.llm import model as model_module
+    from src.rag.request import RAGRequest, RetrievedChunk
+
+    _save_tiny_gpt(tmp_path)
+    monkeypatch.setitem(model_module.GENERATION_PARAMS, 'do_sample', False)
+    monkeypatch.setitem(model_module.GENERATION_PARAMS, 'num_beams', 1)
+    llm = model_module.HuggingFaceLLM(str(tmp_path))
+    requests = [
+        RAGRequest("Como testar com Detox?", [RetrievedChunk(1, "Detox executa testes E2E em React Native.", 1.0)]),
+        RAGRequest("O que é Flutter?"),
+        RAGRequest("receita de bolo"),
+    ]
+    single = [llm._try_dialogpt_generation([r], 12)[0] for r in requests]
+    assert llm._try_dialogpt_generation(requests, 12) == single
+    assert llm.generate_batch(requests, 12) == [llm.generate(r, 12) for r in requests]
+    assert llm.generate_batch(requests, 12)[2] == llm._get_scope_warning()
+
+
+def test_generate_stream_matches_generate_and_falls_back(tmp_path, monkeypatch):
+    from src.llm import model as model_module
+    from src.rag.request import RAGRequest, RetrievedChunk
+
+    llm = model_module.HuggingFaceLLM(_save_tiny_gpt(tmp_path))
+    request = RAGRequest("Como testar com Detox?", [RetrievedChunk(1, "Detox executa testes E2E em React Native.", 1.0)])
+    monkeypatch.setattr(llm, '_is_valid_response', lambda response: True)
+    stream = llm.generate_stream(request, 40, decoding='greedy')
+    pieces = list(stream)
+    assert ''.join(pieces) == stream.text and stream.ttft_seconds <= stream.total_seconds
+    for name, value in model_module.STREAM_DECODERS['greedy'].items():
+        monkeypatch.setitem(model_module.GENERATION_PARAMS, name, value)
+    assert stream.text == llm.generate(request, 40)
+
+    monkeypatch.setattr(llm, '_is_valid_response', lambda response: False)
+    stream = llm.generate_stream(request, 40, decoding='greedy')
+    assert list(stream) == [llm._get_rag_pure_response(request)] and stream.fallback
+
+
+def test_session_kv_cache_reuses_prefix_without_changing_answers(tmp_path, monkeypatch):
+    import copy
+    from src.llm import model as model_module
+    from src.llm.session_cache import SessionEntry, SessionKVCache
+    from src.rag.request import RAGRequest, RetrievedChunk, Turn
+
+    path = _save_tiny_gpt(tmp_path)
+    cached = model_module.HuggingFaceLLM(path, session_cache=SessionKVCache())
+    fresh = model_module.HuggingFaceLLM(path, session_cache=SessionKVCache())
+    for llm in (cached, fresh):
+        monkeypatch.setattr(llm, '_is_valid_response', lambda response: True)
+
+    history = []
+    for i, question in enumerate(["Como testar com Detox?", "E no Flutter?", "Como usar Fastlane?"]):
+        request = RAGRequest(question, [RetrievedChunk(i, f"Contexto {i} sobre testes mobile.", 1.0)], list(history))
+        # Mesmo estado de sessão, mas sem KV cache: o prompt inteiro é processado
+        entry = cached.session_cache._entries.get('s')
+        if entry is not None:
+            fresh.session_cache.put('s', SessionEntry([], copy.deepcopy(entry.past), entry.window_start,
+                                                      dict(entry.turns)))
+        answer = ''.join(cached.generate_stream(request, 20, in_scope=True, decoding='greedy', session_id='s'))
+        assert answer == ''.join(fresh.generate_stream(request, 20, in_scope=True, decoding='greedy', session_id='s'))
+        history.append(Turn(question, answer))
+    assert cached.session_cache.reused_tokens > 0 and fresh.session_cache.reused_tokens == 0
+
+    # Sessões não fazem beam search; o padrão do LLM vale quando o pedido não escolhe
+    try:
+        cached.generate(request, 20, in_scope=True, session_id='s', decoding='beam')
+        assert False
+    except ValueError:
+        pass
+    assert cached._stream_decoding(None) == 'sample'
+    cached.decoding = 'greedy'
+    assert cached._stream_decoding(None) == 'greedy'
+
+    # Limite total: a sessão usada há mais tempo sai
+    small = SessionKVCache(max_bytes=cached.session_cache._entries['s'].nbytes)
+    small.put('a', copy.deepcopy(cached.session_cache._entries['s']))
+    small.put('b', copy.deepcopy(cached.session_cache._entries['s']))
+    assert small.take('a') is None and small.take('b') is not None and small.evictions == 1
+
+
+def test_static_prefix_kv_cache_keeps_answers(tmp_path, monkeypatch):
+    from src.llm import model as model_module
+    from src.rag.request import RAGRequest, RetrievedChunk
+
+    path = _save_tiny_gpt(tmp_path)
+    monkeypatch.setitem(model_module.GENERATION_PARAMS, 'do_sample', False)
+    seeded = model_module.HuggingFaceLLM(path)
+    plain = model_module.HuggingFaceLLM(path, static_prefixes=())
+    requests = [
+        RAGRequest("Como testar com Detox?", [RetrievedChunk(1, "Detox executa testes E2E em React Native.", 1.0)]),
+        RAGRequest("O que é Flutter?"),
+    ]
+    # Beam search (2 feixes): o cache do prefixo é repetido por feixe
+    for request in requests:
+        assert seeded._try_dialogpt_generation([request], 12) == plain._try_dialogpt_generation([request], 12)
+        assert (list(seeded.generate_stream(request, 12, in_scope=True, decoding='greedy'))
+                == list(plain.generate_stream(request, 12, in_scope=True, decoding='greedy')))
+    assert seeded.prefix_cache.hits == 4 and plain.prefix_cache.stats()['prefixes'] == 0
+
+
+def test_deadline_stops_generation_and_falls_back(tmp_path, monkeypatch):
+    from src.llm import model as model_module
+    from src.rag.request import RAGRequest, RetrievedChunk
+    from src.utils.deadline import Deadline
+
+    class StepDeadline(Deadline):
+        """Expira depois de ``steps`` consultas, sem depender do relógio."""
+        def __init__(self, steps):
+            super().__init__(60)
+            self.steps = steps
+
+        @property
+        def expired(self):
+            self.steps -= 1
+            return self.steps < 0
+
+    monkeypatch.setitem(model_module.GENERATION_PARAMS, 'do_sample', False)
+    llm = model_module.HuggingFaceLLM(_save_tiny_gpt(tmp_path))
+    monkeypatch.setattr(llm, '_is_valid_response', lambda response: True)
+    context = [RetrievedChunk(1, "Detox executa testes E2E em React Native.", 1.0)]
+    fallback = llm._get_rag_pure_response(RAGRequest("Como testar com Detox?", context))
+
+    # Só a linha com prazo é cortada; a outra termina como sem prazo
+    plain = llm.generate_batch([RAGRequest("Como testar com Detox?", context)] * 2, 40, in_scope=[True, True])
+    cut = llm.generate_batch([RAGRequest("Como testar com Detox?", context, deadline=StepDeadline(5)),
+                              RAGRequest("Como testar com Detox?", context)], 40, in_scope=[True, True])
+    assert cut == [fallback, plain[1]]
+
+    stream = llm.generate_stream(RAGRequest("Como testar com Detox?", context, deadline=StepDeadline(3)), 40,
+                                 in_scope=True, decoding='greedy')
+    assert list(stream) == [fallback] and stream.timed_out and stream.fallback
+
+    try:
+        llm.generate("Como testar com Detox?", decoding='contrastive')
+        assert False
+    except ValueError:
+        pass
+
+
+def test_answer_cache_skips_fallbacks_and_model_load(tmp_path, monkeypatch):
+    from src.llm import model as model_module
+    from src.llm.answer_cache import AnswerCache, answer_key
+    from src.rag.request import RAGRequest, RetrievedChunk
+
+    request = RAGRequest("Como testar com Detox?", [RetrievedChunk(1, "Detox executa testes E2E em React Native.", 1.0)])
+    llm = model_module.HuggingFaceLLM(_save_tiny_gpt(tmp_path), answer_cache=AnswerCache())
+    monkeypatch.setattr(llm, '_try_dialogpt_generation', lambda requests, *args: [None] * len(requests))
+    assert llm.generate(request, in_scope=True) == llm._get_rag_pure_response(request)
+    assert llm.answer_cache.stats()['entries'] == 0
+
+    # Acerto de cache sem carregar o modelo
+    lazy = model_module.HuggingFaceLLM(str(tmp_path / 'inexistente'), answer_cache=AnswerCache())
+    lazy.answer_cache.put(answer_key(request, lazy.model_name, lazy._generation_key_params(200)), "resposta")
+    assert lazy.generate(request, in_scope=True) == "resposta" and not lazy.loaded
+
+
+def test_concurrent_streams_keep_seeded_answers(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from src.llm import model as model_module
+    from src.rag.request import RAGRequest, RetrievedChunk
+
+    llm = model_module.HuggingFaceLLM(_save_tiny_gpt(tmp_path), seed=0)
+    monkeypatch.setattr(llm, '_is_valid_response', lambda response: True)
+    request = RAGRequest("Como testar com Detox?", [RetrievedChunk(1, "Detox executa testes E2E em React Native.", 1.0)])
+    expected = ''.join(llm.generate_stream(request, 30, in_scope=True, decoding='sample'))
+    with ThreadPoolExecutor(4) as pool:
+        answers = list(pool.map(lambda _: ''.join(llm.generate_stream(request, 30, in_scope=True, decoding='sample')),
+                                range(8)))
+    assert answers == [expected] * 8
+
+
+class _StubRetriever:
+    def embed_queries(self, questions):
+        import numpy as np
+        return np.ones((len(questions), 4), dtype='float32')
+
+    def in_scope(self, embedding):
+        return False, 0.0
+
+    def retrieve_chunks_batch(self, questions, top_k=3, embeddings=None):
+        from src.rag.request import RetrievedChunk
+        return [[RetrievedChunk(i, f"Contexto de {q}", 1.0)] for i, q in enumerate(questions)]
+
+
+class _StubLLM:
+    answer_cache = semantic_cache = session_cache = None
+    loaded = False
+
+    def __init__(self):
+        self.batches = []
+
+    def is_dsm_question(self, question):
+        return 'bolo' not in question
+
+    def generate_batch(self, requests, in_scope=None, embeddings=None, decoding=None):
+        self.batches.append((decoding, [r.question for r in requests]))
+        return [f"{decoding}: {r.question}" if ok else "fora" for r, ok in zip(requests, in_scope)]
+
+    def generate(self, request, in_scope=None, embedding=None, session_id=None, decoding=None):
+        return f"sessão {session_id}: {len(request.history)} turnos"
+
+
+def test_chat_service_batches_by_decoding_and_carries_deadline():
+    from src.api.service import ChatItem, ChatService
+    from src.rag.request import Turn
+
+    llm = _StubLLM()
+    service = ChatService(_StubRetriever(), llm, max_history=1, budget_ms=1000)
+    history = [Turn("a", "b"), Turn("c", "d")]
+    results = service.answer_batch([ChatItem("Flutter?", history), ChatItem("receita de bolo"),
+                                    ChatItem("Detox?", decoding='greedy'), ChatItem("Ionic?", history, 's')])
+    assert [r.answer for r in results] == ["None: Flutter?", "fora", "greedy: Detox?", "sessão s: 2 turnos"]
+    assert llm.batches == [(None, ["Flutter?", "receita de bolo"]), ('greedy', ["Detox?"])]
+    assert results[1].chunk_ids == () and results[0].chunk_ids == (0,) and not results[0].timed_out
+
+    requests, _, _ = service.prepare_batch([ChatItem("Flutter?", history)])
+    assert requests[0].history == history[-1:] and requests[0].deadline.budget_seconds == 1.0
+
+
+def test_chat_api_validates_and_reports_errors(monkeypatch):
+    from src.api import server as server_module
+    from src.api.service import ChatResult, ChatService
+
+    service = ChatService(_StubRetriever(), _StubLLM(), budget_ms=500)
+    client = server_module.create_app(service).test_client()
+    response = client.post('/chat', json={'question': 'Flutter?', 'budget_ms': 250})
+    assert response.status_code == 200
+    assert set(response.json) == {'answer', 'in_scope', 'chunk_ids', 'timed_out', 'latency_ms'}
+    assert response.json['chunk_ids'] == [0]
+
+    for body in ({}, {'question': 'x', 'history': [{'user': 'a'}]}, {'question': 'x', 'budget_ms': -1},
+                 {'question': 'x', 'decoding': 'contrastive'}, {'question': 'x', 'session_id': 's', 'decoding': 'beam'}):
+        response = client.post('/chat', json=body)
+        assert response.status_code == 400 and 'error' in response.json
+    stats = client.get('/stats').json
+    assert stats['scheduler']['items'] == 1 and stats['prefix_cache'] is None
+
+    def failing(items):
+        raise RuntimeError('falhou')
+    monkeypatch.setattr(service, 'answer_batch', failing)
+    client = server_module.create_app(service).test_client()
+    response = client.post('/chat', json={'question': 'Flutter?'})
+    assert response.status_code == 500 and 'error' in response.json
+
+    monkeypatch.setattr(server_module, 'REQUEST_TIMEOUT_SECONDS', 0.01)
+    monkeypatch.setattr(service, 'answer_batch', lambda items: time.sleep(0.2) or [ChatResult('x', True)] * len(items))
+    client = server_module.create_app(service).test_client()
+    assert client.post('/chat', json={'question': 'Flutter?'}).status_code == 504